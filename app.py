@@ -1,32 +1,52 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
 import os
 import io
-import requests
-import shutil
 import re
+import sqlite3
+import threading
+import time
+import atexit
+import hashlib
+import glob
+import copy
+import tempfile
+import importlib.util
+import uuid
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from collections import deque
 from base64 import b64decode
-from difflib import get_close_matches
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, wraps
+from types import MappingProxyType
+
+# المكتبات الثقيلة (OpenCV/Tesseract، PyGithub) لا تُستورد عند بدء التشغيل؛ نتحقق فقط من وجودها
+# ونستوردها عند أول استخدام، فلا يدفع المستخدم الذي يرى الإحصائيات فقط كلفتها.
+def _module_available(*names):
+    return all(importlib.util.find_spec(name) is not None for name in names)
 
 # GitHub
-try:
-    from github import Github
-    GITHUB_AVAILABLE = True
-except ImportError:
-    GITHUB_AVAILABLE = False
-
-# OCR
-try:
-    import pytesseract
-    from PIL import Image
-    import cv2
-    import numpy as np
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
-    # لا نستخدم st.warning هنا لأنها قد تظهر قبل إعداد الصفحة
+GITHUB_AVAILABLE = _module_available("github")
+
+# OCR (ocr_pipeline يستورد pytesseract و cv2 و PIL)
+OCR_AVAILABLE = _module_available("pytesseract", "cv2", "PIL")
+
+# Parquet (كاش جانبي للقراءة السريعة)
+PARQUET_AVAILABLE = _module_available("pyarrow")
+
+# إطار السجلات مشترك بين كل الجلسات بدون نسخ، ويعتمد ذلك على Copy-on-Write:
+# أي تعديل على النسخة السطحية يُنسخ عندها فقط ولا يصل إلى الإطار المخزن،
+# والمصفوفات من to_numpy() للقراءة فقط. مفعّل دائماً منذ pandas 3.0.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+def ocr_pipeline():
+    """وحدة ocr_pipeline، تُستورد عند أول حاجة فقط"""
+    import ocr_pipeline
+    return ocr_pipeline
 
 # ===============================
 # إعدادات التطبيق
@@ -38,7 +58,25 @@ APP_CONFIG = {
     "BRANCH": "main",
     "FILE_PATH": "luva.xlsx",
     "LOCAL_FILE": "luva.xlsx",
+    "DB_FILE": "luva.db",
+    "SNAPSHOT_EVERY_RECORDS": 50,
+    "SNAPSHOT_INTERVAL_MINUTES": 10,
+    "GITHUB_PUSH_DEBOUNCE_SECONDS": 5,
+    "GITHUB_PUSH_MAX_DELAY_SECONDS": 30,
+    "SHARDS_DIR": "data",
+    "PARSE_CHUNK_ROWS": 5000,
+    "EDITOR_PAGE_ROWS": 200,
+    "HISTORY_PAGE_ROWS": 100,
+    "EXPORT_CHUNK_ROWS": 50000,
+    "EXPORT_FILE_MAX_AGE_HOURS": 6,
+    "METRICS_ENABLED": True,
+    "METRICS_RERUN_HISTORY": 50,
+    "METRICS_EXPORT_INTERVAL_SECONDS": 60,
+    "METRICS_JSONL_FILE": "metrics.jsonl",
+    "METRICS_JSONL_MAX_BYTES": 5 * 1024 * 1024,
+    "METRICS_PROM_FILE": "metrics.prom",
     "MAX_ACTIVE_USERS": 5,
+    "USERS_RELOAD_CHECK_SECONDS": 2,
     "SESSION_DURATION_MINUTES": 11,
     "SHIFTS": {
         "الاولي": {"start": 8, "end": 16},
@@ -48,14 +86,181 @@ APP_CONFIG = {
 }
 
 USERS_FILE = "users.json"
-STATE_FILE = "state.json"
 SESSION_DURATION = timedelta(minutes=APP_CONFIG["SESSION_DURATION_MINUTES"])
 MAX_ACTIVE_USERS = APP_CONFIG["MAX_ACTIVE_USERS"]
+COTTON_COLUMNS = ['التاريخ', 'الوقت', 'الوردية', 'المشرف', 'نوع البالة', 'وزن البالة', 'ملاحظات']
+# أسماء أعمدة جدول السجلات في قاعدة البيانات المحلية
+DB_COLUMNS = {
+    'التاريخ': 'date',
+    'الوقت': 'time',
+    'الوردية': 'shift',
+    'المشرف': 'supervisor',
+    'نوع البالة': 'bale_type',
+    'وزن البالة': 'weight',
+    'ملاحظات': 'notes'
+}
 GITHUB_EXCEL_URL = f"https://github.com/{APP_CONFIG['REPO_NAME'].split('/')[0]}/{APP_CONFIG['REPO_NAME'].split('/')[1]}/raw/{APP_CONFIG['BRANCH']}/{APP_CONFIG['FILE_PATH']}"
 
+# ---------- القياس (زمن كل مرحلة، عدد الاستدعاءات، البايتات، إصابات الكاش) ----------
+# التسجيل مشترك لكل العملية (st.cache_resource). عند تعطيل METRICS_ENABLED يعيد
+# instrumented الدالة كما هي وقت التعريف، فلا تبقى أي كلفة إضافية.
+METRICS_ENABLED = APP_CONFIG["METRICS_ENABLED"]
+_trace_local = threading.local()
+
+@st.cache_resource(show_spinner=False)
+def _metrics_registry():
+    return {"lock": threading.Lock(), "timers": {}, "counters": {},
+            "reruns": deque(maxlen=APP_CONFIG["METRICS_RERUN_HISTORY"]),
+            "started": time.time(), "last_export": 0.0}
+
+def _record_timing(name, seconds, failed):
+    registry = _metrics_registry()
+    with registry["lock"]:
+        timer = registry["timers"].get(name)
+        if timer is None:
+            timer = registry["timers"][name] = {"count": 0, "total": 0.0, "max": 0.0, "errors": 0}
+        timer["count"] += 1
+        timer["total"] += seconds
+        timer["max"] = max(timer["max"], seconds)
+        timer["errors"] += failed
+
+@contextmanager
+def metric_phase(name):
+    """قياس زمن كتلة كود باسم name"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    trace = getattr(_trace_local, "trace", None)
+    if trace is not None:
+        # المرحلة تُسجل في ترتيب بدايتها (الأب قبل أبنائه) ويُملأ زمنها عند انتهائها
+        index = len(trace["phases"])
+        trace["phases"].append((name, trace["depth"], 0.0))
+        trace["depth"] += 1
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        if trace is not None:
+            trace["depth"] -= 1
+            trace["phases"][index] = (name, trace["depth"], seconds * 1000)
+        _record_timing(name, seconds, failed)
+
+def instrumented(name=None):
+    """مزخرف لقياس زمن الدالة وعدد استدعاءاتها وأخطائها"""
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with metric_phase(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count_metric(name, value=1):
+    """زيادة عداد (بايتات مقروءة/مكتوبة، إصابة/إخفاق كاش...)"""
+    if not METRICS_ENABLED:
+        return
+    registry = _metrics_registry()
+    with registry["lock"]:
+        registry["counters"][name] = registry["counters"].get(name, 0) + value
+
+@contextmanager
+def rerun_trace():
+    """تجميع مراحل تشغيل واحد للواجهة (rerun) وحفظه في السجل"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    _trace_local.trace = {"phases": [], "depth": 0}
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace, _trace_local.trace = _trace_local.trace, None
+        registry = _metrics_registry()
+        with registry["lock"]:
+            registry["reruns"].append({
+                "at": datetime.now().isoformat(timespec="seconds"),
+                "user": st.session_state.get("username"),
+                "total_ms": (time.perf_counter() - start) * 1000,
+                "phases": trace["phases"],
+            })
+        count_metric("reruns")
+        maybe_export_metrics()
+
+def metrics_snapshot():
+    registry = _metrics_registry()
+    with registry["lock"]:
+        return {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "uptime_seconds": round(time.time() - registry["started"], 1),
+            "timers": {k: dict(v) for k, v in registry["timers"].items()},
+            "counters": dict(registry["counters"]),
+        }
+
+def metrics_to_prometheus(snapshot):
+    """نص بصيغة Prometheus (textfile collector)"""
+    lines = []
+
+    def family(metric, kind, values):
+        lines.append(f"# TYPE luva_{metric} {kind}")
+        for label, value in sorted(values.items()):
+            escaped = label.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'luva_{metric}{{name="{escaped}"}} {value}')
+
+    timers = snapshot["timers"]
+    family("calls_total", "counter", {k: v["count"] for k, v in timers.items()})
+    family("call_errors_total", "counter", {k: v["errors"] for k, v in timers.items()})
+    family("call_seconds_total", "counter", {k: round(v["total"], 6) for k, v in timers.items()})
+    family("call_seconds_max", "gauge", {k: round(v["max"], 6) for k, v in timers.items()})
+    family("events_total", "counter", snapshot["counters"])
+    lines.append("# TYPE luva_uptime_seconds gauge")
+    lines.append(f"luva_uptime_seconds {snapshot['uptime_seconds']}")
+    return "\n".join(lines) + "\n"
+
+def export_metrics():
+    """إلحاق لقطة JSON بملف METRICS_JSONL_FILE وكتابة METRICS_PROM_FILE (استبدال ذري).
+    عند تجاوز METRICS_JSONL_MAX_BYTES يُنقل الملف إلى .1 (نسخة واحدة تُستبدل) ويبدأ ملف جديد"""
+    snapshot = metrics_snapshot()
+    jsonl_path = APP_CONFIG["METRICS_JSONL_FILE"]
+    max_bytes = APP_CONFIG["METRICS_JSONL_MAX_BYTES"]
+    if max_bytes and os.path.exists(jsonl_path) and os.path.getsize(jsonl_path) >= max_bytes:
+        os.replace(jsonl_path, jsonl_path + ".1")
+    with open(jsonl_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(snapshot, ensure_ascii=False) + "\n")
+    tmp_path = APP_CONFIG["METRICS_PROM_FILE"] + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics_to_prometheus(snapshot))
+    os.replace(tmp_path, APP_CONFIG["METRICS_PROM_FILE"])
+    _metrics_registry()["last_export"] = time.time()
+    return snapshot
+
+def maybe_export_metrics():
+    interval = APP_CONFIG["METRICS_EXPORT_INTERVAL_SECONDS"]
+    if interval and time.time() - _metrics_registry()["last_export"] >= interval:
+        try:
+            export_metrics()
+        except OSError:
+            pass
+
+def reset_metrics():
+    registry = _metrics_registry()
+    with registry["lock"]:
+        registry["timers"].clear()
+        registry["counters"].clear()
+        registry["reruns"].clear()
+        registry["started"] = time.time()
+
 # ---------- دوال المستخدمين والجلسات (معدلة لدعم الصلاحيات المتقدمة) ----------
-def load_users():
-    """تحميل المستخدمين مع دعم الصلاحيات المتقدمة (متوافق مع بنية الأقسام)"""
+def _read_users_file():
+    """قراءة users.json وتوحيد بنيته (أو إنشاؤه بالمستخدمين الافتراضيين)"""
     if not os.path.exists(USERS_FILE):
         default_users = {
             "admin": {
@@ -105,116 +310,196 @@ def load_users():
                       "permissions": {"all_sections": True}, "sections_permissions": {}}
         }
 
+def _freeze_user(info):
+    """صلاحيات المستخدم الفعلية محسوبة مسبقاً في قاموس غير قابل للتعديل"""
+    role = info.get("role", "viewer")
+    perms = info.get("permissions", {})
+    return MappingProxyType({
+        "role": role,
+        "is_admin": role == "admin",
+        "all_sections": perms.get("all_sections", False) if isinstance(perms, dict) else "all" in perms,
+        "sections_permissions": MappingProxyType(dict(info.get("sections_permissions", {}))),
+        "permissions": MappingProxyType(dict(perms) if isinstance(perms, dict) else {"all_sections": "all" in perms}),
+        **_effective_permissions(role, perms),
+    })
+
+@st.cache_resource(show_spinner=False)
+def _users_directory():
+    """دليل المستخدمين المشترك لكل العملية؛ يُعاد تحميله فقط عند تغير users.json"""
+    return {"lock": threading.Lock(), "stamp": None, "checked_at": 0.0,
+            "users": {}, "entries": MappingProxyType({})}
+
+def _users_file_stamp():
+    try:
+        stat = os.stat(USERS_FILE)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+@instrumented("users.directory")
+def get_users_directory(force=False):
+    """(المستخدمون الخام للقراءة فقط، جدول الصلاحيات المجمد).
+    يُفحص تاريخ تعديل الملف مرة كل USERS_RELOAD_CHECK_SECONDS على الأكثر"""
+    directory = _users_directory()
+    with directory["lock"]:
+        now = time.monotonic()
+        if force or directory["stamp"] is None or now - directory["checked_at"] >= APP_CONFIG["USERS_RELOAD_CHECK_SECONDS"]:
+            directory["checked_at"] = now
+            stamp = _users_file_stamp()
+            if force or stamp is None or stamp != directory["stamp"]:
+                count_metric("users.reload")
+                users = _read_users_file()
+                directory["users"] = users
+                directory["entries"] = MappingProxyType({u: _freeze_user(info) for u, info in users.items()})
+                directory["stamp"] = _users_file_stamp()
+        return directory["users"], directory["entries"]
+
+def get_user_entry(username):
+    return get_users_directory()[1].get(username)
+
+def load_users():
+    """نسخة قابلة للتعديل من المستخدمين (لشاشة الإدارة)؛ للقراءة استخدم get_users_directory"""
+    return copy.deepcopy(get_users_directory()[0])
+
 def save_users(users):
     """حفظ المستخدمين ورفعهم إلى GitHub إن أمكن"""
     try:
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
+        tmp_path = USERS_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(users, f, indent=4, ensure_ascii=False)
-        # رفع إلى GitHub إذا كان التوكن متوفراً
-        token = st.secrets.get("github", {}).get("token", None)
-        if token and GITHUB_AVAILABLE:
-            try:
-                g = Github(token)
-                repo = g.get_repo(APP_CONFIG["REPO_NAME"])
-                with open(USERS_FILE, "r", encoding="utf-8") as f:
-                    content = f.read()
-                try:
-                    contents = repo.get_contents(USERS_FILE, ref=APP_CONFIG["BRANCH"])
-                    repo.update_file(USERS_FILE, "تحديث المستخدمين", content, contents.sha, branch=APP_CONFIG["BRANCH"])
-                except:
-                    repo.create_file(USERS_FILE, "إنشاء ملف المستخدمين", content, branch=APP_CONFIG["BRANCH"])
-            except:
-                pass
+        os.replace(tmp_path, USERS_FILE)
+        get_users_directory(force=True)
+        # رفع إلى GitHub إذا كان التوكن متوفراً (في الخلفية)
+        sync = get_github_sync()
+        if sync:
+            with open(USERS_FILE, "rb") as f:
+                sync.enqueue(USERS_FILE, f.read(), "تحديث المستخدمين")
         return True
     except Exception as e:
         st.error(f"خطأ في حفظ users.json: {e}")
         return False
 
-def load_state():
-    if not os.path.exists(STATE_FILE):
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump({}, f, indent=4, ensure_ascii=False)
-        return {}
+# سجل الجلسات في قاعدة البيانات المحلية: صف لكل دخول بمعرّف عشوائي (token) يُحفظ في جلسة المتصفح،
+# فدخول المدير من متصفح ثانٍ لا يُخرج الأول. الجلسة المنتهية تُستبعد بمقارنة وقت الدخول، وتُحذف عند دخول جديد.
+@st.cache_resource(show_spinner=False)
+def _sessions_table_ready(db_file):
+    with sqlite3.connect(db_file, timeout=30) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(user_sessions)")]
+        if columns and "token" not in columns:
+            # الجدول القديم كان مفتاحه اسم المستخدم: تُنقل جلساته بمعرّفات جديدة
+            conn.execute("ALTER TABLE user_sessions RENAME TO user_sessions_old")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_sessions (
+                token TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                login_time REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON user_sessions (username, login_time)")
+        if columns and "token" not in columns:
+            conn.execute("INSERT INTO user_sessions (token, username, login_time) "
+                         "SELECT lower(hex(randomblob(16))), username, login_time FROM user_sessions_old")
+            conn.execute("DROP TABLE user_sessions_old")
+    return True
+
+@contextmanager
+def sessions_db():
+    """اتصال بدون معاملة ضمنية؛ الكتابات تفتح BEGIN IMMEDIATE بنفسها"""
+    _sessions_table_ready(APP_CONFIG["DB_FILE"])
+    conn = sqlite3.connect(APP_CONFIG["DB_FILE"], timeout=30, isolation_level=None)
     try:
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {}
+        yield conn
+    finally:
+        conn.close()
 
-def save_state(state):
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, indent=4, ensure_ascii=False)
+def _session_cutoff():
+    return time.time() - SESSION_DURATION.total_seconds()
 
-def cleanup_sessions(state):
-    now = datetime.now()
-    changed = False
-    for user, info in list(state.items()):
-        if info.get("active") and "login_time" in info:
-            try:
-                login_time = datetime.fromisoformat(info["login_time"])
-                if now - login_time > SESSION_DURATION:
-                    info["active"] = False
-                    info.pop("login_time", None)
-                    changed = True
-            except:
-                info["active"] = False
-                changed = True
-    if changed:
-        save_state(state)
-    return state
-
-def remaining_time(state, username):
-    if not username or username not in state:
-        return None
-    info = state.get(username)
-    if not info or not info.get("active"):
+@instrumented("sessions.lookup")
+def get_session_login_time(token):
+    """وقت دخول الجلسة (ثوانٍ) إذا كانت ما زالت نشطة، أو None"""
+    if not token:
         return None
-    try:
-        lt = datetime.fromisoformat(info["login_time"])
-        remaining = SESSION_DURATION - (datetime.now() - lt)
-        if remaining.total_seconds() <= 0:
-            return None
-        return remaining
-    except:
+    with sessions_db() as conn:
+        row = conn.execute("SELECT login_time FROM user_sessions WHERE token = ? AND login_time > ?",
+                           (token, _session_cutoff())).fetchone()
+    return row[0] if row else None
+
+def count_active_sessions():
+    """عدد المستخدمين المتصلين (المدير بعدة متصفحات يُحسب مرة واحدة)"""
+    with sessions_db() as conn:
+        return conn.execute("SELECT COUNT(DISTINCT username) FROM user_sessions WHERE login_time > ?",
+                            (_session_cutoff(),)).fetchone()[0]
+
+@instrumented("sessions.start")
+def start_session(username, enforce_limit=True):
+    """تسجيل جلسة جديدة في معاملة واحدة حتى لا يتجاوز دخولان متزامنان الحد الأقصى.
+    يعيد (معرّف الجلسة، None) أو (None، رسالة الخطأ)"""
+    with sessions_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cutoff = _session_cutoff()
+            if enforce_limit:
+                if conn.execute("SELECT 1 FROM user_sessions WHERE username = ? AND login_time > ?",
+                                (username, cutoff)).fetchone():
+                    conn.execute("ROLLBACK")
+                    return None, "هذا المستخدم مسجل دخول بالفعل"
+                active = conn.execute("SELECT COUNT(DISTINCT username) FROM user_sessions WHERE login_time > ?",
+                                      (cutoff,)).fetchone()[0]
+                if active >= MAX_ACTIVE_USERS:
+                    conn.execute("ROLLBACK")
+                    return None, "الحد الأقصى للمستخدمين المتصلين"
+            token = uuid.uuid4().hex
+            conn.execute("DELETE FROM user_sessions WHERE login_time <= ?", (cutoff,))
+            conn.execute("INSERT INTO user_sessions (token, username, login_time) VALUES (?, ?, ?)",
+                         (token, username, time.time()))
+            conn.execute("COMMIT")
+            return token, None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def end_session(token):
+    """إنهاء جلسة بعينها؛ جلسات المستخدم نفسه في متصفحات أخرى تبقى"""
+    with sessions_db() as conn:
+        conn.execute("DELETE FROM user_sessions WHERE token = ?", (token,))
+
+def remaining_time(token):
+    """الوقت المتبقي للجلسة؛ None إذا انتهت أو أُنهيت"""
+    login_time = get_session_login_time(token)
+    if login_time is None:
         return None
+    remaining = SESSION_DURATION - timedelta(seconds=time.time() - login_time)
+    return remaining if remaining.total_seconds() > 0 else None
 
 def logout_action():
-    state = load_state()
-    username = st.session_state.get("username")
-    if username and username in state:
-        state[username]["active"] = False
-        state[username].pop("login_time", None)
-        save_state(state)
+    token = st.session_state.get("session_token")
+    if token:
+        end_session(token)
+    discard_export_file(st.session_state.get('export_file'))
     for k in list(st.session_state.keys()):
         st.session_state.pop(k, None)
     st.rerun()
 
 def login_ui():
-    users = load_users()
-    state = cleanup_sessions(load_state())
+    users, _ = get_users_directory()
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
 
     st.title(f"{APP_CONFIG['APP_ICON']} تسجيل الدخول - {APP_CONFIG['APP_TITLE']}")
     username_input = st.selectbox("اختر المستخدم", list(users.keys()))
     password = st.text_input("كلمة المرور", type="password")
-    active_users = [u for u, v in state.items() if v.get("active")]
-    active_count = len(active_users)
-    st.caption(f"المستخدمون النشطون: {active_count}/{MAX_ACTIVE_USERS}")
+    st.caption(f"المستخدمون النشطون: {count_active_sessions()}/{MAX_ACTIVE_USERS}")
 
     if not st.session_state.logged_in:
         if st.button("تسجيل الدخول"):
             if username_input in users and users[username_input]["password"] == password:
-                if username_input == "admin":
-                    pass
-                elif username_input in active_users:
-                    st.warning("هذا المستخدم مسجل دخول بالفعل")
-                    return False
-                elif active_count >= MAX_ACTIVE_USERS:
-                    st.error("الحد الأقصى للمستخدمين المتصلين")
+                token, error = start_session(username_input, enforce_limit=username_input != "admin")
+                if error:
+                    st.error(error)
                     return False
-                state[username_input] = {"active": True, "login_time": datetime.now().isoformat()}
-                save_state(state)
+                st.session_state.session_token = token
                 st.session_state.logged_in = True
                 st.session_state.username = username_input
                 st.session_state.user_role = users[username_input].get("role", "viewer")
@@ -228,7 +513,7 @@ def login_ui():
         username = st.session_state.username
         role = st.session_state.user_role
         st.success(f"مسجل كـ {username} ({role})")
-        rem = remaining_time(state, username)
+        rem = remaining_time(st.session_state.get("session_token"))
         if rem:
             mins, secs = divmod(int(rem.total_seconds()), 60)
             st.info(f"الوقت المتبقي: {mins:02d}:{secs:02d}")
@@ -242,99 +527,1329 @@ def login_ui():
 # ---------- دوال الصلاحيات (للتطابق مع بنية الأقسام) ----------
 def get_user_permissions_dict(username):
     """إرجاع صلاحيات المستخدم (متوافق مع بنية الأقسام)"""
-    users = load_users()
-    if username not in users:
+    entry = get_user_entry(username)
+    if entry is None:
         return {"all_sections": False, "sections_permissions": {}}
-    user_data = users[username]
-    perms = user_data.get("permissions", {})
-    if isinstance(perms, list):
-        if "all" in perms:
-            perms = {"all_sections": True}
+    return {"all_sections": entry["all_sections"], "sections_permissions": entry["sections_permissions"]}
+
+@instrumented("users.is_admin")
+def is_admin(username):
+    if username == "admin":
+        return True
+    entry = get_user_entry(username)
+    return entry is not None and entry["is_admin"]
+
+# ---------- مزامنة GitHub ----------
+class GitHubSync:
+    """رفع الملفات إلى GitHub من عامل خلفي واحد لكل عملية.
+
+    يحتفظ بعميل واحد (واتصال مُعاد استخدامه) وبآخر SHA لكل ملف، ويدمج عمليات
+    الحفظ المتقاربة خلال debounce_seconds في commit واحد لكل ملف.
+    repo_factory تعيد كائناً يوفر get_contents/update_file/create_file
+    (مستودع PyGithub أو بديل محلي للاختبار).
+    الملفات التي فشل رفعها تعود إلى قائمة الانتظار وتُعاد محاولتها بتأخير متضاعف
+    (retry_seconds حتى max_retry_seconds).
+    إذا تغيّر الملف على GitHub من مكان آخر (أول رفع في العملية، أو SHA قديم) تُستدعى
+    merge(path, sha البعيد، دالة تنزيل محتواه) لتعيد المحتوى المدموج؛ None تعني الكتابة فوقه
+    (مثل نسخة Excel، فلا يُنزّل محتواها أصلاً).
+    """
+
+    def __init__(self, repo_factory, branch, debounce_seconds=5, max_delay_seconds=30, on_pushed=None,
+                 retry_seconds=5, max_retry_seconds=300, merge=None):
+        self._repo_factory = repo_factory
+        self._on_pushed = on_pushed
+        self._merge = merge
+        self._repo = None
+        self.branch = branch
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self._sha = {}
+        self._pending = {}
+        self._first_enqueue = None
+        self._last_enqueue = None
+        self._in_flight = False
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._failures = 0
+        self._retry_at = None
+        self._cond = threading.Condition()
+        self._worker = None
+        self.last_error = None
+        self.last_push = None
+
+    @property
+    def repo(self):
+        if self._repo is None:
+            self._repo = self._repo_factory()
+        return self._repo
+
+    def enqueue(self, path, content, message):
+        """جدولة رفع ملف؛ يُكتفى بأحدث محتوى لكل مسار خلال نافذة الدمج"""
+        with self._cond:
+            messages = self._pending.get(path, (None, []))[1]
+            self._pending[path] = (content, messages + [message])
+            now = time.monotonic()
+            if self._first_enqueue is None:
+                self._first_enqueue = now
+            self._last_enqueue = now
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="github-sync", daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending) + (1 if self._in_flight else 0)
+
+    def flush(self, timeout=None):
+        """رفع ما هو معلّق فوراً وانتظار انتهاء العامل"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._first_enqueue = self._last_enqueue = float("-inf") if self._pending else None
+            self._retry_at = None
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _due_at(self):
+        due = min(self._last_enqueue + self.debounce_seconds,
+                  self._first_enqueue + self.max_delay_seconds)
+        return due if self._retry_at is None else max(due, self._retry_at)
+
+    def _requeue(self, batch, pushed):
+        """إعادة ما لم يُرفع إلى الانتظار؛ المحتوى الأحدث المضاف أثناء الرفع يبقى هو المعتمد"""
+        now = time.monotonic()
+        for path, (content, messages) in batch.items():
+            if path in pushed:
+                continue
+            if path in self._pending:
+                content, newer = self._pending[path]
+                messages = messages + newer
+            self._pending[path] = (content, messages)
+        if self._pending and self._first_enqueue is None:
+            self._first_enqueue = self._last_enqueue = now
+        self._retry_at = now + min(self.max_retry_seconds, self.retry_seconds * 2 ** (self._failures - 1))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while self._pending and (wait := self._due_at() - time.monotonic()) > 0:
+                    self._cond.wait(wait)
+                batch, self._pending = self._pending, {}
+                self._first_enqueue = self._last_enqueue = None
+                self._in_flight = True
+            pushed = set()
+            try:
+                for path, (content, messages) in batch.items():
+                    self._push_file(path, content, _combine_commit_messages(messages))
+                    pushed.add(path)
+                self.last_error = None
+                self.last_push = datetime.now()
+                self._failures = 0
+                self._retry_at = None
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                count_metric("github.push_failures")
+                with self._cond:
+                    self._failures += 1
+                    self._requeue(batch, pushed)
+            finally:
+                with self._cond:
+                    self._in_flight = False
+                    self._cond.notify_all()
+
+    @instrumented("github.push_file")
+    def _push_file(self, path, content, message):
+        sha = self._sha.get(path)
+        if sha is None:
+            remote = self._remote_file(path)
+            sha = remote and remote.sha
+            content = self._merged(path, remote, content)
+        try:
+            result = self._write(path, message, content, sha)
+        except Exception as e:
+            # SHA قديم (تعديل من مكان آخر): ندمج مع النسخة البعيدة ونحاول مرة واحدة
+            if getattr(e, "status", None) not in (409, 422):
+                raise
+            remote = self._remote_file(path)
+            content = self._merged(path, remote, content)
+            result = self._write(path, message, content, remote and remote.sha)
+        count_metric("bytes_written.github", len(content))
+        self._sha[path] = result["content"].sha
+        if self._on_pushed:
+            self._on_pushed(path, self._sha[path])
+
+    def _write(self, path, message, content, sha):
+        if sha is None:
+            return self.repo.create_file(path, message, content, branch=self.branch)
+        return self.repo.update_file(path, message, content, sha, branch=self.branch)
+
+    def _merged(self, path, remote, content):
+        if remote is None or self._merge is None:
+            return content
+        merged = self._merge(path, remote.sha, lambda: b64decode(self.repo.get_git_blob(remote.sha).content))
+        return content if merged is None else merged
+
+    def _remote_file(self, path):
+        try:
+            return self.repo.get_contents(path, ref=self.branch)
+        except Exception as e:
+            if getattr(e, "status", None) == 404:
+                return None
+            raise
+
+def _combine_commit_messages(messages):
+    unique = list(dict.fromkeys(messages))
+    if len(unique) == 1:
+        return unique[0]
+    return f"{unique[-1]} (+{len(messages) - 1} عملية حفظ)"
+
+def get_github_token():
+    try:
+        return st.secrets.get("github", {}).get("token", None)
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def _create_github_sync(token):
+    from github import Github
+    client = Github(token)
+    sync = GitHubSync(
+        lambda: client.get_repo(APP_CONFIG["REPO_NAME"]),
+        APP_CONFIG["BRANCH"],
+        debounce_seconds=APP_CONFIG["GITHUB_PUSH_DEBOUNCE_SECONDS"],
+        max_delay_seconds=APP_CONFIG["GITHUB_PUSH_MAX_DELAY_SECONDS"],
+        on_pushed=_record_pushed_shard,
+        merge=merge_remote_shard
+    )
+    atexit.register(sync.flush, timeout=30)
+    return sync
+
+def get_github_sync():
+    """المزامن المشترك للعملية، أو None إذا لم يتوفر التوكن أو مكتبة PyGithub"""
+    token = get_github_token()
+    if not token or not GITHUB_AVAILABLE:
+        return None
+    return _create_github_sync(token)
+
+# ---------- مخزن السجلات المحلي (SQLite) ----------
+@contextmanager
+def cotton_db():
+    """اتصال بقاعدة السجلات المحلية (وضع WAL) مع إنشاء الجداول وترحيل luva.xlsx عند أول تشغيل"""
+    conn = sqlite3.connect(APP_CONFIG["DB_FILE"], timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cotton_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT, time TEXT, shift TEXT, supervisor TEXT,
+                bale_type TEXT, weight REAL, notes TEXT,
+                uid TEXT, updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cotton_date ON cotton_records (date);
+            CREATE INDEX IF NOT EXISTS idx_cotton_datetime ON cotton_records (date, IFNULL(time, ''), id);
+            CREATE TABLE IF NOT EXISTS cotton_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS cotton_rollup (
+                date TEXT NOT NULL, shift TEXT NOT NULL, supervisor TEXT NOT NULL, bale_type TEXT NOT NULL,
+                count INTEGER NOT NULL, total REAL NOT NULL, total_sq REAL NOT NULL,
+                min_weight REAL, max_weight REAL,
+                PRIMARY KEY (date, shift, supervisor, bale_type)
+            ) WITHOUT ROWID;
+        """)
+        with conn:
+            _migrate_record_keys(conn)
+            if get_meta(conn, "migrated") is None:
+                if os.path.exists(APP_CONFIG["LOCAL_FILE"]):
+                    import_excel_to_db(conn, APP_CONFIG["LOCAL_FILE"])
+                set_meta(conn, "migrated", datetime.now().isoformat())
+            if get_meta(conn, "rollup_built") is None:
+                rebuild_rollup(conn)
+                set_meta(conn, "rollup_built", datetime.now().isoformat())
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM cotton_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO cotton_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def bump_data_version(conn, rewrite=False):
+    """زيادة إصدار البيانات بعد كل كتابة؛ rewrite=True عند تعديل/حذف سجلات موجودة (يتطلب إعادة تحميل كاملة)"""
+    set_meta(conn, "data_version", int(get_meta(conn, "data_version", 0)) + 1)
+    if rewrite:
+        set_meta(conn, "rewrite_version", int(get_meta(conn, "rewrite_version", 0)) + 1)
+
+def get_data_versions(conn):
+    rows = dict(conn.execute(
+        "SELECT key, value FROM cotton_meta WHERE key IN ('data_version', 'rewrite_version')"
+    ).fetchall())
+    return int(rows.get("data_version", 0)), int(rows.get("rewrite_version", 0))
+
+def _to_db_value(col, value):
+    """تحويل قيمة خلية إلى الصيغة المخزنة في قاعدة البيانات"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if col == 'التاريخ':
+        return pd.Timestamp(value).date().isoformat()
+    if col == 'الوقت':
+        if isinstance(value, timedelta):
+            # الإطار المحمّل يحمل الوقت كمدة (Timedelta)، و isoformat لها صيغة ISO 8601 ('P0DT9H30M0S')
+            return format_cotton_times(pd.Series([value]))[0]
+        return value.isoformat() if hasattr(value, "isoformat") else str(value)
+    if col == 'وزن البالة':
+        return float(value)
+    return str(value)
+
+# ---------- مفتاح السجل ----------
+# كل سجل يحمل uid ثابتاً بين نسخ التطبيق (يُرفع في الأجزاء الشهرية) و updated_at لآخر تعديل،
+# فتُدمج الأجزاء سجلاً بسجل بدل أن يستبدل أحد الطرفين الشهر كاملاً.
+# السجلات الجديدة تأخذ uuid؛ السجلات القادمة من Excel أو من أجزاء قديمة بلا uid تأخذ بصمة
+# محتواها مع رقم تكرارها، فتتفق كل النسخ على نفس المفتاح لنفس السجل.
+def _legacy_uids(rows):
+    seen = {}
+    uids = []
+    for row in rows:
+        text = "\x1f".join("" if v is None else str(v) for v in row)
+        n = seen.get(text, 0)
+        seen[text] = n + 1
+        uids.append(hashlib.sha1(f"{text}\x1e{n}".encode("utf-8")).hexdigest()[:32])
+    return uids
+
+def _migrate_record_keys(conn):
+    """إضافة uid/updated_at لقاعدة أنشأها إصدار سابق وتعبئتهما للسجلات الموجودة"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(cotton_records)")}
+    if "uid" not in columns:
+        conn.execute("ALTER TABLE cotton_records ADD COLUMN uid TEXT")
+        conn.execute("ALTER TABLE cotton_records ADD COLUMN updated_at REAL")
+        records = conn.execute(
+            f"SELECT id, {', '.join(DB_COLUMNS.values())} FROM cotton_records ORDER BY id"
+        ).fetchall()
+        uids = _legacy_uids([r[1:] for r in records])
+        conn.executemany("UPDATE cotton_records SET uid = ?, updated_at = 0 WHERE id = ?",
+                         [(uid, r[0]) for uid, r in zip(uids, records)])
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cotton_uid ON cotton_records (uid)")
+
+def _insert_records(conn, records):
+    """إدخال سجلات من Excel أو إطار كامل؛ المفتاح من المحتوى (انظر _legacy_uids)"""
+    rows = [tuple(_to_db_value(c, r.get(c)) for c in COTTON_COLUMNS) for r in records]
+    return _insert_rows(conn, rows, _legacy_uids(rows), 0)
+
+def _carry_record_keys(conn, ids, rows):
+    """مفاتيح إعادة الكتابة الكاملة: الصف المطابق لسجل موجود يحتفظ بقيمه المخزنة و uid و updated_at،
+    والصف المعدّل الذي يحمل رقم سجل موجود يحتفظ بـ uid مع updated_at جديد، والباقي uuid جديد.
+    بدون ذلك تأخذ كل السجلات مفاتيح جديدة فتكررها النسخ الأخرى كلها عند دمج الأجزاء.
+    يعيد (الصفوف، uids، قيم updated_at)"""
+    def content(row):
+        # الإطار المحمّل يحمل الوزن float32، فالمقارنة بنفس الدقة
+        weight = row[5]
+        return row[:5] + (None if weight is None else float(np.float32(weight)),) + row[6:]
+    existing, stored, by_content = {}, {}, {}
+    for record_id, *values, uid, stamp in conn.execute(
+        f"SELECT id, {', '.join(DB_COLUMNS.values())}, uid, updated_at FROM cotton_records ORDER BY id"
+    ):
+        existing[record_id] = (uid, stamp)
+        stored[record_id] = tuple(values)
+        by_content.setdefault(content(tuple(values)), []).append(record_id)
+    now = time.time()
+    rows, keys, claimed = list(rows), [None] * len(rows), set()
+    for i, (record_id, row) in enumerate(zip(ids, rows)):
+        candidates = by_content.get(content(row))
+        if candidates:
+            match = record_id if record_id in candidates else candidates[0]
+            candidates.remove(match)
+            claimed.add(match)
+            rows[i], keys[i] = stored[match], existing[match]
+    for i, record_id in enumerate(ids):
+        if keys[i] is None and record_id in existing and record_id not in claimed:
+            claimed.add(record_id)
+            keys[i] = (existing[record_id][0], now)
+    keys = [key or (uuid.uuid4().hex, now) for key in keys]
+    return rows, [uid for uid, _ in keys], [stamp for _, stamp in keys]
+
+def _insert_rows(conn, rows, uids=None, updated_at=None):
+    """إدخال صفوف جديدة؛ بدون uids يأخذ كل صف uuid جديداً. updated_at قيمة واحدة أو قائمة"""
+    if uids is None:
+        uids = [uuid.uuid4().hex for _ in rows]
+    if updated_at is None:
+        updated_at = time.time()
+    if not isinstance(updated_at, (list, tuple)):
+        updated_at = [updated_at] * len(rows)
+    conn.executemany(
+        f"INSERT INTO cotton_records ({', '.join(DB_COLUMNS.values())}, uid, updated_at) "
+        f"VALUES ({', '.join('?' * (len(DB_COLUMNS) + 2))})",
+        [row + (uid, stamp) for row, uid, stamp in zip(rows, uids, updated_at)]
+    )
+    _update_rollup(conn, rows)
+    return len(rows)
+
+def _update_rows(conn, ids, rows, updated_at=None):
+    """تعديل سجلات موجودة بأرقامها مع إعادة حساب مجموعات الملخص المتأثرة فقط.
+    يعيد مجموعات الملخص (التاريخ أولاً) قبل التعديل وبعده"""
+    if updated_at is None:
+        updated_at = time.time()
+    if not isinstance(updated_at, (list, tuple)):
+        updated_at = [updated_at] * len(rows)
+    groups = set()
+    for start in range(0, len(ids), 500):
+        part = ids[start:start + 500]
+        groups |= set(conn.execute(
+            "SELECT date, COALESCE(shift, ''), COALESCE(supervisor, ''), COALESCE(bale_type, '') "
+            f"FROM cotton_records WHERE date IS NOT NULL AND id IN ({', '.join('?' * len(part))})", part
+        ).fetchall())
+    groups |= {(r[0], r[2] or "", r[3] or "", r[4] or "") for r in rows if r[0]}
+    conn.executemany(
+        f"UPDATE cotton_records SET {', '.join(f'{c} = ?' for c in DB_COLUMNS.values())}, updated_at = ? WHERE id = ?",
+        [row + (stamp, record_id) for row, stamp, record_id in zip(rows, updated_at, ids)]
+    )
+    _refresh_rollup_groups(conn, groups)
+    return groups
+
+def _delete_records(conn, start=None, end=None):
+    """حذف السجلات (كلها أو في مدى [start, end)) مع صفوف الملخص المقابلة"""
+    if start is None:
+        conn.execute("DELETE FROM cotton_records")
+        conn.execute("DELETE FROM cotton_rollup")
+    else:
+        conn.execute("DELETE FROM cotton_records WHERE date >= ? AND date < ?", (start, end))
+        conn.execute("DELETE FROM cotton_rollup WHERE date >= ? AND date < ?", (start, end))
+
+# ---------- جدول الملخص اليومي ----------
+# صف لكل (تاريخ، وردية، مشرف، نوع بالة) يحمل العدد والمجموع ومجموع المربعات والأقل والأكبر،
+# يُحدَّث مع كل إضافة حتى تُقرأ الإحصائيات منه بدل السجلات الخام.
+_ROLLUP_UPSERT = """
+    INSERT INTO cotton_rollup (date, shift, supervisor, bale_type, count, total, total_sq, min_weight, max_weight)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (date, shift, supervisor, bale_type) DO UPDATE SET
+        count = count + excluded.count,
+        total = total + excluded.total,
+        total_sq = total_sq + excluded.total_sq,
+        min_weight = MIN(min_weight, excluded.min_weight),
+        max_weight = MAX(max_weight, excluded.max_weight)
+"""
+
+def _update_rollup(conn, rows):
+    groups = {}
+    for date, _, shift, supervisor, bale_type, weight, _ in rows:
+        if date is None or weight is None:
+            continue
+        key = (date, shift or "", supervisor or "", bale_type or "")
+        g = groups.get(key)
+        if g is None:
+            groups[key] = [1, weight, weight * weight, weight, weight]
         else:
-            perms = {"all_sections": False}
-    if "sections_permissions" not in user_data:
-        user_data["sections_permissions"] = {}
+            g[0] += 1
+            g[1] += weight
+            g[2] += weight * weight
+            g[3] = min(g[3], weight)
+            g[4] = max(g[4], weight)
+    conn.executemany(_ROLLUP_UPSERT, [key + tuple(g) for key, g in groups.items()])
+
+def rebuild_rollup(conn):
+    conn.execute("DELETE FROM cotton_rollup")
+    conn.execute("""
+        INSERT INTO cotton_rollup
+        SELECT date, COALESCE(shift, ''), COALESCE(supervisor, ''), COALESCE(bale_type, ''),
+               COUNT(*), SUM(weight), SUM(weight * weight), MIN(weight), MAX(weight)
+        FROM cotton_records
+        WHERE date IS NOT NULL AND weight IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+
+def _refresh_rollup_groups(conn, groups):
+    """إعادة حساب مجموعات ملخص محددة من سجلاتها (الأقل/الأكبر لا يمكن إنقاصهما تزايدياً)"""
+    for key in groups:
+        conn.execute("DELETE FROM cotton_rollup WHERE date = ? AND shift = ? AND supervisor = ? AND bale_type = ?", key)
+        conn.execute("""
+            INSERT INTO cotton_rollup
+            SELECT date, COALESCE(shift, ''), COALESCE(supervisor, ''), COALESCE(bale_type, ''),
+                   COUNT(*), SUM(weight), SUM(weight * weight), MIN(weight), MAX(weight)
+            FROM cotton_records
+            WHERE date = ? AND COALESCE(shift, '') = ? AND COALESCE(supervisor, '') = ?
+                  AND COALESCE(bale_type, '') = ? AND weight IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        """, key)
+
+def _frame_to_db_rows(df):
+    """تحويل دفعة مدققة (ناتج normalize_cotton_batch) إلى صفوف قاعدة البيانات دفعة واحدة"""
+    out = pd.DataFrame({
+        'التاريخ': df['التاريخ'].dt.strftime('%Y-%m-%d'),
+        'الوقت': df['الوقت'],
+        'الوردية': df['الوردية'],
+        'المشرف': df['المشرف'],
+        'نوع البالة': df['نوع البالة'],
+        'وزن البالة': df['وزن البالة'].astype(float),
+        'ملاحظات': df['ملاحظات']
+    })
+    out = out.astype(object).where(out.notna(), None)
+    return list(out.itertuples(index=False, name=None))
+
+def _mark_snapshot(conn, max_id=None, rewrite_version=None):
+    """تسجيل آخر سجل موجود في نسخة Excel الحالية.
+    max_id: أكبر رقم سجل في الإطار المكتوب فعلاً (وإلا أكبر رقم في الجدول الآن)؛
+    rewrite_version: إصدار الإطار، فإذا عُدّلت سجلات بعد قراءته تبقى النسخة معلمة كقديمة"""
+    if max_id is None:
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cotton_records").fetchone()[0]
+    set_meta(conn, "snapshot_rowid", int(max_id))
+    set_meta(conn, "snapshot_time", datetime.now().isoformat())
+    if rewrite_version is None or get_data_versions(conn)[1] == rewrite_version:
+        set_meta(conn, "snapshot_stale", 0)
+
+def import_excel_to_db(conn, path, replace=False):
+    """استيراد ملف Excel كامل إلى قاعدة السجلات (يستبدل المحتوى إذا replace=True)"""
+    df = pd.read_excel(path).dropna(how="all")
+    for col in COTTON_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    if replace:
+        _delete_records(conn)
+    count = _insert_records(conn, df[COTTON_COLUMNS].to_dict("records"))
+    bump_data_version(conn, rewrite=True)
+    _mark_snapshot(conn)
+    return count
+
+@instrumented("cotton.read_sqlite")
+def read_cotton_records(conn, after_id=0):
+    """قراءة السجلات (أو ما بعد after_id فقط) مع رقم السجل كفهرس، مرتبة بالتاريخ ثم الوقت"""
+    df = pd.read_sql_query(
+        f"SELECT id, {', '.join(DB_COLUMNS.values())} FROM cotton_records WHERE id > ? "
+        "ORDER BY date IS NULL, date, time IS NULL, time, id",
+        conn, params=(after_id,), index_col="id"
+    )
+    df.columns = COTTON_COLUMNS
+    return apply_cotton_schema(df)
+
+def _cotton_categories():
     return {
-        "all_sections": perms.get("all_sections", False),
-        "sections_permissions": user_data.get("sections_permissions", {})
+        'الوردية': list(APP_CONFIG["SHIFTS"].keys()),
+        'المشرف': get_supervisors(),
+        'نوع البالة': get_bale_types()
     }
 
-def is_admin(username):
-    return username == "admin" or load_users().get(username, {}).get("role") == "admin"
+def _as_category(values, known):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        observed = values.cat.categories
+    else:
+        observed = values.dropna().unique()
+    extra = sorted(set(observed) - set(known))
+    return values.astype(pd.CategoricalDtype(list(known) + extra))
+
+def apply_cotton_schema(df):
+    """الأنواع الموحدة للسجلات: تاريخ datetime64، وقت timedelta (منذ منتصف الليل)،
+    الوردية/المشرف/النوع كفئات، والوزن float32"""
+    df['التاريخ'] = pd.to_datetime(df['التاريخ'], errors='coerce').dt.normalize()
+    if not pd.api.types.is_timedelta64_dtype(df['الوقت']):
+        times = df['الوقت'].astype(object).where(df['الوقت'].notna(), None)
+        df['الوقت'] = pd.to_timedelta(times.map(lambda t: None if t is None else str(t)), errors='coerce')
+    for col, known in _cotton_categories().items():
+        df[col] = _as_category(df[col], known)
+    df['وزن البالة'] = pd.to_numeric(df['وزن البالة'], errors='coerce').astype('float32')
+    return df
+
+def concat_cotton_frames(df, new_rows):
+    """إلحاق صفوف جديدة مع الحفاظ على أعمدة الفئات وعلى ترتيب التاريخ/الوقت.
+    الإضافة في النهاية هي الحالة المعتادة؛ السجلات المتأخرة (تاريخ قديم) تتطلب إعادة ترتيب"""
+    if not len(new_rows):
+        return df
+    if not len(df):
+        return new_rows
+    df = df.copy(deep=False)
+    new_rows = new_rows.copy(deep=False)
+    for col in _cotton_categories():
+        missing = new_rows[col].cat.categories.difference(df[col].cat.categories)
+        if len(missing):
+            df[col] = df[col].cat.add_categories(list(missing))
+        new_rows[col] = new_rows[col].astype(df[col].dtype)
+    in_order = _datetime_key(new_rows.iloc[:1]).iloc[0] >= _datetime_key(df.iloc[-1:]).iloc[0]
+    combined = pd.concat([df, new_rows])
+    return combined if in_order else sort_cotton_by_datetime(combined)
+
+def _datetime_key(df):
+    return df['التاريخ'] + df['الوقت'].fillna(pd.Timedelta(0))
+
+def sort_cotton_by_datetime(df):
+    """ترتيب السجلات بالتاريخ ثم الوقت (القيم المفقودة في النهاية)"""
+    return df.sort_values(['التاريخ', 'الوقت'], kind='stable', na_position='last')
+
+def format_cotton_times(times):
+    """تحويل عمود الوقت (timedelta) إلى نص HH:MM:SS للعرض والتصدير"""
+    return (pd.Timestamp(0) + times).dt.strftime('%H:%M:%S')
+
+# ---------- الكاش الجانبي (Parquet) ----------
+# نسخة عمودية من السجلات باسم يحمل rewrite_version؛ تُقرأ بدل SQLite عند مطابقة الإصدار
+# ثم تُلحق بها السجلات الأحدث فقط.
+def _sidecar_path(rewrite_version):
+    root, _ = os.path.splitext(APP_CONFIG["DB_FILE"])
+    return f"{root}.r{rewrite_version}.parquet"
+
+def write_cotton_sidecar(df, rewrite_version):
+    if not PARQUET_AVAILABLE:
+        return False
+    path = _sidecar_path(rewrite_version)
+    try:
+        df.to_parquet(path + ".tmp", engine="pyarrow")
+        count_metric("bytes_written.sidecar", os.path.getsize(path + ".tmp"))
+        os.replace(path + ".tmp", path)
+        root, _ = os.path.splitext(APP_CONFIG["DB_FILE"])
+        for old in glob.glob(f"{root}.r*.parquet"):
+            if old != path:
+                os.remove(old)
+        return True
+    except Exception:
+        return False
+
+def read_cotton_sidecar(rewrite_version):
+    path = _sidecar_path(rewrite_version)
+    if not PARQUET_AVAILABLE or not os.path.exists(path):
+        count_metric("sidecar.miss")
+        return None
+    try:
+        count_metric("sidecar.hit")
+        count_metric("bytes_read.sidecar", os.path.getsize(path))
+        return apply_cotton_schema(pd.read_parquet(path, engine="pyarrow"))
+    except Exception:
+        return None
+
+@instrumented("cotton.load_full")
+def load_full_cotton_frame(conn):
+    """قراءة كاملة: من الكاش الجانبي إن طابق الإصدار مع إلحاق الأحدث، وإلا من SQLite ثم كتابة كاش جديد"""
+    _, rewrite_version = get_data_versions(conn)
+    df = read_cotton_sidecar(rewrite_version)
+    if df is None:
+        df = read_cotton_records(conn)
+        write_cotton_sidecar(df, rewrite_version)
+        return df
+    last_id = int(df.index.max()) if len(df) else 0
+    return concat_cotton_frames(df, read_cotton_records(conn, after_id=last_id))
 
 # ---------- دوال GitHub والبيانات ----------
+@instrumented("github.fetch_excel")
 def fetch_from_github_requests():
+    """تحميل luva.xlsx من الرابط العام (يُستخدم عند عدم توفر توكن GitHub).
+    طلب مشروط (ETag/Last-Modified) وتنزيل متدفق إلى ملف مؤقت مع حساب البصمة ثم استبدال ذري.
+    يعيد True فقط إذا تغيّر المحتوى فعلاً"""
+    tmp_path = None
     try:
-        response = requests.get(GITHUB_EXCEL_URL, stream=True, timeout=15)
-        response.raise_for_status()
-        with open(APP_CONFIG["LOCAL_FILE"], "wb") as f:
-            shutil.copyfileobj(response.raw, f)
-        st.cache_data.clear()
+        with cotton_db() as conn:
+            etag = get_meta(conn, "excel_etag")
+            last_modified = get_meta(conn, "excel_last_modified")
+            known_hash = get_meta(conn, "excel_sha256")
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        import requests
+        with requests.get(GITHUB_EXCEL_URL, headers=headers, stream=True, timeout=15) as response:
+            if response.status_code == 304:
+                count_metric("github.excel_not_modified")
+                st.info("البيانات محدثة")
+                return False
+            response.raise_for_status()
+            digest = hashlib.sha256()
+            root, ext = os.path.splitext(APP_CONFIG["LOCAL_FILE"])
+            tmp_path = f"{root}.download{ext}"
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    count_metric("bytes_read.github", len(chunk))
+            new_etag = response.headers.get("ETag")
+            new_last_modified = response.headers.get("Last-Modified")
+        content_hash = digest.hexdigest()
+        changed = content_hash != known_hash
+        if changed:
+            os.replace(tmp_path, APP_CONFIG["LOCAL_FILE"])
+            tmp_path = None
+        with cotton_db() as conn:
+            if changed:
+                import_excel_to_db(conn, APP_CONFIG["LOCAL_FILE"], replace=True)
+            set_meta(conn, "excel_sha256", content_hash)
+            if new_etag:
+                set_meta(conn, "excel_etag", new_etag)
+            if new_last_modified:
+                set_meta(conn, "excel_last_modified", new_last_modified)
+        if not changed:
+            st.info("البيانات محدثة")
+            return False
         return True
     except Exception as e:
         st.error(f"فشل التحديث: {e}")
         return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@st.cache_resource(show_spinner=False)
+def _cotton_cache():
+    """كاش مشترك لكل العملية مرتبط بإصدار البيانات في cotton_meta.
+    df لقطة لا تُعدّل أبداً؛ أي تغيير في البيانات ينتج إطاراً جديداً يحل محلها"""
+    return {"lock": threading.Lock(), "df": None, "data_version": None, "rewrite_version": None}
 
-@st.cache_data(show_spinner=False)
+@instrumented("cotton.load")
 def load_cotton_data():
-    if not os.path.exists(APP_CONFIG["LOCAL_FILE"]):
-        create_new_cotton_file()
-        return pd.DataFrame()
+    """إرجاع السجلات (مرتبة بالتاريخ ثم الوقت) من الكاش ما لم يتغير إصدار البيانات.
+    عند الإضافة فقط تُقرأ الصفوف الجديدة وتُلحق في إطار جديد بدل إعادة التحميل.
+    يعيد نسخة سطحية من اللقطة المشتركة (بدون نسخ البيانات)؛ التعديل عليها لا يمس اللقطة"""
+    cache = _cotton_cache()
     try:
-        df = pd.read_excel(APP_CONFIG["LOCAL_FILE"])
-        required_cols = ['التاريخ', 'الوقت', 'الوردية', 'المشرف', 'نوع البالة', 'وزن البالة', 'ملاحظات']
-        for col in required_cols:
-            if col not in df.columns:
-                df[col] = ""
-        return df
+        with cotton_db() as conn, cache["lock"]:
+            data_version, rewrite_version = get_data_versions(conn)
+            if cache["df"] is None or cache["rewrite_version"] != rewrite_version:
+                count_metric("cotton_cache.miss")
+                cache["df"] = load_full_cotton_frame(conn)
+            elif cache["data_version"] != data_version:
+                count_metric("cotton_cache.append")
+                last_id = int(cache["df"].index.max()) if len(cache["df"]) else 0
+                cache["df"] = concat_cotton_frames(cache["df"], read_cotton_records(conn, after_id=last_id))
+            else:
+                count_metric("cotton_cache.hit")
+            cache["data_version"], cache["rewrite_version"] = data_version, rewrite_version
+            return cache["df"].copy(deep=False)
     except Exception as e:
         st.error(f"خطأ في تحميل البيانات: {e}")
         return pd.DataFrame()
 
-def create_new_cotton_file():
+def append_cotton_records(records, commit_message="إضافة سجل"):
+    """إضافة سجلات جديدة إلى المخزن (كتابة صف واحد لكل بالة بدل إعادة كتابة الملف)"""
+    return _append_rows([tuple(_to_db_value(c, r.get(c)) for c in COTTON_COLUMNS) for r in records], commit_message)
+
+def ingest_cotton_batch(batches, commit_message=None):
+    """تدقيق دفعة كاملة وحفظها في عملية كتابة واحدة ورفع واحد.
+    batches إطار واحد أو مولّد إطارات (صفحة صفحة) يُدقق ويُكتب جزءاً جزءاً داخل نفس المعاملة،
+    فلا يُجمع المحتوى كله في إطار واحد. يعيد (عدد السجلات المحفوظة، الصفوف المرفوضة مع السبب
+    مرقمة بترتيبها في كل الأجزاء)؛ لا يُحفظ شيء إذا وُجد صف مرفوض"""
+    if isinstance(batches, pd.DataFrame):
+        batches = [batches]
+    saved, offset, rejected, months = 0, 0, [], set()
     try:
-        cols = ['التاريخ', 'الوقت', 'الوردية', 'المشرف', 'نوع البالة', 'وزن البالة', 'ملاحظات']
-        df = pd.DataFrame(columns=cols)
-        df.to_excel(APP_CONFIG["LOCAL_FILE"], index=False)
+        with cotton_db() as conn:
+            for batch in batches:
+                valid, bad = normalize_cotton_batch(batch)
+                if not bad.empty:
+                    rejected.append(bad.set_axis(bad.index + offset))
+                offset += len(batch)
+                if rejected or valid.empty:
+                    continue
+                rows = _frame_to_db_rows(valid)
+                _insert_rows(conn, rows)
+                months |= {r[0][:7] for r in rows if r[0]}
+                saved += len(rows)
+            if rejected or not saved:
+                conn.rollback()
+                return 0, pd.concat(rejected) if rejected else pd.DataFrame()
+            bump_data_version(conn)
+    except Exception as e:
+        st.error(f"خطأ في الحفظ: {e}")
+        return 0, pd.DataFrame()
+    commit_message = commit_message or f"إضافة {saved} سجل"
+    queue_shard_push(months, commit_message)
+    schedule_snapshot_compaction(commit_message)
+    return saved, pd.DataFrame()
+
+@instrumented("cotton.append")
+def _append_rows(rows, commit_message):
+    try:
+        with cotton_db() as conn:
+            _insert_rows(conn, rows)
+            bump_data_version(conn)
+        queue_shard_push({r[0][:7] for r in rows if r[0]}, commit_message)
+        schedule_snapshot_compaction(commit_message)
         return True
     except Exception as e:
-        st.error(f"خطأ في إنشاء الملف: {e}")
+        st.error(f"خطأ في الحفظ: {e}")
         return False
 
+@instrumented("cotton.save")
 def save_cotton_data(df, commit_message="تحديث"):
+    """استبدال كل السجلات بمحتوى df؛ نسخة Excel تُعاد كتابتها في الخلفية"""
     try:
-        df.to_excel(APP_CONFIG["LOCAL_FILE"], index=False)
-        st.cache_data.clear()
-        token = st.secrets.get("github", {}).get("token", None)
-        if token and GITHUB_AVAILABLE:
+        with cotton_db() as conn:
+            months = _stored_months(conn)
+            frame = df.reindex(columns=COTTON_COLUMNS)
+            if pd.api.types.is_timedelta64_dtype(frame['الوقت']):
+                frame['الوقت'] = format_cotton_times(frame['الوقت'])
+            rows = [tuple(_to_db_value(c, r.get(c)) for c in COTTON_COLUMNS) for r in frame.to_dict("records")]
+            rows, uids, stamps = _carry_record_keys(conn, list(frame.index), rows)
+            _delete_records(conn)
+            _insert_rows(conn, rows, uids, stamps)
+            bump_data_version(conn, rewrite=True)
+            months |= _stored_months(conn)
+        queue_shard_push(months, commit_message)
+        schedule_snapshot_compaction(commit_message, force=True)
+        return True
+    except Exception as e:
+        st.error(f"خطأ في الحفظ: {e}")
+        return False
+
+def maybe_compact_cotton_snapshot(commit_message="تحديث", force=False):
+    """تصدير نسخة Excel دورياً: بعد عدد محدد من السجلات أو بعد مدة زمنية (أو فوراً مع force).
+    يعمل في عامل SnapshotCompactor وليس في مسار الحفظ؛ الأخطاء تُرفع للعامل"""
+    if force:
+        # بعد إعادة كتابة كاملة لا يدل عدد السجلات الجديدة على شيء
+        write_cotton_snapshot()
+        return True
+    with cotton_db() as conn:
+        last_id = int(get_meta(conn, "snapshot_rowid", 0))
+        last_time = get_meta(conn, "snapshot_time")
+        pending = conn.execute("SELECT COUNT(*) FROM cotton_records WHERE id > ?", (last_id,)).fetchone()[0]
+        stale = get_meta(conn, "snapshot_stale") == "1"
+    if pending == 0 and not stale:
+        return False
+    interval = timedelta(minutes=APP_CONFIG["SNAPSHOT_INTERVAL_MINUTES"])
+    overdue = last_time is None or datetime.now() - datetime.fromisoformat(last_time) >= interval
+    if pending >= APP_CONFIG["SNAPSHOT_EVERY_RECORDS"] or overdue:
+        write_cotton_snapshot()
+        return True
+    return False
+
+@instrumented("cotton.export_excel")
+def write_cotton_snapshot():
+    """كتابة luva.xlsx (والكاش الجانبي) من قاعدة السجلات باستبدال ذري"""
+    with cotton_db() as conn:
+        # الإصدار قبل القراءة، والعلامة من الإطار نفسه: ما يُضاف بعد القراءة يبقى معلقاً للتصدير التالي
+        rewrite_version = get_data_versions(conn)[1]
+        df = read_cotton_records(conn)
+        max_id = int(df.index.max()) if len(df) else 0
+        write_cotton_sidecar(df, rewrite_version)
+        df['التاريخ'] = df['التاريخ'].dt.date
+        df['الوقت'] = format_cotton_times(df['الوقت'])
+        root, ext = os.path.splitext(APP_CONFIG["LOCAL_FILE"])
+        tmp_path = f"{root}.tmp{ext}"
+        df.to_excel(tmp_path, index=False)
+        count_metric("bytes_written.excel", os.path.getsize(tmp_path))
+        os.replace(tmp_path, APP_CONFIG["LOCAL_FILE"])
+        _mark_snapshot(conn, max_id, rewrite_version)
+
+def export_cotton_snapshot(commit_message="تحديث", push=True):
+    """تصدير يدوي فوري لنسخة Excel ثم رفعها إلى GitHub إذا push=True"""
+    try:
+        write_cotton_snapshot()
+        if push:
+            push_cotton_snapshot(commit_message)
+        return True
+    except Exception as e:
+        st.error(f"خطأ في تصدير ملف Excel: {e}")
+        return False
+
+class SnapshotCompactor:
+    """عامل خلفي واحد لكل عملية يعيد كتابة نسخة Excel، حتى يبقى حفظ البالة كتابة صف واحد.
+    الطلبات المتتالية تُدمج في تشغيل واحد؛ compact(commit_message, force) تقرر هل يلزم التصدير.
+    الطلب قد يحمل sidecar=(df, rewrite_version) لتكتبه write_sidecar قبل التصدير (الأحدث يحل محل الأقدم)"""
+
+    def __init__(self, compact, write_sidecar=None):
+        self._compact = compact
+        self._write_sidecar = write_sidecar
+        self._cond = threading.Condition()
+        self._request = None
+        self._running = False
+        self._worker = None
+        self.last_error = None
+        self.last_run = None
+
+    def request(self, commit_message="تحديث", force=False, sidecar=None):
+        with self._cond:
+            if self._request is not None:
+                force = force or self._request[1]
+                sidecar = sidecar or self._request[2]
+            self._request = (commit_message, force, sidecar)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="snapshot-compactor", daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """انتظار انتهاء الطلبات المعلقة"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._request is not None or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._request is None:
+                    self._cond.wait()
+                (commit_message, force, sidecar), self._request = self._request, None
+                self._running = True
             try:
-                g = Github(token)
-                repo = g.get_repo(APP_CONFIG["REPO_NAME"])
-                with open(APP_CONFIG["LOCAL_FILE"], "rb") as f:
-                    content = f.read()
-                try:
-                    contents = repo.get_contents(APP_CONFIG["FILE_PATH"], ref=APP_CONFIG["BRANCH"])
-                    repo.update_file(APP_CONFIG["FILE_PATH"], commit_message, content, contents.sha, branch=APP_CONFIG["BRANCH"])
-                    st.success("تم الحفظ والرفع إلى GitHub")
-                except:
-                    repo.create_file(APP_CONFIG["FILE_PATH"], commit_message, content, branch=APP_CONFIG["BRANCH"])
-                    st.success("تم إنشاء الملف على GitHub")
+                if sidecar is not None and self._write_sidecar:
+                    self._write_sidecar(*sidecar)
+                if self._compact(commit_message, force):
+                    self.last_run = datetime.now()
+                self.last_error = None
             except Exception as e:
-                st.warning(f"تم الحفظ محلياً فقط: {e}")
+                self.last_error = f"{type(e).__name__}: {e}"
+            finally:
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot_compactor():
+    compactor = SnapshotCompactor(maybe_compact_cotton_snapshot, write_cotton_sidecar)
+    atexit.register(compactor.flush, timeout=60)
+    return compactor
+
+def schedule_snapshot_compaction(commit_message="تحديث", force=False, sidecar=None):
+    get_snapshot_compactor().request(commit_message, force, sidecar)
+
+def push_cotton_snapshot(commit_message="تحديث"):
+    """جدولة رفع نسخة Excel؛ الرفع الفعلي يتم في الخلفية عبر GitHubSync"""
+    sync = get_github_sync()
+    if sync is None:
+        return False
+    with open(APP_CONFIG["LOCAL_FILE"], "rb") as f:
+        sync.enqueue(APP_CONFIG["FILE_PATH"], f.read(), commit_message)
+    return True
+
+# ---------- مزامنة الأجزاء الشهرية ----------
+# كل شهر ملف CSV مستقل على GitHub (data/2026-07.csv): الحفظ يرفع شهر السجل فقط،
+# والتحديث ينزّل فقط الأجزاء التي تغيّر SHA الخاص بها.
+def shard_path(month):
+    return f"{APP_CONFIG['SHARDS_DIR']}/{month}.csv"
+
+def _month_bounds(month):
+    start = datetime.strptime(month, "%Y-%m").date()
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.isoformat(), end.isoformat()
+
+def _stored_months(conn):
+    rows = conn.execute("SELECT DISTINCT substr(date, 1, 7) FROM cotton_records WHERE date IS NOT NULL").fetchall()
+    return {r[0] for r in rows}
+
+SHARD_KEY_COLUMNS = ['uid', 'updated_at']
+
+def build_shard_csv(conn, month):
+    start, end = _month_bounds(month)
+    df = pd.read_sql_query(
+        f"SELECT {', '.join(DB_COLUMNS.values())}, uid, updated_at FROM cotton_records "
+        "WHERE date >= ? AND date < ? ORDER BY id",
+        conn, params=(start, end)
+    )
+    df.columns = COTTON_COLUMNS + SHARD_KEY_COLUMNS
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+def _shard_month(path):
+    prefix = f"{APP_CONFIG['SHARDS_DIR']}/"
+    if path.startswith(prefix) and path.endswith(".csv"):
+        return path[len(prefix):-4]
+    return None
+
+def _shard_rows(df):
+    """صفوف جزء شهري بصيغة القاعدة مع مفاتيحها؛ الأجزاء القديمة بلا uid تأخذ المفتاح من المحتوى"""
+    df = df.reindex(columns=COTTON_COLUMNS + SHARD_KEY_COLUMNS)
+    rows = [tuple(_to_db_value(c, v) for c, v in zip(COTTON_COLUMNS, values))
+            for values in df[COTTON_COLUMNS].itertuples(index=False, name=None)]
+    uids = [uid if isinstance(uid, str) and uid else legacy
+            for uid, legacy in zip(df['uid'], _legacy_uids(rows))]
+    stamps = pd.to_numeric(df['updated_at'], errors='coerce').fillna(0).tolist()
+    return rows, uids, stamps
+
+def merge_shard_into_db(conn, month, df):
+    """دمج جزء شهري (من GitHub) في القاعدة سجلاً بسجل بمفتاح uid: السجل الجديد يُضاف،
+    والأحدث (updated_at) يفوز، والسجلات الموجودة محلياً فقط تبقى.
+    يعيد (المضاف، المحدث، هل لدى القاعدة المحلية ما ليس في الجزء فيلزم رفعه)"""
+    rows, uids, stamps = _shard_rows(df)
+    local = {}
+    for start in range(0, len(uids), 500):
+        part = uids[start:start + 500]
+        for uid, record_id, stamp in conn.execute(
+            f"SELECT uid, id, COALESCE(updated_at, 0) FROM cotton_records WHERE uid IN ({', '.join('?' * len(part))})",
+            part
+        ):
+            local[uid] = (record_id, stamp)
+    new = [i for i, uid in enumerate(uids) if uid not in local]
+    newer = [i for i, uid in enumerate(uids) if uid in local and stamps[i] > local[uid][1]]
+    if new:
+        _insert_rows(conn, [rows[i] for i in new], [uids[i] for i in new], [stamps[i] for i in new])
+    if newer:
+        _update_rows(conn, [local[uids[i]][0] for i in newer], [rows[i] for i in newer], [stamps[i] for i in newer])
+    remote = dict(zip(uids, stamps))
+    start, end = _month_bounds(month)
+    local_ahead = any(stamps[i] < local[uid][1] for i, uid in enumerate(uids) if uid in local) or any(
+        uid not in remote for (uid,) in conn.execute(
+            "SELECT uid FROM cotton_records WHERE date >= ? AND date < ?", (start, end))
+    )
+    return len(new), len(newer), local_ahead
+
+def merge_remote_shard(path, remote_sha, fetch):
+    """لـ GitHubSync: الجزء على GitHub قد يحمل سجلات من نسخة أخرى. ما لم يكن هو نفسه آخر ما
+    دمجناه/رفعناه، يُنزّل ويُدمج في القاعدة المحلية ثم يُعاد بناء المحتوى المرفوع من الطرفين معاً"""
+    month = _shard_month(path)
+    if month is None:
+        return None
+    with cotton_db() as conn:
+        if get_meta(conn, f"shard_sha:{month}") == remote_sha:
+            return None
+    content = fetch()
+    count_metric("bytes_read.github", len(content))
+    df = pd.read_csv(io.BytesIO(content), encoding="utf-8-sig", dtype=str)
+    with cotton_db() as conn:
+        added, updated, _ = merge_shard_into_db(conn, month, df)
+        if added or updated:
+            bump_data_version(conn, rewrite=bool(updated))
+        return build_shard_csv(conn, month)
+
+@instrumented("shards.queue_push")
+def queue_shard_push(months, commit_message="تحديث"):
+    """جدولة رفع أجزاء الأشهر المعدلة فقط"""
+    sync = get_github_sync()
+    if sync is None or not months:
+        return False
+    with cotton_db() as conn:
+        for month in sorted(months):
+            sync.enqueue(shard_path(month), build_shard_csv(conn, month), commit_message)
+    return True
+
+def _record_pushed_shard(path, sha):
+    month = _shard_month(path)
+    if month is not None:
+        with cotton_db() as conn:
+            set_meta(conn, f"shard_sha:{month}", sha)
+
+@instrumented("shards.pull")
+def pull_cotton_shards():
+    """تنزيل الأجزاء التي تغيّر SHA الخاص بها فقط ودمجها في القاعدة المحلية سجلاً بسجل.
+    الأشهر التي لدى القاعدة المحلية فيها ما ليس على GitHub (أو غير موجودة عليه) تُرفع. يعيد عدد الأجزاء المنزلة"""
+    sync = get_github_sync()
+    if sync is None:
+        return 0
+    sync.flush(timeout=60)
+    try:
+        listing = sync.repo.get_contents(APP_CONFIG["SHARDS_DIR"], ref=APP_CONFIG["BRANCH"])
+    except Exception as e:
+        if getattr(e, "status", None) != 404:
+            raise
+        listing = []
+    remote = {f.name[:-4]: f.sha for f in listing if f.name.endswith(".csv")}
+    downloaded = added = updated = 0
+    with cotton_db() as conn:
+        months = _stored_months(conn) - set(remote)
+        for month, sha in sorted(remote.items()):
+            if get_meta(conn, f"shard_sha:{month}") == sha:
+                continue
+            blob = sync.repo.get_git_blob(sha)
+            content = b64decode(blob.content)
+            count_metric("bytes_read.github", len(content))
+            df = pd.read_csv(io.BytesIO(content), encoding="utf-8-sig", dtype=str)
+            month_added, month_updated, local_ahead = merge_shard_into_db(conn, month, df)
+            added += month_added
+            updated += month_updated
+            if local_ahead:
+                months.add(month)
+            set_meta(conn, f"shard_sha:{month}", sha)
+            downloaded += 1
+        if added or updated:
+            bump_data_version(conn, rewrite=bool(updated))
+    if months:
+        queue_shard_push(months, "رفع الأجزاء الشهرية")
+    return downloaded
+
+@st.cache_resource(show_spinner=False)
+def initial_shard_sync():
+    """مزامنة أولية مرة واحدة لكل عملية. الفشل يُرفع ولا يُخزن، فتُعاد المحاولة في التشغيل التالي"""
+    return pull_cotton_shards()
+
+# ---------- سجل البالات (تصفح وتعديل من قاعدة البيانات) ----------
+# تُقرأ صفحة واحدة فقط بترقيم المفاتيح (keyset): الصفحة التالية تبدأ بعد مفتاح آخر صف في
+# الصفحة الحالية، فيبقى زمن أي صفحة ثابتاً مهما كبر السجل (بدل OFFSET الذي يمر على كل ما قبله).
+# الترتيب بالتاريخ يطابق الفهرس idx_cotton_datetime؛ الترتيب بالوزن يرتب سجلات المدى المحدد فقط.
+HISTORY_SORTS = {
+    "الأحدث أولاً": (("date", "IFNULL(time, '')", "id"), True),
+    "الأقدم أولاً": (("date", "IFNULL(time, '')", "id"), False),
+    "الأثقل أولاً": (("IFNULL(weight, 0)", "id"), True),
+    "الأخف أولاً": (("IFNULL(weight, 0)", "id"), False),
+}
+
+def _history_where(filters):
+    """شروط المرشحات؛ نفس الأعمدة في cotton_records و cotton_rollup"""
+    where, params = ["date >= ?", "date <= ?"], [filters["start"].isoformat(), filters["end"].isoformat()]
+    for col in ("shift", "supervisor", "bale_type"):
+        values = filters.get(col)
+        if values:
+            where.append(f"{col} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    return where, params
+
+@instrumented("history.page")
+def query_cotton_page(filters, sort, cursor=None, limit=100):
+    """صفحة من السجلات (فهرسها رقم السجل) بعد المؤشر cursor.
+    يعيد (الصفحة، مؤشر الصفحة التالية أو None إذا كانت الأخيرة)"""
+    keys, descending = HISTORY_SORTS[sort]
+    where, params = _history_where(filters)
+    if cursor is not None:
+        where.append(f"({', '.join(keys)}) {'<' if descending else '>'} ({', '.join('?' * len(keys))})")
+        params.extend(cursor)
+    direction = "DESC" if descending else "ASC"
+    key_columns = ", ".join(f"{k} AS _k{i}" for i, k in enumerate(keys))
+    with cotton_db() as conn:
+        df = pd.read_sql_query(
+            f"SELECT id, {', '.join(DB_COLUMNS.values())}, {key_columns} FROM cotton_records "
+            f"WHERE {' AND '.join(where)} ORDER BY {', '.join(f'{k} {direction}' for k in keys)} LIMIT ?",
+            conn, params=params + [limit + 1], index_col="id"
+        )
+    next_cursor = None
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        # قيم Python عادية: numpy.int64 يُربط في SQLite كـ BLOB فتتكرر الصفوف أو تُتخطى
+        last = df[[f"_k{i}" for i in range(len(keys))]].iloc[-1]
+        next_cursor = tuple(v.item() if isinstance(v, np.generic) else v for v in last)
+    df = df[list(DB_COLUMNS.values())]
+    df.columns = COTTON_COLUMNS
+    return df, next_cursor
+
+def count_cotton_records(filters):
+    """عدد السجلات المطابقة بنفس شروط الصفحات (جدول الملخص يستبعد السجلات بلا وزن فلا يصلح هنا).
+    المدى الزمني يُقرأ من الفهرس idx_cotton_date"""
+    where, params = _history_where(filters)
+    with cotton_db() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM cotton_records WHERE {' AND '.join(where)}",
+                            params).fetchone()[0]
+
+def cotton_date_bounds():
+    """أقدم وأحدث تاريخ في السجلات (من طرفي الفهرس، بدون مرور على الجدول)"""
+    with cotton_db() as conn:
+        # استعلامان فرعيان: SQLite يقرأ طرف الفهرس فقط عندما يكون MIN أو MAX وحيداً في الاستعلام
+        return conn.execute("SELECT (SELECT MIN(date) FROM cotton_records), "
+                            "(SELECT MAX(date) FROM cotton_records)").fetchone()
+
+def history_editor_frame(page):
+    """صفحة السجل بأنواع محرر البيانات (تاريخ ووقت كقيم وليس نصوصاً)"""
+    frame = page.copy()
+    frame['التاريخ'] = pd.to_datetime(frame['التاريخ'], errors='coerce').dt.date
+    frame['الوقت'] = pd.to_datetime(frame['الوقت'], format='mixed', errors='coerce').dt.time
+    frame['وزن البالة'] = frame['وزن البالة'].astype('float64')
+    frame['ملاحظات'] = frame['ملاحظات'].fillna("")
+    frame.index.name = 'رقم السجل'
+    return frame
+
+def _read_records_by_id(conn, ids):
+    df = pd.read_sql_query(
+        f"SELECT id, {', '.join(DB_COLUMNS.values())} FROM cotton_records WHERE id IN ({', '.join('?' * len(ids))}) "
+        "ORDER BY date IS NULL, date, time IS NULL, time, id",
+        conn, params=ids, index_col="id"
+    )
+    df.columns = COTTON_COLUMNS
+    return apply_cotton_schema(df)
+
+@instrumented("cotton.update")
+def update_cotton_records(changes, commit_message="تعديل سجلات"):
+    """تعديل سجلات موجودة صفاً صفاً؛ changes إطار مدقق (ناتج normalize_cotton_batch) فهرسه رقم السجل.
+    يُعاد حساب مجموعات الملخص المتأثرة فقط، وتُستبدل الصفوف المعدلة في لقطة الذاكرة،
+    وتُرفع أشهرها فقط. الكاش الجانبي ونسخة Excel يُعاد كتابتهما في الخلفية"""
+    ids = [int(i) for i in changes.index]
+    rows = _frame_to_db_rows(changes)
+    cache = _cotton_cache()
+    sidecar = None
+    try:
+        with cotton_db() as conn, cache["lock"]:
+            versions = get_data_versions(conn)
+            groups = _update_rows(conn, ids, rows)
+            bump_data_version(conn, rewrite=True)
+            set_meta(conn, "snapshot_stale", 1)
+            # اللقطة المشتركة لا تُعدّل: إطار جديد بالصفوف المحدثة يحل محلها إن كانت حديثة،
+            # ويُكتب نفسه كاشاً جانبياً للإصدار الجديد بدل إعادة القراءة الكاملة من SQLite لاحقاً
+            if cache["df"] is not None and (cache["data_version"], cache["rewrite_version"]) == versions:
+                df = concat_cotton_frames(cache["df"].drop(index=ids, errors="ignore"), _read_records_by_id(conn, ids))
+                cache["df"] = sort_cotton_by_datetime(df)
+                cache["data_version"], cache["rewrite_version"] = get_data_versions(conn)
+                sidecar = (cache["df"], cache["rewrite_version"])
+        queue_shard_push({g[0][:7] for g in groups}, commit_message)
+        schedule_snapshot_compaction(commit_message, sidecar=sidecar)
         return True
     except Exception as e:
-        st.error(f"خطأ في الحفظ: {e}")
+        st.error(f"خطأ في حفظ التعديلات: {e}")
         return False
 
+# ---------- التصدير المتدفق ----------
+# السجلات تُقرأ من SQLite على دفعات (EXPORT_CHUNK_ROWS) وتُكتب مباشرة إلى ملف على القرص،
+# فلا يوجد في الذاكرة إلا دفعة واحدة مهما طال المدى. الملخص الشهري يُجمع من نفس الدفعات.
+EXPORT_FORMATS = {
+    "Excel (xlsx)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+EXPORT_SUMMARY_COLUMNS = ['الشهر', 'نوع البالة', 'عدد البالات', 'إجمالي الوزن', 'متوسط الوزن',
+                          'أقل وزن', 'أكبر وزن', 'المشرف']
+
+def iter_export_chunks(filters, chunk_rows=None):
+    """السجلات المطابقة للمرشحات (نفس مرشحات سجل البالات) مرتبة بالتاريخ ثم الوقت، دفعة بعد دفعة"""
+    where, params = _history_where(filters)
+    with cotton_db() as conn:
+        chunks = pd.read_sql_query(
+            f"SELECT {', '.join(DB_COLUMNS.values())} FROM cotton_records WHERE {' AND '.join(where)} "
+            "ORDER BY date, IFNULL(time, ''), id",
+            conn, params=params, chunksize=chunk_rows or APP_CONFIG["EXPORT_CHUNK_ROWS"]
+        )
+        for chunk in chunks:
+            chunk.columns = COTTON_COLUMNS
+            chunk['وزن البالة'] = chunk['وزن البالة'].astype('float64')
+            yield chunk
+
+def _summary_partial(chunk):
+    """ملخص دفعة واحدة لكل (شهر، نوع بالة)؛ الدفعات تُدمج في _finish_summary"""
+    keys = [chunk['التاريخ'].str[:7].rename('الشهر'), chunk['نوع البالة']]
+    partial = chunk['وزن البالة'].groupby(keys).agg(['count', 'sum', 'min', 'max'])
+    partial['supervisor'] = chunk['المشرف'].groupby(keys).first()
+    return partial
+
+def _finish_summary(partials):
+    if not partials:
+        return pd.DataFrame(columns=EXPORT_SUMMARY_COLUMNS)
+    stats = pd.concat(partials).groupby(level=[0, 1]).agg(
+        count=('count', 'sum'), total=('sum', 'sum'), min_weight=('min', 'min'),
+        max_weight=('max', 'max'), supervisor=('supervisor', 'first')
+    )
+    stats['mean'] = stats['total'] / stats['count']
+    stats = stats[['count', 'total', 'mean', 'min_weight', 'max_weight', 'supervisor']].round(2).reset_index()
+    stats.columns = EXPORT_SUMMARY_COLUMNS
+    return stats
+
+class _XlsxExportWriter:
+    """openpyxl بوضع الكتابة فقط: الصفوف تُكتب إلى ملف مؤقت ولا تبقى في الذاكرة"""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("السجلات")
+        self.sheet.append(COTTON_COLUMNS)
+
+    def write(self, chunk):
+        chunk = chunk.assign(التاريخ=pd.to_datetime(chunk['التاريخ'], errors='coerce').dt.date)
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            self.sheet.append(row)
+
+    def close(self, summary=None):
+        if summary is not None:
+            sheet = self.workbook.create_sheet("ملخص شهري")
+            sheet.append(list(summary.columns))
+            for row in summary.astype(object).itertuples(index=False, name=None):
+                sheet.append(row)
+        self.workbook.save(self.path)
+
+class _CsvExportWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.header = True
+
+    def write(self, chunk):
+        chunk.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def close(self, summary=None):
+        if self.header:
+            pd.DataFrame(columns=COTTON_COLUMNS).to_csv(self.file, index=False)
+        self.file.close()
+
+class _ParquetExportWriter:
+    """ParquetWriter: كل دفعة مجموعة صفوف (row group) مستقلة بنفس المخطط"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([(c, pa.float64() if c == 'وزن البالة' else pa.string()) for c in COTTON_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, chunk):
+        self.writer.write_table(self.pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False))
+
+    def close(self, summary=None):
+        self.writer.close()
+
+EXPORT_WRITERS = {"xlsx": _XlsxExportWriter, "csv": _CsvExportWriter, "parquet": _ParquetExportWriter}
+
+@instrumented("export.stream")
+def export_cotton_range(filters, fmt, path, with_summary=True, chunk_rows=None):
+    """كتابة السجلات المطابقة إلى path بصيغة fmt (xlsx/csv/parquet) دفعة بعد دفعة.
+    يعيد (عدد السجلات، الملخص الشهري أو None)؛ في xlsx يُضاف الملخص كورقة ثانية"""
+    writer = EXPORT_WRITERS[fmt](path)
+    rows, partials = 0, []
+    try:
+        for chunk in iter_export_chunks(filters, chunk_rows):
+            if with_summary:
+                partials.append(_summary_partial(chunk))
+            writer.write(chunk)
+            rows += len(chunk)
+            count_metric("export.rows", len(chunk))
+    except Exception:
+        writer.close()
+        raise
+    summary = _finish_summary(partials) if with_summary else None
+    writer.close(summary)
+    count_metric("bytes_written.export", os.path.getsize(path))
+    return rows, summary
+
 # ---------- دوال النظام الأساسية ----------
 def get_current_shift():
-    now = datetime.now()
-    h = now.hour
+    return get_shift_for_hour(datetime.now().hour)
+
+def get_shift_for_hour(h):
     for name, times in APP_CONFIG["SHIFTS"].items():
         if times["start"] <= h < times["end"]:
             return name
     return "الثالثه"
 
+def get_shifts_for_hours(hours):
+    """نسخة متجهة من get_shift_for_hour لمصفوفة ساعات"""
+    hours = np.asarray(hours)
+    shifts = APP_CONFIG["SHIFTS"]
+    conditions = [(hours >= t["start"]) & (hours < t["end"]) for t in shifts.values()]
+    return np.select(conditions, list(shifts.keys()), default="الثالثه")
+
+def normalize_cotton_batch(df):
+    """توحيد أنواع الأعمدة وتدقيقها في مرور واحد، واشتقاق الوردية من وقت كل صف.
+    يعيد (الصفوف الصالحة، الصفوف المرفوضة مع عمود 'السبب')"""
+    batch = df.reindex(columns=COTTON_COLUMNS).reset_index(drop=True)
+    weights = pd.to_numeric(batch['وزن البالة'], errors='coerce')
+    dates = pd.to_datetime(batch['التاريخ'], errors='coerce').dt.normalize()
+    times = pd.to_datetime(batch['الوقت'].astype(str), format='mixed', errors='coerce')
+    bale_types = batch['نوع البالة'].astype(str).str.strip()
+    bale_types = bale_types.where(batch['نوع البالة'].notna(), "")
+    supervisors = batch['المشرف'].astype(str).str.strip().where(batch['المشرف'].notna(), "")
+
+    # نفس الحقول الإلزامية في محررات الواجهة؛ "غير محدد" (ناتج المطابقة الفاشلة) ليس نوعاً معروفاً
+    reasons = pd.Series(np.select(
+        [~(weights > 0), dates.isna(), times.isna(), bale_types == "",
+         ~bale_types.isin(get_bale_types()), supervisors == ""],
+        ["وزن غير صحيح", "تاريخ غير صحيح", "وقت غير صحيح", "نوع البالة مفقود",
+         "نوع البالة غير معروف", "المشرف مفقود"],
+        default=""
+    ), index=batch.index)
+    ok = reasons == ""
+
+    valid = pd.DataFrame({
+        'التاريخ': dates[ok],
+        'الوقت': times[ok].dt.strftime('%H:%M:%S'),
+        'الوردية': get_shifts_for_hours(times[ok].dt.hour),
+        'المشرف': supervisors[ok],
+        'نوع البالة': bale_types[ok],
+        'وزن البالة': weights[ok],
+        'ملاحظات': batch.loc[ok, 'ملاحظات'].fillna("")
+    })
+    rejected = batch[~ok].assign(السبب=reasons[~ok])
+    return valid.reset_index(drop=True), rejected
+
 def get_supervisors():
     return ["انسT.A", "عبدالحميدT.B", "محمود فتحيT.C", "احمد عبالعزيزT.D"]
 
@@ -342,9 +1857,9 @@ def get_bale_types():
     return ["قماش", "تراب", "هبوه دست", "اسطبات تدویر", "برم", "برم انفاق", "بلاستيك",
             "هبوه تنظيف", "انفاق", "شرق الغزل", "تمشيط غير مغلف", "تمشيط مغلف", "مكس", "كرد", "قطن خام", "ملح"]
 
-def add_new_record(df, supervisor, bale_type, weight, notes=""):
+def build_new_record(supervisor, bale_type, weight, notes=""):
     now = datetime.now()
-    new = {
+    return {
         'التاريخ': now.date(),
         'الوقت': now.time(),
         'الوردية': get_current_shift(),
@@ -353,24 +1868,116 @@ def add_new_record(df, supervisor, bale_type, weight, notes=""):
         'وزن البالة': weight,
         'ملاحظات': notes
     }
+
+def add_new_record(df, supervisor, bale_type, weight, notes=""):
+    new = build_new_record(supervisor, bale_type, weight, notes)
     return new, pd.concat([df, pd.DataFrame([new])], ignore_index=True)
 
-def generate_statistics(df, start_date, end_date):
-    if df.empty:
+_STATS_QUERY = """
+    SELECT bale_type, SUM(count), SUM(total), SUM(total) / SUM(count), MIN(min_weight), MAX(max_weight),
+           (SELECT first.supervisor FROM cotton_rollup AS first
+            WHERE first.bale_type = r.bale_type AND first.date >= :start AND first.date <= :end
+            ORDER BY first.date, first.shift, first.supervisor LIMIT 1)
+    FROM cotton_rollup AS r
+    WHERE date >= :start AND date <= :end
+    GROUP BY bale_type
+    ORDER BY bale_type
+"""
+
+@instrumented("stats.generate")
+def generate_statistics(start_date, end_date):
+    """إحصائيات كل نوع بالة بين تاريخين (شاملين)، مجمّعة في SQLite من جدول الملخص بدل السجلات الخام.
+    المشرف هو مشرف أول صف ملخص للنوع في المدى"""
+    params = {"start": pd.Timestamp(start_date).date().isoformat(), "end": pd.Timestamp(end_date).date().isoformat()}
+    with cotton_db() as conn:
+        stats = pd.DataFrame(conn.execute(_STATS_QUERY, params).fetchall(), columns=[
+            'نوع البالة', 'عدد البالات', 'إجمالي الوزن', 'متوسط الوزن', 'أقل وزن', 'أكبر وزن', 'المشرف'])
+    if stats.empty:
         return pd.DataFrame()
-    df['التاريخ'] = pd.to_datetime(df['التاريخ']).dt.date
-    mask = (df['التاريخ'] >= start_date) & (df['التاريخ'] <= end_date)
-    fdf = df[mask]
+    return stats.round(2)
+
+# ---------- دوال التقارير ----------
+REPORT_DIMENSIONS = ['الوردية', 'المشرف', 'نوع البالة', 'الساعة', 'اليوم', 'الأسبوع', 'الشهر']
+REPORT_FREQUENCIES = {"يومي": "D", "أسبوعي": "W", "شهري": "MS"}
+
+def slice_cotton_by_date(df, start_date, end_date):
+    """السجلات بين تاريخين (شاملين) بالبحث الثنائي؛ تعيد شريحة بدون نسخ.
+    تعتمد على أن load_cotton_data يعيد الإطار مرتباً بالتاريخ ثم الوقت (التكلفة log n + حجم النتيجة)"""
+    dates = df['التاريخ'].to_numpy()
+    lo = dates.searchsorted(pd.Timestamp(start_date).to_datetime64(), side='left')
+    hi = dates.searchsorted(pd.Timestamp(end_date).to_datetime64(), side='right')
+    return df.iloc[lo:hi]
+
+def _report_key(df, dimension):
+    if dimension == 'الساعة':
+        return (df['الوقت'] // pd.Timedelta(hours=1)).rename('الساعة')
+    if dimension == 'اليوم':
+        return df['التاريخ'].rename('اليوم')
+    if dimension == 'الأسبوع':
+        return df['التاريخ'].dt.to_period('W').dt.start_time.rename('الأسبوع')
+    if dimension == 'الشهر':
+        return df['التاريخ'].dt.to_period('M').dt.start_time.rename('الشهر')
+    return df[dimension]
+
+@instrumented("reports.build")
+def build_production_report(df, start_date, end_date, dimensions):
+    """الإنتاج (عدد، إجمالي، متوسط، نسبة من الإجمالي) مجمّعاً حسب بعد أو أكثر من REPORT_DIMENSIONS"""
+    fdf = slice_cotton_by_date(df, start_date, end_date)
+    if fdf.empty or not dimensions:
+        return pd.DataFrame()
+    weights = fdf['وزن البالة'].astype('float64')
+    report = weights.groupby([_report_key(fdf, d) for d in dimensions], observed=True).agg(['count', 'sum', 'mean'])
+    report['share'] = report['sum'] / report['sum'].sum() * 100
+    report.columns = ['عدد البالات', 'إجمالي الوزن', 'متوسط الوزن', 'النسبة %']
+    return report.round(2).reset_index()
+
+@instrumented("reports.trend")
+def production_trend(df, start_date, end_date, freq="D", window=7):
+    """إجمالي الوزن لكل فترة (مع الفترات الخالية كأصفار) ومتوسط متحرك على window فترة"""
+    fdf = slice_cotton_by_date(df, start_date, end_date)
     if fdf.empty:
         return pd.DataFrame()
-    stats = fdf.groupby('نوع البالة').agg({
-        'وزن البالة': ['count', 'sum', 'mean'],
-        'المشرف': 'first'
-    }).round(2)
-    stats.columns = ['عدد البالات', 'إجمالي الوزن', 'متوسط الوزن', 'المشرف']
-    return stats.reset_index()
-
-def get_user_permissions(role, perms):
+    totals = fdf['وزن البالة'].astype('float64').groupby(fdf['التاريخ']).sum()
+    index = pd.date_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq="D")
+    totals = totals.reindex(index, fill_value=0.0)
+    if freq != "D":
+        totals = totals.resample(freq).sum()
+    trend = pd.DataFrame({
+        'إجمالي الوزن': totals,
+        'متوسط متحرك': totals.rolling(window, min_periods=1).mean()
+    })
+    trend.index.name = 'الفترة'
+    return trend.round(2)
+
+def compare_with_previous_period(df, start_date, end_date, dimension=None):
+    """مقارنة الفترة المحددة بالفترة السابقة لها بنفس الطول (إجمالياً أو حسب بعد واحد)"""
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    length = end - start + pd.Timedelta(days=1)
+    current = slice_cotton_by_date(df, start, end)
+    previous = slice_cotton_by_date(df, start - length, start - pd.Timedelta(days=1))
+
+    def _totals(part):
+        weights = part['وزن البالة'].astype('float64')
+        if dimension is None:
+            return pd.DataFrame({'عدد البالات': [len(part)], 'إجمالي الوزن': [weights.sum()]}, index=['الإجمالي'])
+        grouped = weights.groupby(_report_key(part, dimension), observed=True)
+        return pd.DataFrame({'عدد البالات': grouped.count(), 'إجمالي الوزن': grouped.sum()})
+
+    cur, prev = _totals(current), _totals(previous)
+    result = cur.join(prev, how='outer', rsuffix=' (السابقة)').fillna(0)
+    result['فرق الوزن'] = result['إجمالي الوزن'] - result['إجمالي الوزن (السابقة)']
+    prev_total = result['إجمالي الوزن (السابقة)'].replace(0, np.nan)
+    result['التغير %'] = result['فرق الوزن'] / prev_total * 100
+    return result.round(2)
+
+def get_user_permissions(username):
+    """صلاحيات الواجهة للمستخدم من الجدول المحسوب مسبقاً"""
+    entry = get_user_entry(username)
+    if entry is None:
+        return _effective_permissions("viewer", {"all_sections": False})
+    return {"can_input": entry["can_input"], "can_view_stats": entry["can_view_stats"]}
+
+def _effective_permissions(role, perms):
     """دالة متوافقة مع الإصدار القديم لتبقى الواجهة تعمل"""
     if isinstance(perms, dict):
         if perms.get("all_sections", False):
@@ -394,101 +2001,673 @@ def get_user_permissions(role, perms):
             return {"can_input": False, "can_view_stats": True}
 
 # ---------- دوال OCR ----------
-def preprocess_image_for_ocr(image_bytes):
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    if img is None:
+# المعالجة واستخراج النص في ocr_pipeline.py (لازم لتشغيلها على مجمع عمليات)
+@st.cache_resource(show_spinner=False)
+def get_ocr_pool():
+    return ocr_pipeline().create_ocr_pool()
+
+def run_on_ocr_pool(images, on_done=None, func=None):
+    """تشغيل دفعة على مجمع OCR المشترك. إذا مات أحد العمال يصبح المجمع معطلاً لبقية العملية،
+    فيُحذف من الكاش ويُنشأ مجمع جديد وتُعاد الدفعة مرة واحدة"""
+    ocr = ocr_pipeline()
+    kwargs = {"func": func} if func else {}
+    try:
+        return ocr.extract_texts_parallel(get_ocr_pool(), images, on_done, **kwargs)
+    except BrokenProcessPool:
+        count_metric("ocr.pool_rebuilds")
+        get_ocr_pool.clear()
+        return ocr.extract_texts_parallel(get_ocr_pool(), images, on_done, **kwargs)
+
+@st.cache_resource(show_spinner=False)
+def ocr_capabilities():
+    """المحرك واللغات ونتيجة اختبار OCR، تُفحص مرة واحدة لكل عملية بدل كل ضغطة زر"""
+    return ocr_pipeline().probe_capabilities()
+
+@instrumented("ocr.extract_batch")
+def extract_texts_from_images(uploads, use_cells=False):
+    """استخراج النص من عدة صور بالتوازي مع شريط تقدم، ودمج الصفوف المستخرجة.
+    مع use_cells تُقرأ الجداول خلية بخلية أولاً، والصور التي لا يُكتشف فيها جدول تُقرأ كنص كامل.
+    يعيد (النص المدمج مع عنوان لكل صورة، الصفوف كـ ParsedRows)"""
+    ocr = ocr_pipeline()
+    progress = st.progress(0.0, text=f"جاري معالجة {len(uploads)} صورة على {ocr.available_cpu_count()} نواة...")
+
+    def on_done(name, done, total):
+        progress.progress(done / total, text=f"✅ {name} ({done}/{total})")
+
+    images = [(u.name, u.getvalue()) for u in uploads]
+    count_metric("bytes_read.ocr_images", sum(len(data) for _, data in images))
+    rows = ParsedRows()
+    if use_cells:
+        # النتائج بترتيب الرفع وليست بالاسم، فصورتان بنفس الاسم لا تكتب إحداهما فوق الأخرى
+        tables = run_on_ocr_pool(images, on_done, func=ocr.extract_table_cells_in_worker)
+        for cells in tables:
+            if cells:
+                rows.add_rows(table_cells_to_rows(cells))
+        images = [image for image, cells in zip(images, tables) if not cells]
+    texts = run_on_ocr_pool(images, on_done) if images else []
+    for text in texts:
+        rows.add_text(text or "")
+    combined = "\n".join(f"# {name}\n{(text or '').strip()}" for (name, _), text in zip(images, texts))
+    return combined, rows
+
+def table_cells_to_rows(cells):
+    """تحويل خلايا الجدول الخام (ناتج extract_table_cells) إلى صفوف بنفس شكل parse_edited_text_to_table"""
+    matcher = get_bale_matcher()
+    now = datetime.now()
+    rows = []
+    for cell in cells:
+        numbers = re.findall(r'\d+(?:\.\d+)?', cell.get("weight", ""))
+        weight = float(numbers[0]) if numbers else None
+        if weight is None or not (0.5 <= weight <= 5000):
+            continue
+        time_text = cell.get("time", "")
+        digits = re.sub(r'\D', '', time_text)
+        if ':' not in time_text and len(digits) in (3, 4):
+            time_text = f"{digits[:-2]}:{digits[-2:]}"
+        extracted_time = extract_time_from_text(time_text)
+        try:
+            record_time = datetime.strptime(extracted_time, '%H:%M').time() if extracted_time else now.time()
+        except ValueError:
+            record_time = now.time()
+        type_text = cell.get("type", "").strip()
+        bale_type = matcher.match(type_text) if type_text else None
+        rows.append({
+            'نوع البالة': bale_type or "غير محدد",
+            'وزن البالة': weight,
+            'التاريخ': now.date(),
+            'الوقت': record_time
+        })
+    return rows
+
+# حروف عربية تُكتب بأكثر من شكل في الأوراق وفي ناتج OCR
+_ARABIC_NORMALIZE = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ی': 'ي', 'ئ': 'ي',
+    'ة': 'ه', 'ک': 'ك', 'ـ': None,
+})
+_ARABIC_DIACRITICS_RE = re.compile(r'[\u064B-\u0652\u0670]')
+_WORD_RE = re.compile(r'[\u0600-\u06FFa-zA-Z]+')
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_TIME_RE = re.compile(r'\b(?:[01]?[0-9]|2[0-3]):[0-5][0-9](?::[0-5][0-9])?\b')
+_LOOSE_TIME_RE = re.compile(r'\b\d{1,2}:\d{2}\b')
+
+def normalize_arabic(text):
+    """توحيد أشكال الألف والياء والتاء المربوطة وحذف التشكيل والتطويل"""
+    return _ARABIC_DIACRITICS_RE.sub('', text).translate(_ARABIC_NORMALIZE).lower()
+
+def _bounded_edit_distance(a, b, limit):
+    """مسافة Levenshtein مع التوقف مبكراً؛ تعيد limit + 1 إذا تجاوزت الحد"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class BaleTypeMatcher:
+    """مطابقة الكلمات مع أنواع البالات: يُبنى مرة واحدة لكل قائمة أنواع.
+
+    الأنواع تُطبَّع وتُفهرس كعبارات من كلمة أو أكثر، فتُطابَق الأنواع متعددة الكلمات
+    مثل "تمشيط غير مغلف" بأطول عبارة أولاً. المطابقة التقريبية بمسافة تحرير محدودة
+    بنسبة cutoff، والنتائج تُحفظ لكل عبارة حتى لا تتكرر الحسابات عبر الأسطر.
+    """
+
+    MAX_MEMO = 20000
+    STOP_WORDS = frozenset({"غير", "بدون", "مع"})  # بعد التطبيع
+
+    def __init__(self, bale_types, cutoff=0.6):
+        self.bale_types = tuple(bale_types)
+        self.cutoff = cutoff
+        self._phrases = {}      # العبارة المطبعة -> النوع
+        self._by_length = {}    # عدد الكلمات -> [(العبارة، النوع)]
+        self._by_token = {}     # كلمة مفردة تخص نوعاً واحداً فقط -> ذلك النوع (احتياطي)
+        token_types = {}
+        for bale_type in self.bale_types:
+            tokens = tuple(normalize_arabic(t) for t in _WORD_RE.findall(bale_type))
+            if not tokens:
+                continue
+            phrase = " ".join(tokens)
+            if phrase in self._phrases:
+                continue
+            self._phrases[phrase] = bale_type
+            self._by_length.setdefault(len(tokens), []).append((phrase, bale_type))
+            for token in tokens:
+                if len(token) >= 3 and token not in self.STOP_WORDS:
+                    token_types.setdefault(token, set()).add(bale_type)
+        # كلمة مشتركة بين نوعين ("مغلف"، "تمشيط") لا تحدد النوع وحدها
+        self._by_token = {token: types.pop() for token, types in token_types.items() if len(types) == 1}
+        self.max_words = max(self._by_length, default=0)
+        self._memo = {}          # عبارة مطبعة -> نوع
+        self._words_memo = {}    # كلمات السطر كما هي -> نوع
+
+    def _lookup(self, phrase, n_words):
+        """نوع العبارة المطبعة (مطابقة تامة ثم تقريبية) أو None"""
+        if phrase in self._memo:
+            return self._memo[phrase]
+        result = self._phrases.get(phrase)
+        if result is None and phrase.startswith("ال") and len(phrase) > 4:
+            result = self._phrases.get(phrase[2:])
+        if result is None:
+            limit = int((1 - self.cutoff) * len(phrase))
+            best = limit + 1
+            for candidate, bale_type in self._by_length.get(n_words, ()):
+                distance = _bounded_edit_distance(phrase, candidate, min(limit, best - 1))
+                if distance < best:
+                    best, result = distance, bale_type
+        if len(self._memo) >= self.MAX_MEMO:
+            self._memo.clear()
+        self._memo[phrase] = result
+        return result
+
+    def match_words(self, words):
+        """أول نوع في سلسلة الكلمات، مع تفضيل أطول عبارة عند كل موضع"""
+        key = tuple(words)
+        if key in self._words_memo:
+            return self._words_memo[key]
+        result = self._match_tokens([normalize_arabic(w) for w in words])
+        if len(self._words_memo) >= self.MAX_MEMO:
+            self._words_memo.clear()
+        self._words_memo[key] = result
+        return result
+
+    def _match_tokens(self, tokens):
+        for i in range(len(tokens)):
+            for n in range(min(self.max_words, len(tokens) - i), 0, -1):
+                result = self._lookup(" ".join(tokens[i:i + n]), n)
+                if result:
+                    return result
+        for token in tokens:
+            if token in self._by_token:
+                return self._by_token[token]
         return None
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    (h,w) = gray.shape
-    scaled = cv2.resize(gray, (w*2, h*2), interpolation=cv2.INTER_CUBIC)
-    denoised = cv2.medianBlur(scaled, 3)
-    thresh = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 2)
-    return thresh
-
-def extract_raw_text_from_image(image_bytes):
-    processed = preprocess_image_for_ocr(image_bytes)
-    if processed is None:
-        return ""
-    config = '--psm 6 -c preserve_interword_spaces=1'
-    text = pytesseract.image_to_string(processed, lang='ara+eng', config=config)
-    return text
+
+    def match(self, text):
+        return self.match_words(_WORD_RE.findall(text))
+
+@lru_cache(maxsize=8)
+def get_bale_matcher(bale_types=None, cutoff=0.6):
+    """مطابق مشترك لكل قائمة أنواع (tuple)؛ الافتراضي قائمة get_bale_types"""
+    return BaleTypeMatcher(bale_types if bale_types is not None else get_bale_types(), cutoff)
 
 def match_bale_type(word, bale_types, cutoff=0.6):
-    if word in bale_types:
-        return word
-    matches = get_close_matches(word, bale_types, n=1, cutoff=cutoff)
-    if matches:
-        return matches[0]
-    for bt in bale_types:
-        if bt in word or word in bt:
-            return bt
-    return None
+    return get_bale_matcher(tuple(bale_types), cutoff).match(word)
+
+def _find_time(text):
+    return _TIME_RE.search(text) or _LOOSE_TIME_RE.search(text)
 
 def extract_time_from_text(text):
-    patterns = [
-        r'\b([01]?[0-9]|2[0-3]):[0-5][0-9](?::[0-5][0-9])?\b',
-        r'\b(\d{1,2}:\d{2})\b'
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            time_str = match.group(0)
-            if len(time_str.split(':')[0]) == 1:
-                time_str = '0' + time_str
-            return time_str
-    return None
+    match = _find_time(text)
+    if not match:
+        return None
+    time_str = match.group(0)
+    if len(time_str.split(':')[0]) == 1:
+        time_str = '0' + time_str
+    return time_str
 
-def parse_edited_text_to_table(edited_text):
-    """يحول النص الذي قام المستخدم بتحريره إلى جدول"""
-    lines = edited_text.split('\n')
-    bale_types = get_bale_types()
-    rows = []
-    for line in lines:
-        line = line.strip()
-        if not line:
+_UNITS = {'kg', 'كجم', 'كغ'}
+UNKNOWN_BALE_TYPE = "غير محدد"
+
+def _time_to_seconds(match):
+    """ثواني منذ منتصف الليل من نتيجة _find_time، أو None إذا كان الوقت غير صالح"""
+    parts = [int(p) for p in match.group(0).split(':')]
+    hour, minute, second = (parts + [0])[:3]
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    return hour * 3600 + minute * 60 + second
+
+def _parse_text_line(line, matcher):
+    """تحليل سطر واحد؛ يعيد (الوزن، الثواني أو None، النوع) أو (None, None, سبب الرفض)"""
+    time_match = _find_time(line)
+    time_span = time_match.span() if time_match else (0, 0)
+    weight, weight_span = None, None
+    for num in _NUMBER_RE.finditer(line):
+        if time_span[0] <= num.start() < time_span[1]:
             continue
-        numbers = re.findall(r'\b(\d+(?:\.\d+)?)\b', line)
-        weight = None
-        for num in numbers:
-            val = float(num)
-            if 0.5 <= val <= 5000:
-                weight = val
+        val = float(num.group(0))
+        if 0.5 <= val <= 5000:
+            if weight is not None:
+                weight, weight_span = val, num.span()
                 break
+            weight, weight_span = val, num.span()
+            # عدد صحيح في أول السطر غالباً رقم مسلسل: يُستخدم فقط إن لم يوجد رقم آخر
+            if num.start() > 0 or '.' in num.group(0):
+                break
+    if weight is None:
+        return None, None, "لا يوجد وزن بين 0.5 و 5000"
+    seconds = _time_to_seconds(time_match) if time_match else None
+    if time_match and seconds is None:
+        # وقت مثل 25:61: رفض السطر بدل استبداله بوقت التحليل
+        return None, None, "وقت غير صحيح"
+    # إزالة الوزن والوقت للحصول على النوع
+    spans = sorted(sp for sp in (weight_span, time_match.span() if time_match else None) if sp)
+    line_cleaned, pos = [], 0
+    for a, b in spans:
+        line_cleaned.append(line[pos:a])
+        pos = b
+    line_cleaned.append(line[pos:])
+    words = [w for w in _WORD_RE.findall(" ".join(line_cleaned)) if w.lower() not in _UNITS]
+    bale_type = matcher.match_words(words) or (words[0] if words else UNKNOWN_BALE_TYPE)
+    return weight, seconds, bale_type
+
+def _iter_text_lines(source):
+    """أسطر نص أو ملف (نصي أو ثنائي) واحداً تلو الآخر دون تقسيم المحتوى كله إلى قائمة"""
+    if isinstance(source, str):
+        yield from io.StringIO(source)
+    elif isinstance(source, io.TextIOBase):
+        yield from source
+    else:
+        stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        wrapper = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace")
+        try:
+            yield from wrapper
+        finally:
+            wrapper.detach()
+
+def iter_parsed_chunks(source, categories, chunk_size=None, first_line=1):
+    """محلل متدفق: يقرأ الأسطر من source ويعيد دفعات بأعمدة مكتوبة الأنواع.
+
+    كل دفعة قاموس فيه: line (int32)، weight (float32)، seconds (int32، ثواني الوقت
+    أو وقت بدء التحليل إن لم يُذكر)، type (int16، فهرس في categories)، rejected
+    (قائمة (رقم السطر، السبب، النص)) و last_line. الأنواع غير المعروفة تُضاف إلى
+    categories حتى 1000 نوع، وبعدها تُعد "غير محدد". الأسطر الفارغة وعناوين الصور (#) تُتجاهل.
+    """
+    chunk_size = chunk_size or APP_CONFIG["PARSE_CHUNK_ROWS"]
+    matcher = get_bale_matcher()
+    if UNKNOWN_BALE_TYPE not in categories:
+        categories.append(UNKNOWN_BALE_TYPE)
+    codes = {name: i for i, name in enumerate(categories)}
+    now = datetime.now()
+    now_seconds = now.hour * 3600 + now.minute * 60 + now.second
+
+    def new_buffers():
+        return (np.empty(chunk_size, np.int32), np.empty(chunk_size, np.float32),
+                np.empty(chunk_size, np.int32), np.empty(chunk_size, np.int16))
+
+    lines, weights, seconds, types = new_buffers()
+    n, rejected, line_no = 0, [], first_line - 1
+    for line_no, raw in enumerate(_iter_text_lines(source), first_line):
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        weight, secs, bale_type = _parse_text_line(line, matcher)
         if weight is None:
+            rejected.append((line_no, bale_type, line[:120]))
             continue
-        extracted_time = extract_time_from_text(line)
-        if extracted_time:
-            try:
-                record_time = datetime.strptime(extracted_time, '%H:%M').time()
-            except:
-                record_time = datetime.now().time()
-        else:
-            record_time = datetime.now().time()
-        # إزالة الوزن والوقت للحصول على النوع
-        line_cleaned = line
-        line_cleaned = re.sub(r'\b' + re.escape(str(weight)) + r'\b', '', line_cleaned)
-        if extracted_time:
-            line_cleaned = re.sub(r'\b' + re.escape(extracted_time) + r'\b', '', line_cleaned)
-        line_cleaned = re.sub(r'\s*(?:kg|كجم|كغ)\s*', ' ', line_cleaned, flags=re.I)
-        words = re.findall(r'[\u0600-\u06FFa-zA-Z]+', line_cleaned)
-        bale_type = None
-        for w in words:
-            matched = match_bale_type(w, bale_types)
-            if matched:
-                bale_type = matched
-                break
-        if not bale_type and words:
-            bale_type = words[0]
-        else:
-            bale_type = "غير محدد"
-        rows.append({
-            'نوع البالة': bale_type,
-            'وزن البالة': weight,
-            'التاريخ': datetime.now().date(),
-            'الوقت': record_time
+        code = codes.get(bale_type)
+        if code is None:
+            if len(categories) < 1000:
+                code = codes[bale_type] = len(categories)
+                categories.append(bale_type)
+            else:
+                code = codes[UNKNOWN_BALE_TYPE]
+        lines[n], weights[n], types[n] = line_no, weight, code
+        seconds[n] = now_seconds if secs is None else secs
+        n += 1
+        if n == chunk_size:
+            yield {"line": lines, "weight": weights, "seconds": seconds, "type": types,
+                   "rejected": rejected, "last_line": line_no}
+            lines, weights, seconds, types = new_buffers()
+            n, rejected = 0, []
+    if n or rejected:
+        yield {"line": lines[:n], "weight": weights[:n], "seconds": seconds[:n], "type": types[:n],
+               "rejected": rejected, "last_line": line_no}
+
+class ParsedRows:
+    """الصفوف المستخرجة محفوظة كمصفوفات NumPy مضغوطة (نحو 14 بايت للصف) بدل قاموس لكل صف،
+    لتُخزن في session_state ويعرضها المحرر صفحة صفحة. يُحتفظ بعينة محدودة من الأسطر المرفوضة."""
+
+    MAX_REJECTED_SAMPLES = 500
+
+    def __init__(self):
+        self.categories = list(get_bale_types()) + [UNKNOWN_BALE_TYPE]
+        self.date = datetime.now().date()
+        self.lines_read = 0
+        self.rejected = []
+        self.rejected_count = 0
+        self._chunks = []
+        self._columns = None
+
+    def _add_chunk(self, chunk):
+        self._chunks.append({k: chunk[k] for k in ("line", "weight", "seconds", "type")})
+        self._columns = None
+        self.rejected_count += len(chunk["rejected"])
+        room = self.MAX_REJECTED_SAMPLES - len(self.rejected)
+        if room > 0:
+            self.rejected.extend(chunk["rejected"][:room])
+
+    @instrumented("parse.add_text")
+    def add_text(self, source, chunk_size=None):
+        """تحليل نص أو ملف نصي مرفوع بالتدفق وإضافة نتائجه"""
+        for chunk in iter_parsed_chunks(source, self.categories, chunk_size, self.lines_read + 1):
+            self._add_chunk(chunk)
+            self.lines_read = chunk["last_line"]
+        return self
+
+    def add_rows(self, rows):
+        """إضافة صفوف جاهزة (مثل ناتج table_cells_to_rows)"""
+        codes = {name: i for i, name in enumerate(self.categories)}
+        for r in rows:
+            if r['نوع البالة'] not in codes:
+                codes[r['نوع البالة']] = len(self.categories)
+                self.categories.append(r['نوع البالة'])
+        start = self.lines_read + 1
+        self.lines_read += len(rows)
+        self._add_chunk({
+            "line": np.arange(start, start + len(rows), dtype=np.int32),
+            "weight": np.array([r['وزن البالة'] for r in rows], dtype=np.float32),
+            "seconds": np.array([t.hour * 3600 + t.minute * 60 + t.second for t in (r['الوقت'] for r in rows)],
+                                dtype=np.int32),
+            "type": np.array([codes[r['نوع البالة']] for r in rows], dtype=np.int16),
+            "rejected": []
         })
-    return rows
+        return self
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            if len(self._chunks) == 1:
+                self._columns = self._chunks[0]
+            else:
+                keys = ("line", "weight", "seconds", "type")
+                self._columns = {k: np.concatenate([c[k] for c in self._chunks]) if self._chunks
+                                 else np.empty(0, np.int32) for k in keys}
+            self._chunks = [self._columns]
+        return self._columns
+
+    def __len__(self):
+        return sum(len(c["line"]) for c in self._chunks)
+
+    def frame(self, start=0, stop=None):
+        """الصفوف [start:stop] كجدول بنفس أعمدة parse_edited_text_to_table"""
+        cols = {k: v[start:stop] for k, v in self.columns.items()}
+        return pd.DataFrame({
+            'نوع البالة': np.asarray(self.categories, dtype=object)[cols["type"]],
+            'وزن البالة': cols["weight"].astype(np.float64).round(3),
+            'التاريخ': self.date,
+            'الوقت': pd.to_datetime(cols["seconds"], unit='s').time
+        }, index=pd.RangeIndex(start, start + len(cols["line"])))
+
+    def rejected_frame(self):
+        return pd.DataFrame(self.rejected, columns=['السطر', 'السبب', 'النص'])
+
+def store_extracted_rows(rows):
+    """حفظ نتيجة استخراج جديدة في الجلسة وإلغاء تعديلات الصفحات السابقة"""
+    st.session_state['extracted_rows'] = rows
+    st.session_state['extracted_edits'] = {}
+    st.session_state.pop('extracted_view', None)
+
+def extracted_page_frame(rows, page, page_size):
+    """صفحة من الصفوف المستخرجة بأعمدة المحرر"""
+    frame = rows.frame(page * page_size, (page + 1) * page_size)
+    frame['المشرف'] = get_supervisors()[0]
+    frame['ملاحظات'] = ""
+    return frame[['نوع البالة', 'وزن البالة', 'التاريخ', 'الوقت', 'المشرف', 'ملاحظات']]
+
+def iter_extracted_pages(rows, edits, page_size):
+    """الصفوف للحفظ صفحة صفحة: الصفحات المعدلة من المحرر وبقية الصفحات من المصفوفات المضغوطة"""
+    for page in range((len(rows) - 1) // page_size + 1):
+        yield edits[page] if page in edits else extracted_page_frame(rows, page, page_size)
+
+@instrumented("parse.text_to_table")
+def parse_edited_text_to_table(edited_text):
+    """يحول النص الذي قام المستخدم بتحريره إلى جدول (قائمة صفوف).
+    للنصوص الكبيرة استخدم ParsedRows/iter_parsed_chunks مباشرة"""
+    return ParsedRows().add_text(edited_text).frame().to_dict("records")
+
+# ---------- تبويب سجل البالات ----------
+def _history_view(key):
+    """حالة التصفح في الجلسة: مؤشرات بداية الصفحات التي زارها المستخدم والصفحة المعروضة.
+    الصفحة تُقرأ عند تغيير المرشحات أو التنقل أو الحفظ فقط، حتى يبقى أساس المحرر ثابتاً"""
+    view = st.session_state.get('history_view')
+    if view is None or view["key"] != key:
+        view = {"key": key, "cursors": [None], "page": None, "next": None,
+                "seq": st.session_state.get('history_view_seq', 0) + 1}
+        st.session_state['history_view'] = view
+        st.session_state['history_view_seq'] = view["seq"]
+    if view["page"] is None:
+        filters, sort, page_size = key
+        page, next_cursor = query_cotton_page(dict(filters), sort, view["cursors"][-1], page_size)
+        view["page"], view["next"] = history_editor_frame(page), next_cursor
+        view["total"] = count_cotton_records(dict(filters))
+    return view
+
+def _reload_history_page(view):
+    view["page"] = None
+    view["seq"] = st.session_state['history_view_seq'] = st.session_state.get('history_view_seq', 0) + 1
+
+def bale_log_tab(can_edit):
+    st.header("📜 سجل البالات")
+    lo, hi = cotton_date_bounds()
+    if lo is None:
+        st.info("لا توجد بيانات")
+        return
+    lo, hi = pd.Timestamp(lo).date(), pd.Timestamp(hi).date()
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        start = st.date_input("من", max(lo, hi - timedelta(days=30)), min_value=lo, max_value=hi, key="history_start")
+    with col2:
+        end = st.date_input("إلى", hi, min_value=lo, max_value=hi, key="history_end")
+    with col3:
+        sort = st.selectbox("الترتيب", list(HISTORY_SORTS.keys()), key="history_sort")
+    with col4:
+        page_size = st.selectbox("صفوف الصفحة", [50, 100, 200], key="history_page_size",
+                                 index=[50, 100, 200].index(APP_CONFIG["HISTORY_PAGE_ROWS"]))
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        shifts = st.multiselect("الوردية", list(APP_CONFIG["SHIFTS"].keys()), key="history_shifts")
+    with col2:
+        supervisors = st.multiselect("المشرف", get_supervisors(), key="history_supervisors")
+    with col3:
+        bale_types = st.multiselect("نوع البالة", get_bale_types(), key="history_types")
+
+    filters = {"start": start, "end": end, "shift": shifts, "supervisor": supervisors, "bale_type": bale_types}
+    key = (tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in filters.items()), sort, page_size)
+    view = _history_view(key)
+    total = view["total"]
+    page_no = len(view["cursors"])
+    pages = max(1, (total - 1) // page_size + 1)
+    st.caption(f"الصفحة {page_no} من {pages} | {total:,} سجل")
+
+    nav1, nav2, nav3, nav4 = st.columns(4)
+    if nav1.button("⏮ الأولى", disabled=page_no == 1):
+        view["cursors"] = [None]
+        _reload_history_page(view)
+        st.rerun()
+    if nav2.button("◀ السابقة", disabled=page_no == 1):
+        view["cursors"].pop()
+        _reload_history_page(view)
+        st.rerun()
+    if nav3.button("التالية ▶", disabled=view["next"] is None):
+        view["cursors"].append(view["next"])
+        _reload_history_page(view)
+        st.rerun()
+    if nav4.button("🔄 تحديث", key="history_refresh"):
+        _reload_history_page(view)
+        st.rerun()
+
+    base = view["page"]
+    if not can_edit:
+        st.dataframe(base, use_container_width=True)
+        return
+    edited = st.data_editor(
+        base,
+        num_rows="fixed",
+        disabled=["الوردية"],
+        column_config={
+            "التاريخ": st.column_config.DateColumn("التاريخ", required=True),
+            "الوقت": st.column_config.TimeColumn("الوقت", required=True),
+            "الوردية": st.column_config.TextColumn("الوردية", help="تُحسب من الوقت"),
+            "المشرف": st.column_config.SelectboxColumn("المشرف", options=get_supervisors(), required=True),
+            "نوع البالة": st.column_config.SelectboxColumn("نوع البالة", options=get_bale_types(), required=True),
+            "وزن البالة": st.column_config.NumberColumn("الوزن (كجم)", min_value=0.0, step=0.1, required=True),
+            "ملاحظات": st.column_config.TextColumn("ملاحظات"),
+        },
+        use_container_width=True,
+        key=f"history_editor_{view['seq']}"
+    )
+    changed = (edited.ne(base) & ~(edited.isna() & base.isna())).any(axis=1)
+    if not changed.any():
+        return
+    st.caption(f"{int(changed.sum())} سجل معدل في هذه الصفحة")
+    if st.button("💾 حفظ التعديلات", key="history_save"):
+        valid, rejected = normalize_cotton_batch(edited[changed])
+        if not rejected.empty:
+            st.error(f"يوجد {len(rejected)} صفاً غير صالح")
+            st.dataframe(rejected)
+        else:
+            valid.index = edited.index[changed]
+            user = st.session_state.get("username")
+            if update_cotton_records(valid, f"تعديل {len(valid)} سجل بواسطة {user}"):
+                st.success(f"تم حفظ تعديل {len(valid)} سجل")
+                _reload_history_page(view)
+                st.rerun()
+
+def export_section():
+    st.subheader("⬇️ تصدير البيانات")
+    lo, hi = cotton_date_bounds()
+    if lo is None:
+        return
+    lo, hi = pd.Timestamp(lo).date(), pd.Timestamp(hi).date()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        start = st.date_input("من", max(lo, hi - timedelta(days=365)), min_value=lo, max_value=hi, key="export_start")
+    with col2:
+        end = st.date_input("إلى", hi, min_value=lo, max_value=hi, key="export_end")
+    with col3:
+        formats = [f for f in EXPORT_FORMATS if f != "Parquet" or PARQUET_AVAILABLE]
+        fmt_label = st.selectbox("الصيغة", formats, key="export_format")
+    col1, col2 = st.columns(2)
+    with col1:
+        bale_types = st.multiselect("نوع البالة", get_bale_types(), key="export_types")
+    with col2:
+        supervisors = st.multiselect("المشرف", get_supervisors(), key="export_supervisors")
+    with_summary = st.checkbox("إضافة الملخص الشهري", value=True, key="export_summary")
+
+    if st.button("📦 تجهيز الملف"):
+        ext, mime = EXPORT_FORMATS[fmt_label]
+        filters = {"start": start, "end": end, "bale_type": bale_types, "supervisor": supervisors}
+        discard_export_file(st.session_state.pop('export_file', None))
+        sweep_export_files()
+        fd, path = tempfile.mkstemp(prefix="luva_export_", suffix=f".{ext}")
+        os.close(fd)
+        try:
+            with st.spinner("جاري التصدير..."):
+                rows, summary = export_cotton_range(filters, ext, path, with_summary)
+            # الجلسة تحفظ مسار الملف فقط؛ البايتات تُقرأ عند ضغط زر التنزيل
+            st.session_state['export_file'] = {
+                "name": f"luva_{start}_{end}.{ext}", "path": path, "size": os.path.getsize(path),
+                "mime": mime, "rows": rows,
+                # في xlsx الملخص ورقة داخل الملف؛ في الصيغ الأخرى ملف CSV منفصل (صف لكل شهر ونوع)
+                "summary": None if summary is None or ext == "xlsx"
+                else summary.to_csv(index=False).encode("utf-8-sig"),
+            }
+        except Exception as e:
+            os.remove(path)
+            st.error(f"فشل التصدير: {e}")
+
+    export = st.session_state.get('export_file')
+    if export:
+        if not os.path.exists(export["path"]):
+            # حُذف مع ملفات الجلسات المنتهية (انظر sweep_export_files)
+            st.session_state.pop('export_file', None)
+            st.caption(f"انتهت صلاحية {export['name']}، جهّز الملف من جديد")
+            return
+        st.caption(f"{export['rows']:,} سجل | {export['size'] / 2**20:.1f} MB")
+        st.download_button("💾 تنزيل الملف", export_file_reader(export["path"]), file_name=export["name"],
+                           mime=export["mime"], key="export_download")
+        if export["summary"] is not None:
+            st.download_button("💾 تنزيل الملخص الشهري", export["summary"],
+                               file_name=export["name"].rsplit(".", 1)[0] + "_summary.csv", mime="text/csv")
+
+def export_file_reader(path):
+    """دالة يستدعيها زر التنزيل (في خيط منفصل عند الضغط): تقرأ الملف المؤقت.
+    الملف يبقى حتى يمكن إعادة التنزيل؛ يُحذف عند تجهيز ملف جديد أو الخروج (discard_export_file)"""
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+def discard_export_file(export):
+    """حذف ملف التصدير الحالي للجلسة (عند تجهيز ملف جديد أو الخروج)"""
+    if export and os.path.exists(export["path"]):
+        os.remove(export["path"])
+
+def sweep_export_files(max_age_hours=None):
+    """حذف ملفات التصدير المؤقتة الأقدم من EXPORT_FILE_MAX_AGE_HOURS: جلسات أُغلقت دون خروج
+    لا تحذف ملفاتها. يعيد عدد الملفات المحذوفة"""
+    max_age = (max_age_hours or APP_CONFIG["EXPORT_FILE_MAX_AGE_HOURS"]) * 3600
+    removed = 0
+    for entry in os.scandir(tempfile.gettempdir()):
+        if not entry.name.startswith("luva_export_"):
+            continue
+        try:
+            if time.time() - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+# ---------- تبويب التشخيص (خاص بالمدير) ----------
+def diagnostics_tab():
+    st.header("🩺 تشخيص زمن التشغيل")
+    if not METRICS_ENABLED:
+        st.info("القياس معطل (METRICS_ENABLED في APP_CONFIG)")
+        return
+    snapshot = metrics_snapshot()
+    reruns = list(_metrics_registry()["reruns"])
+    st.caption(f"منذ {timedelta(seconds=int(snapshot['uptime_seconds']))} | عدد مرات التشغيل: {snapshot['counters'].get('reruns', 0)}")
+
+    if reruns:
+        last = reruns[-1]
+        st.subheader(f"آخر تشغيل: {last['total_ms']:.1f} مللي ثانية")
+        st.dataframe(pd.DataFrame(
+            [("  " * depth + name, round(ms, 2)) for name, depth, ms in last["phases"]],
+            columns=["المرحلة", "الزمن (مللي ثانية)"]
+        ), use_container_width=True)
+        totals = pd.Series([r["total_ms"] for r in reruns])
+        st.caption(f"آخر {len(reruns)} تشغيل: الوسيط {totals.median():.1f} | الأقصى {totals.max():.1f} مللي ثانية")
+
+    st.subheader("الدوال")
+    if snapshot["timers"]:
+        timers = pd.DataFrame.from_dict(snapshot["timers"], orient="index")
+        timers["total"] *= 1000
+        timers["max"] *= 1000
+        timers["avg"] = timers["total"] / timers["count"]
+        timers = timers.rename(columns={"count": "الاستدعاءات", "total": "الإجمالي (مللي ثانية)",
+                                        "avg": "المتوسط", "max": "الأقصى", "errors": "الأخطاء"})
+        st.dataframe(timers.sort_values("الإجمالي (مللي ثانية)", ascending=False).round(2), use_container_width=True)
+
+    st.subheader("العدادات (البايتات والكاش)")
+    if snapshot["counters"]:
+        st.dataframe(pd.Series(snapshot["counters"], name="القيمة").sort_index(), use_container_width=True)
+
+    cached = _cotton_cache()["df"]
+    if cached is not None:
+        st.caption(f"لقطة السجلات المشتركة: {len(cached):,} سجل | "
+                   f"{cached.memory_usage(deep=True).sum() / 2**20:.1f} MB | "
+                   f"إصدار البيانات {_cotton_cache()['data_version']}")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("💾 تصدير المقاييس"):
+            try:
+                export_metrics()
+                st.success(f"تم الحفظ في {APP_CONFIG['METRICS_JSONL_FILE']} و {APP_CONFIG['METRICS_PROM_FILE']}")
+            except OSError as e:
+                st.error(f"فشل التصدير: {e}")
+    with col2:
+        st.download_button("⬇️ Prometheus", metrics_to_prometheus(snapshot), file_name="luva_metrics.prom")
+    with col3:
+        if st.button("♻️ تصفير المقاييس"):
+            reset_metrics()
+            st.rerun()
 
 # ---------- تبويب إدارة المستخدمين (خاص بالمدير) ----------
 def admin_users_management_tab():
@@ -581,151 +2760,228 @@ def admin_users_management_tab():
 # ===============================
 # الواجهة الرئيسية
 # ===============================
-st.set_page_config(page_title=APP_CONFIG["APP_TITLE"], layout="wide")
+def main():
+    st.set_page_config(page_title=APP_CONFIG["APP_TITLE"], layout="wide")
+    with rerun_trace():
+        render_app()
 
-with st.sidebar:
-    st.header("الجلسة")
-    if not st.session_state.get("logged_in"):
-        if not login_ui():
-            st.stop()
-    else:
-        state = cleanup_sessions(load_state())
-        user = st.session_state.username
-        role = st.session_state.user_role
-        rem = remaining_time(state, user)
-        if rem:
-            m, s = divmod(int(rem.total_seconds()), 60)
-            st.success(f"👋 {user} | {role} | ⏳ {m:02d}:{s:02d}")
+def render_app():
+    with st.sidebar, metric_phase("ui.sidebar"):
+        st.header("الجلسة")
+        if not st.session_state.get("logged_in"):
+            if not login_ui():
+                st.stop()
         else:
-            logout_action()
-    st.markdown("---")
-    if st.button("🔄 تحديث من GitHub"):
-        if fetch_from_github_requests():
-            st.rerun()
-    if st.button("🗑 مسح الكاش"):
-        st.cache_data.clear()
-        st.rerun()
-    st.markdown("---")
-    if st.button("🚪 تسجيل الخروج"):
-        logout_action()
-
-cotton_df = load_cotton_data()
-st.title(f"{APP_CONFIG['APP_ICON']} {APP_CONFIG['APP_TITLE']}")
-
-# حساب الصلاحيات للواجهة
-perms = get_user_permissions(
-    st.session_state.get("user_role", "viewer"),
-    st.session_state.get("user_permissions", {"all_sections": False})
-)
-
-tabs_list = []
-if perms["can_input"]:
-    tabs_list.append("📥 إدخال البيانات")
-    if OCR_AVAILABLE:
-        tabs_list.append("📸 استخراج جدول من صورة")
-    else:
-        if "ocr_warning_shown" not in st.session_state:
-            st.sidebar.info("🔍 لتفعيل مسح الجدول: ثبّت pytesseract و opencv")
-            st.session_state.ocr_warning_shown = True
-if perms["can_view_stats"]:
-    tabs_list.append("📊 عرض الإحصائيات")
-
-# إضافة تبويب إدارة المستخدمين للمدير فقط
-if is_admin(st.session_state.get("username")):
-    tabs_list.append("👥 إدارة المستخدمين")
-
-if not tabs_list:
-    tabs_list = ["📊 عرض الإحصائيات"]
-
-tabs = st.tabs(tabs_list)
-idx = 0
-
-# تبويب الإدخال اليدوي
-if perms["can_input"] and "📥 إدخال البيانات" in tabs_list:
-    with tabs[idx]:
-        st.header("إدخال بيانات البالات يدوياً")
-        st.info(f"الوردية الحالية: {get_current_shift()} - {datetime.now()}")
-        with st.form("manual"):
-            col1, col2 = st.columns(2)
-            with col1:
-                sup = st.selectbox("المشرف", get_supervisors())
-                btype = st.selectbox("نوع البالة", get_bale_types())
-            with col2:
-                w = st.number_input("الوزن (كجم)", min_value=0.0, step=0.1)
-                note = st.text_input("ملاحظات")
-            if st.form_submit_button("حفظ"):
-                if w > 0:
-                    _, new_df = add_new_record(cotton_df, sup, btype, w, note)
-                    if save_cotton_data(new_df):
-                        st.success("تم الحفظ")
+            user = st.session_state.username
+            role = st.session_state.user_role
+            rem = remaining_time(st.session_state.get("session_token"))
+            if rem:
+                m, s = divmod(int(rem.total_seconds()), 60)
+                st.success(f"👋 {user} | {role} | ⏳ {m:02d}:{s:02d}")
+            else:
+                logout_action()
+        st.markdown("---")
+        github_sync = get_github_sync()
+        if github_sync:
+            if github_sync.last_error:
+                st.warning(f"تم الحفظ محلياً فقط: {github_sync.last_error}")
+            elif github_sync.pending_count():
+                st.caption("⏳ توجد تغييرات بانتظار الرفع إلى GitHub")
+            elif github_sync.last_push:
+                st.caption(f"☁️ آخر رفع إلى GitHub: {github_sync.last_push:%H:%M:%S}")
+        if get_snapshot_compactor().last_error:
+            st.warning(f"فشل تحديث نسخة Excel: {get_snapshot_compactor().last_error}")
+        if st.button("🔄 تحديث من GitHub"):
+            if github_sync:
+                try:
+                    count = pull_cotton_shards()
+                    st.success(f"تم تحديث {count} شهر من GitHub" if count else "البيانات محدثة")
+                    if count:
                         st.rerun()
+                except Exception as e:
+                    st.error(f"فشل التحديث: {e}")
+            elif fetch_from_github_requests():
+                st.rerun()
+        if st.button("📤 تصدير ورفع Excel"):
+            if export_cotton_snapshot("تصدير يدوي"):
+                st.success("تم تصدير luva.xlsx")
+        if st.button("🗑 مسح الكاش"):
+            _cotton_cache.clear()
+            st.rerun()
+        st.markdown("---")
+        if st.button("🚪 تسجيل الخروج"):
+            logout_action()
+
+    if get_github_sync():
+        try:
+            initial_shard_sync()
+        except Exception as e:
+            st.sidebar.warning(f"تعذرت المزامنة مع GitHub: {type(e).__name__}: {e}")
+    cotton_df = load_cotton_data()
+    st.title(f"{APP_CONFIG['APP_ICON']} {APP_CONFIG['APP_TITLE']}")
+
+    # حساب الصلاحيات للواجهة
+    perms = get_user_permissions(st.session_state.get("username"))
+
+    tabs_list = []
+    if perms["can_input"]:
+        tabs_list.append("📥 إدخال البيانات")
+        if OCR_AVAILABLE:
+            tabs_list.append("📸 استخراج جدول من صورة")
+        else:
+            if "ocr_warning_shown" not in st.session_state:
+                st.sidebar.info("🔍 لتفعيل مسح الجدول: ثبّت pytesseract و opencv")
+                st.session_state.ocr_warning_shown = True
+    if perms["can_view_stats"]:
+        tabs_list.append("📊 عرض الإحصائيات")
+    if perms["can_view_stats"] or perms["can_input"]:
+        tabs_list.append("📜 سجل البالات")
+
+    # إضافة تبويب إدارة المستخدمين للمدير فقط
+    if is_admin(st.session_state.get("username")):
+        tabs_list.append("👥 إدارة المستخدمين")
+        tabs_list.append("🩺 التشخيص")
+
+    if not tabs_list:
+        tabs_list = ["📊 عرض الإحصائيات"]
+
+    tabs = st.tabs(tabs_list)
+    idx = 0
+
+    # تبويب الإدخال اليدوي
+    if perms["can_input"] and "📥 إدخال البيانات" in tabs_list:
+        with tabs[idx], metric_phase("ui.tab.input"):
+            st.header("إدخال بيانات البالات يدوياً")
+            st.info(f"الوردية الحالية: {get_current_shift()} - {datetime.now()}")
+            with st.form("manual"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    sup = st.selectbox("المشرف", get_supervisors())
+                    btype = st.selectbox("نوع البالة", get_bale_types())
+                with col2:
+                    w = st.number_input("الوزن (كجم)", min_value=0.0, step=0.1)
+                    note = st.text_input("ملاحظات")
+                if st.form_submit_button("حفظ"):
+                    if w > 0:
+                        new_record = build_new_record(sup, btype, w, note)
+                        if append_cotton_records([new_record]):
+                            st.success("تم الحفظ")
+                            st.rerun()
+                    else:
+                        st.error("أدخل وزناً صحيحاً")
+        idx += 1
+
+    # تبويب استخراج الجدول من الصورة
+    if perms["can_input"] and OCR_AVAILABLE and "📸 استخراج جدول من صورة" in tabs_list:
+        with tabs[idx], metric_phase("ui.tab.ocr"):
+            st.header("رفع صورة واستخراج البيانات (مع التحرير اليدوي)")
+            st.markdown("""
+            **الطريقة:**
+            1. ارفع الصورة.
+            2. اضغط "استخراج النص الخام" لرؤية النص المستخرج.
+            3. **قم بتحرير النص** يدويًا: احذف الأحرف المشوشة، واترك الأرقام (الوزن) والكلمات (نوع البالة). مثال لكل سطر: `قماش 250 08:30`
+            4. اضغط "تحويل النص المعدل إلى جدول".
+            5. راجع الجدول وقم بتعديله ثم احفظه.
+            """)
+
+            # زر اختبار OCR (النتيجة محفوظة لكل عملية؛ "إعادة الفحص" بعد تثبيت لغة أو محرك)
+            test_col, retest_col = st.columns([1, 1])
+            run_test = test_col.button("🧪 اختبار OCR")
+            if retest_col.button("🔄 إعادة الفحص"):
+                ocr_capabilities.clear()
+                run_test = True
+            if run_test:
+                caps = ocr_capabilities()
+                if caps["self_test"]:
+                    st.success(f"✅ OCR يعمل بشكل صحيح! (المحرك: {caps['engine']} {caps['version'] or ''})")
                 else:
-                    st.error("أدخل وزناً صحيحاً")
-    idx += 1
-
-# تبويب استخراج الجدول من الصورة
-if perms["can_input"] and OCR_AVAILABLE and "📸 استخراج جدول من صورة" in tabs_list:
-    with tabs[idx]:
-        st.header("رفع صورة واستخراج البيانات (مع التحرير اليدوي)")
-        st.markdown("""
-        **الطريقة:**
-        1. ارفع الصورة.
-        2. اضغط "استخراج النص الخام" لرؤية النص المستخرج.
-        3. **قم بتحرير النص** يدويًا: احذف الأحرف المشوشة، واترك الأرقام (الوزن) والكلمات (نوع البالة). مثال لكل سطر: `قماش 250 08:30`
-        4. اضغط "تحويل النص المعدل إلى جدول".
-        5. راجع الجدول وقم بتعديله ثم احفظه.
-        """)
-        
-        # زر اختبار OCR
-        if st.button("🧪 اختبار OCR"):
-            from PIL import Image, ImageDraw, ImageFont
-            img = Image.new('RGB', (300, 100), color='white')
-            d = ImageDraw.Draw(img)
-            try:
-                font = ImageFont.truetype("arial.ttf", 30)
-            except:
-                font = ImageFont.load_default()
-            d.text((10, 10), "اختبار 123", fill='black', font=font)
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format='PNG')
-            test_text = extract_raw_text_from_image(img_bytes.getvalue())
-            if "اختبار" in test_text or "123" in test_text:
-                st.success("✅ OCR يعمل بشكل صحيح!")
-            else:
-                st.error("❌ OCR لا يعمل. تأكد من تثبيت Tesseract واللغة العربية.")
-        
-        uploaded = st.file_uploader("اختر صورة (jpg, png, jpeg)", type=["jpg","jpeg","png"])
-        if uploaded:
-            st.image(uploaded, use_column_width=True)
-            if st.button("📄 استخراج النص الخام"):
-                with st.spinner("جاري استخراج النص..."):
-                    raw_text = extract_raw_text_from_image(uploaded.getvalue())
-                if raw_text.strip():
-                    st.session_state['ocr_raw_text'] = raw_text
-                    st.success("تم استخراج النص. يمكنك تعديله في المربع أدناه.")
+                    st.error("❌ OCR لا يعمل. تأكد من تثبيت Tesseract واللغة العربية.")
+                if caps["missing_languages"]:
+                    st.warning(f"لغات غير مثبتة: {', '.join(caps['missing_languages'])}")
+                if caps["fallback_reason"]:
+                    st.caption(f"tesserocr غير مستخدم: {caps['fallback_reason']}")
+                if caps["error"]:
+                    st.caption(caps["error"])
+
+            uploads = st.file_uploader("اختر صورة أو أكثر (jpg, png, jpeg)", type=["jpg","jpeg","png"],
+                                       accept_multiple_files=True)
+            if uploads:
+                if len(uploads) == 1:
+                    uploaded = uploads[0]
+                    st.image(uploaded, use_column_width=True)
+                    if st.button("📄 استخراج النص الخام"):
+                        with st.spinner("جاري استخراج النص..."), metric_phase("ocr.extract_raw_text"):
+                            count_metric("bytes_read.ocr_images", uploaded.size)
+                            raw_text = ocr_pipeline().extract_raw_text_from_image(uploaded.getvalue())
+                        if raw_text.strip():
+                            st.session_state['ocr_raw_text'] = raw_text
+                            st.success("تم استخراج النص. يمكنك تعديله في المربع أدناه.")
+                        else:
+                            st.error("لم يتم التعرف على أي نص. حاول رفع صورة أوضح.")
+                    if st.button("🧮 استخراج الجدول خلية بخلية"):
+                        with st.spinner("جاري كشف خطوط الجدول وقراءة الخلايا..."), metric_phase("ocr.extract_table_cells"):
+                            count_metric("bytes_read.ocr_images", uploaded.size)
+                            cells = ocr_pipeline().extract_table_cells(uploaded.getvalue())
+                        if cells is None:
+                            st.error("لم يتم اكتشاف جدول بخطوط واضحة. استخدم استخراج النص الخام.")
+                        else:
+                            rows = ParsedRows().add_rows(table_cells_to_rows(cells))
+                            store_extracted_rows(rows)
+                            st.success(f"تم استخراج {len(rows)} صف من خلايا الجدول")
                 else:
-                    st.error("لم يتم التعرف على أي نص. حاول رفع صورة أوضح.")
-            
+                    st.image(uploads, width=160, caption=[u.name for u in uploads])
+                    use_cells = st.checkbox("قراءة الجداول خلية بخلية", value=True)
+                    if st.button(f"⚡ استخراج ودمج {len(uploads)} صورة"):
+                        raw_text, rows = extract_texts_from_images(uploads, use_cells)
+                        st.session_state['ocr_raw_text'] = raw_text
+                        if len(rows):
+                            store_extracted_rows(rows)
+                            st.success(f"تم استخراج {len(rows)} صف من {len(uploads)} صورة")
+                        else:
+                            st.error("لم يتم التعرف على أي صفوف. راجع النص المستخرج أدناه.")
+
+            log_file = st.file_uploader("أو ارفع ملف سجلات نصي (txt, csv) بأي حجم", type=["txt", "csv"])
+            if log_file is not None and st.button("📥 تحليل ملف السجلات"):
+                with st.spinner("جاري تحليل الملف..."):
+                    rows = ParsedRows().add_text(log_file)
+                store_extracted_rows(rows)
+                st.success(f"تم استخراج {len(rows):,} صف من {rows.lines_read:,} سطر")
+
             if 'ocr_raw_text' in st.session_state:
                 edited = st.text_area("قم بتحرير النص (أزل الأحرف الغريبة، اترك الأوزان والأنواع):", 
                                       value=st.session_state['ocr_raw_text'], height=200)
                 st.session_state['ocr_raw_text'] = edited
-                
+
                 if st.button("🔄 تحويل النص المعدل إلى جدول"):
-                    rows = parse_edited_text_to_table(edited)
-                    if rows:
-                        st.session_state['extracted_rows'] = rows
+                    rows = ParsedRows().add_text(edited)
+                    if len(rows):
+                        store_extracted_rows(rows)
                         st.success(f"تم استخراج {len(rows)} صف بنجاح")
                     else:
                         st.error("لم يتم العثور على أزواج (نوع، وزن) في النص. تأكد من وجود أرقام وكلمات.")
-            
-            if 'extracted_rows' in st.session_state and st.session_state['extracted_rows']:
-                df_extracted = pd.DataFrame(st.session_state['extracted_rows'])
-                df_extracted['المشرف'] = get_supervisors()[0]
-                df_extracted['ملاحظات'] = ""
-                df_extracted = df_extracted[['نوع البالة', 'وزن البالة', 'التاريخ', 'الوقت', 'المشرف', 'ملاحظات']]
-                
-                st.subheader("البيانات المستخرجة (قابل للتعديل)")
+
+            rows = st.session_state.get('extracted_rows')
+            if rows is not None and rows.rejected_count:
+                with st.expander(f"⚠️ {rows.rejected_count:,} سطر مرفوض"):
+                    st.dataframe(rows.rejected_frame(), use_container_width=True)
+                    if rows.rejected_count > len(rows.rejected):
+                        st.caption(f"تُعرض أول {len(rows.rejected)} سطر فقط")
+
+            if rows is not None and len(rows):
+                page_size = APP_CONFIG["EDITOR_PAGE_ROWS"]
+                pages = (len(rows) - 1) // page_size + 1
+                edits = st.session_state.setdefault('extracted_edits', {})
+                st.subheader(f"البيانات المستخرجة ({len(rows):,} صف، قابل للتعديل)")
+                page = st.number_input("الصفحة", min_value=1, max_value=pages, value=1, step=1) - 1 if pages > 1 else 0
+                # أساس الصفحة يبقى ثابتاً طوال عرضها حتى لا يعيد المحرر تطبيق تعديلاته عليه
+                view = st.session_state.get('extracted_view')
+                if view is None or view[0] != page:
+                    base = edits[page] if page in edits else extracted_page_frame(rows, page, page_size)
+                    view = (page, base, st.session_state.get('extracted_view_seq', 0) + 1)
+                    st.session_state['extracted_view'] = view
+                    st.session_state['extracted_view_seq'] = view[2]
+                _, df_extracted, view_seq = view
+
                 edited_df = st.data_editor(
                     df_extracted,
                     num_rows="dynamic",
@@ -737,59 +2993,91 @@ if perms["can_input"] and OCR_AVAILABLE and "📸 استخراج جدول من 
                         "المشرف": st.column_config.SelectboxColumn("المشرف", options=get_supervisors(), required=True),
                         "ملاحظات": st.column_config.TextColumn("ملاحظات"),
                     },
-                    use_container_width=True
+                    use_container_width=True,
+                    key=f"extracted_editor_{view_seq}"
                 )
-                
+                if page in edits or not edited_df.equals(df_extracted):
+                    edits[page] = edited_df
+
                 if st.button("💾 حفظ البيانات المستخرجة"):
-                    if edited_df.empty:
-                        st.warning("لا توجد بيانات للحفظ")
+                    new_count, rejected = ingest_cotton_batch(iter_extracted_pages(rows, edits, page_size),
+                                                              f"إضافة سجلات من الصورة ({len(rows):,} صف مستخرج)")
+                    if not rejected.empty:
+                        st.error(f"يوجد {len(rejected)} صفاً غير صالح")
+                        st.dataframe(rejected)
+                    elif new_count:
+                        st.success(f"تم حفظ {new_count} سجل بنجاح")
+                        for key in ('extracted_rows', 'extracted_edits', 'extracted_view'):
+                            st.session_state.pop(key, None)
+                        st.rerun()
+        idx += 1
+
+    # تبويب الإحصائيات
+    if perms["can_view_stats"] and "📊 عرض الإحصائيات" in tabs_list:
+        with tabs[idx], metric_phase("ui.tab.stats"):
+            st.header("الإحصائيات")
+            if cotton_df.empty:
+                st.warning("لا توجد بيانات")
+            else:
+                col1, col2 = st.columns(2)
+                with col1:
+                    sd = st.date_input("من", datetime.now().date() - timedelta(days=7))
+                with col2:
+                    ed = st.date_input("إلى", datetime.now().date())
+                if st.button("عرض الإحصائيات"):
+                    stats = generate_statistics(sd, ed)
+                    if not stats.empty:
+                        st.dataframe(stats)
+                        total_w = stats['إجمالي الوزن'].sum()
+                        st.metric("إجمالي الوزن", f"{total_w:,.1f} كجم")
                     else:
-                        invalid = edited_df[edited_df['وزن البالة'] <= 0]
-                        if not invalid.empty:
-                            st.error(f"يوجد {len(invalid)} صفاً وزنها غير صحيح")
-                        else:
-                            new_count = 0
-                            for _, row in edited_df.iterrows():
-                                new_record = {
-                                    'التاريخ': row['التاريخ'],
-                                    'الوقت': row['الوقت'],
-                                    'الوردية': get_current_shift(),
-                                    'المشرف': row['المشرف'],
-                                    'نوع البالة': row['نوع البالة'],
-                                    'وزن البالة': row['وزن البالة'],
-                                    'ملاحظات': row.get('ملاحظات', '')
-                                }
-                                cotton_df = pd.concat([cotton_df, pd.DataFrame([new_record])], ignore_index=True)
-                                new_count += 1
-                            if save_cotton_data(cotton_df, f"إضافة {new_count} سجل من الصورة"):
-                                st.success(f"تم حفظ {new_count} سجل بنجاح")
-                                st.rerun()
-    idx += 1
-
-# تبويب الإحصائيات
-if perms["can_view_stats"] and "📊 عرض الإحصائيات" in tabs_list:
-    with tabs[idx]:
-        st.header("الإحصائيات")
-        if cotton_df.empty:
-            st.warning("لا توجد بيانات")
-        else:
-            col1, col2 = st.columns(2)
-            with col1:
-                sd = st.date_input("من", datetime.now().date() - timedelta(days=7))
-            with col2:
-                ed = st.date_input("إلى", datetime.now().date())
-            if st.button("عرض الإحصائيات"):
-                stats = generate_statistics(cotton_df, sd, ed)
-                if not stats.empty:
-                    st.dataframe(stats)
-                    total_w = stats['إجمالي الوزن'].sum()
-                    st.metric("إجمالي الوزن", f"{total_w:,.1f} كجم")
-                else:
-                    st.warning("لا توجد بيانات في هذه الفترة")
-    idx += 1
-
-# تبويب إدارة المستخدمين (للمدير فقط)
-if is_admin(st.session_state.get("username")):
-    with tabs[idx]:
-        admin_users_management_tab()
-    idx += 1
+                        st.warning("لا توجد بيانات في هذه الفترة")
+
+                st.markdown("---")
+                st.subheader("📈 تقارير الإنتاج")
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    dims = st.multiselect("التجميع حسب", REPORT_DIMENSIONS, default=['الوردية'])
+                with col2:
+                    freq_label = st.selectbox("فترة الاتجاه", list(REPORT_FREQUENCIES.keys()))
+                with col3:
+                    window = st.number_input("نافذة المتوسط المتحرك", min_value=1, max_value=90, value=7)
+                comparison = compare_with_previous_period(cotton_df, sd, ed)
+                cur_w = comparison['إجمالي الوزن'].iloc[0]
+                cur_n = comparison['عدد البالات'].iloc[0]
+                m1, m2 = st.columns(2)
+                m1.metric("إجمالي الوزن (الفترة)", f"{cur_w:,.1f} كجم", f"{comparison['فرق الوزن'].iloc[0]:,.1f} كجم")
+                m2.metric("عدد البالات (الفترة)", f"{int(cur_n)}", f"{int(cur_n - comparison['عدد البالات (السابقة)'].iloc[0])}")
+                report = build_production_report(cotton_df, sd, ed, dims)
+                if not report.empty:
+                    st.dataframe(report, use_container_width=True)
+                trend = production_trend(cotton_df, sd, ed, REPORT_FREQUENCIES[freq_label], window)
+                if not trend.empty:
+                    st.line_chart(trend)
+                if len(dims) == 1:
+                    st.caption("مقارنة بالفترة السابقة")
+                    st.dataframe(compare_with_previous_period(cotton_df, sd, ed, dims[0]), use_container_width=True)
+
+                st.markdown("---")
+                export_section()
+        idx += 1
+
+    # تبويب سجل البالات لمن يملك صلاحية العرض أو الإدخال (والتعديل لمن يملك صلاحية الإدخال)
+    if (perms["can_view_stats"] or perms["can_input"]) and "📜 سجل البالات" in tabs_list:
+        with tabs[idx], metric_phase("ui.tab.history"):
+            bale_log_tab(can_edit=perms["can_input"])
+        idx += 1
+
+    # تبويب إدارة المستخدمين (للمدير فقط)
+    if is_admin(st.session_state.get("username")):
+        with tabs[idx], metric_phase("ui.tab.users"):
+            admin_users_management_tab()
+        idx += 1
+        with tabs[idx]:
+            diagnostics_tab()
+        idx += 1
+
+# Streamlit يشغّل السكربت باسم __main__؛ الشرط يمنع تشغيل الواجهة عند استيراد الملف
+# (مثلاً عند تهيئة عمال OCR)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""زمن OCR لكل صورة ولكل خلية: pytesseract (عملية لكل استدعاء) مقابل tesserocr (نسخ API دائمة).
+
+الصور تُعالج مسبقاً مرة واحدة، ثم يُقاس التعرف وحده: أول استدعاء (يشمل تحميل اللغة)
+ثم الوسيط لعدة تكرارات، ونفس الشيء لـ 25 شريطاً صغيراً بحجم خلية (حيث تطغى الكلفة الثابتة).
+المحرك غير المتاح يُتخطى مع ذكر السبب.
+
+    python benchmarks/ocr_engine_benchmark.py [--repeat 5] [--output ocr_engine_benchmark.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ocr_pipeline
+from samples import iter_samples
+
+def available_engines():
+    engines, skipped = {}, {}
+    try:
+        ocr_pipeline.pytesseract.get_tesseract_version()
+        engines["pytesseract"] = ocr_pipeline.PytesseractEngine()
+    except Exception as e:
+        skipped["pytesseract"] = f"{type(e).__name__}: {e}"
+    if ocr_pipeline.TESSEROCR_AVAILABLE:
+        engines["tesserocr"] = ocr_pipeline.TesserocrEngine(handles_per_lang=1)
+    else:
+        skipped["tesserocr"] = "tesserocr غير مثبت"
+    return engines, skipped
+
+def cell_strips(image, count=25):
+    """شرائح أفقية متساوية بارتفاع سطر تقريباً تحاكي خلايا الجدول"""
+    height = image.shape[0] // count
+    return [image[i * height:(i + 1) * height] for i in range(count) if height]
+
+def measure(call, repeat):
+    start = time.perf_counter()
+    call()
+    first = time.perf_counter() - start
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return {"first_ms": first * 1000, "median_ms": statistics.median(timings) * 1000,
+            "best_ms": min(timings) * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="ocr_engine_benchmark.json")
+    args = parser.parse_args()
+
+    engines, skipped = available_engines()
+    for name, reason in skipped.items():
+        print(f"skip {name}: {reason}")
+    samples = [(name, ocr_pipeline.preprocess_image_for_ocr(data)) for name, data, _ in iter_samples()]
+
+    results = []
+    for engine_name, engine in engines.items():
+        for sample_name, image in samples:
+            page = measure(lambda: engine.image_to_words(image, ocr_pipeline.OCR_LANG, ocr_pipeline.OCR_CONFIG),
+                           args.repeat)
+            strips = cell_strips(image)
+            config = ocr_pipeline.CELL_OCR["weight"]
+            cells = measure(lambda: [engine.image_to_string(s, config["lang"], config["config"]) for s in strips],
+                            args.repeat)
+            cells["per_cell_ms"] = cells["median_ms"] / max(1, len(strips))
+            results.append({"engine": engine_name, "sample": sample_name, "shape": list(image.shape),
+                            "page": page, "cells": cells})
+            print(f"{engine_name:12s} {sample_name:24s} page {page['median_ms']:8.1f} ms "
+                  f"(first {page['first_ms']:.1f})  cell {cells['per_cell_ms']:6.1f} ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"skipped": skipped, "results": results}, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""مقارنة المعالجة المسبقة الحالية (التكيفية) بالمعالجة القديمة (تكبير 2x ثابت).
+
+لكل عينة وكل طريقة: الزمن، أقصى ذاكرة مقيمة (RSS) في عملية مستقلة، حجم الصورة الناتجة،
+ودقة الحروف مقابل النص الصحيح إذا كان Tesseract مثبتاً.
+
+    python benchmarks/preprocess_benchmark.py [--repeat 3] [--output preprocess_benchmark.json]
+"""
+import argparse
+import difflib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cv2
+import numpy as np
+
+import ocr_pipeline
+from samples import iter_samples
+
+def legacy_preprocess(image_bytes):
+    """المعالجة قبل التعديل كما كانت في app.py (للمقارنة فقط)"""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    (h, w) = gray.shape
+    scaled = cv2.resize(gray, (w * 2, h * 2), interpolation=cv2.INTER_CUBIC)
+    denoised = cv2.medianBlur(scaled, 3)
+    return cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 2)
+
+PIPELINES = {
+    "legacy": legacy_preprocess,
+    "adaptive": ocr_pipeline.preprocess_image_for_ocr,
+}
+
+def char_accuracy(text, truth):
+    normalize = lambda t: " ".join(t.split())
+    return difflib.SequenceMatcher(None, normalize(text), normalize(truth)).ratio()
+
+def tesseract_available():
+    try:
+        ocr_pipeline.pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def reset_peak_rss():
+    """تصفير ذروة الذاكرة: على لينكس تُورَث ذروة العملية الأم عبر fork/exec"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure_one(pipeline, sample_dir, sample_name, repeat):
+    """يُشغَّل في عملية مستقلة حتى يكون أقصى RSS خاصاً بهذه الطريقة وهذه العينة.
+    العينة تُقرأ من ملف جاهز لأن توليدها هنا يرفع أقصى RSS قبل القياس"""
+    with open(os.path.join(sample_dir, sample_name + ".jpg"), "rb") as f:
+        data = f.read()
+    with open(os.path.join(sample_dir, sample_name + ".txt"), encoding="utf-8") as f:
+        truth = f.read()
+    func = PIPELINES[pipeline]
+    reset_peak_rss()
+    rss_before = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        processed = func(data)
+        timings.append(time.perf_counter() - start)
+    result = {
+        "pipeline": pipeline,
+        "sample": sample_name,
+        "input_bytes": len(data),
+        "seconds": min(timings),
+        "output_shape": list(processed.shape),
+        "baseline_rss_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if tesseract_available():
+        start = time.perf_counter()
+        text = ocr_pipeline.pytesseract.image_to_string(processed, lang="eng", config="--psm 6")
+        result["ocr_seconds"] = time.perf_counter() - start
+        result["char_accuracy"] = round(char_accuracy(text, truth), 4)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="preprocess_benchmark.json")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_one(args.child[0], args.child[1], args.child[2], args.repeat)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as sample_dir:
+        names = []
+        for sample_name, data, truth in iter_samples():
+            with open(os.path.join(sample_dir, sample_name + ".jpg"), "wb") as f:
+                f.write(data)
+            with open(os.path.join(sample_dir, sample_name + ".txt"), "w", encoding="utf-8") as f:
+                f.write(truth)
+            names.append(sample_name)
+
+        for sample_name in names:
+            for pipeline in PIPELINES:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--repeat", str(args.repeat),
+                     "--child", pipeline, sample_dir, sample_name],
+                    check=True, capture_output=True, text=True
+                )
+                row = json.loads(out.stdout.strip().splitlines()[-1])
+                results.append(row)
+                acc = f"  acc={row['char_accuracy']:.3f}" if "char_accuracy" in row else ""
+                print(f"{sample_name:24s} {pipeline:9s} {row['seconds'] * 1000:8.1f} ms  "
+                      f"peak {row['peak_rss_mb']:7.1f} MB (base {row['baseline_rss_mb']:.1f})  out={row['output_shape']}{acc}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"tesseract": tesseract_available(), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
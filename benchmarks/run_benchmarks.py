@@ -0,0 +1,284 @@
+"""قياس المسارات الساخنة في app.py (تحميل البيانات، الإضافة والحفظ، الإحصائيات، تحليل النص، OCR)
+على سجلات صناعية قابلة للتكرار، بدون تشغيل واجهة Streamlit.
+
+كل حجم يُقاس في مجلد مؤقت مستقل (قاعدة بيانات وملفات خاصة به). النتائج تُكتب في ملف JSON
+مع مقارنتها بحدود benchmarks/thresholds.json، واختيارياً بنتيجة سابقة (--baseline).
+
+    python benchmarks/run_benchmarks.py [--sizes 1k,100k,1m] [--repeat 3] [--output bench.json]
+                                        [--baseline old.json --tolerance 0.25] [--check]
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+THRESHOLDS_FILE = os.path.join(BENCH_DIR, "thresholds.json")
+
+def import_app():
+    """استيراد app.py كوحدة عادية (الواجهة لا تعمل إلا عند __main__)"""
+    warnings.filterwarnings("ignore")
+    import logging
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    import app
+    return app
+
+def warm_up(app):
+    """تهيئة ما يحدث مرة واحدة لكل عملية قبل أول قياس، حتى تتكرر النتائج مع --repeat 1.
+    في التطبيق تحدث هذه التهيئة في أول عرض للواجهة وليس في مسار الحفظ"""
+    app.get_github_sync()  # st.secrets يُحلل عند أول قراءة
+    app.get_snapshot_compactor()
+
+def synthetic_history(app, rows, seed=0, end=date(2026, 6, 30)):
+    """سجل صناعي: نحو 300 بالة في اليوم، بالأنواع والمشرفين الحقيقيين والوردية من ساعة التسجيل"""
+    rng = np.random.default_rng(seed)
+    days = max(1, rows // 300)
+    day_offsets = np.sort(rng.integers(0, days, rows))
+    dates = pd.to_datetime(end) - pd.to_timedelta(days - 1 - day_offsets, unit="D")
+    seconds = rng.integers(0, 24 * 3600, rows)
+    hours = seconds // 3600
+    times = pd.to_timedelta(seconds, unit="s")
+    bale_types = app.get_bale_types()
+    supervisors = app.get_supervisors()
+    return pd.DataFrame({
+        'التاريخ': dates.strftime("%Y-%m-%d"),
+        'الوقت': app.format_cotton_times(pd.Series(times)),
+        'الوردية': app.get_shifts_for_hours(hours),
+        'المشرف': np.asarray(supervisors, dtype=object)[rng.integers(0, len(supervisors), rows)],
+        'نوع البالة': np.asarray(bale_types, dtype=object)[rng.integers(0, len(bale_types), rows)],
+        'وزن البالة': np.round(rng.uniform(50, 900, rows), 1),
+        'ملاحظات': "",
+    })
+
+def synthetic_text(app, lines, seed=0):
+    """نص ملصوق بصيغة "نوع وزن وقت" مع سطر تالف كل 20 سطراً"""
+    rng = np.random.default_rng(seed)
+    bale_types = app.get_bale_types()
+    out = []
+    for i in range(lines):
+        if i % 20 == 19:
+            out.append("---- رسالة غير متعلقة ----")
+            continue
+        out.append(f"{bale_types[rng.integers(len(bale_types))]} {rng.uniform(50, 900):.1f} "
+                   f"{rng.integers(24):02d}:{rng.integers(60):02d}")
+    return "\n".join(out)
+
+def seed_database(app, df):
+    """نفس مسار الإدخال في التطبيق (تدقيق الدفعة ثم إدخالها وتحديث الملخص) بدون رفع"""
+    valid, rejected = app.normalize_cotton_batch(df)
+    assert rejected.empty, rejected.head()
+    with app.cotton_db() as conn:
+        app._insert_rows(conn, app._frame_to_db_rows(valid))
+        app.bump_data_version(conn, rewrite=True)
+        # كأن السجل مستورد من luva.xlsx: لا تصدير مستحق يزاحم قياسات الإضافة في الخلفية
+        app._mark_snapshot(conn)
+
+def timed(func, repeat, setup=None):
+    """(أفضل زمن، الوسيط، آخر نتيجة) لعدة تكرارات؛ setup يُستدعى قبل كل تكرار ولا يُحسب.
+    جمع المهملات الكامل قبل كل تكرار حتى لا تقع دورة الجيل الثاني (عشرات المللي ثانية لكل
+    كائنات العملية) داخل قياس قصير بالصدفة، فتتكرر النتيجة حتى مع --repeat 1"""
+    timings, result = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": statistics.median(timings), "runs": len(timings)}, result
+
+@contextlib.contextmanager
+def workspace():
+    """مجلد عمل مؤقت: app.py يستخدم مسارات نسبية (luva.db, users.json, ...)"""
+    cwd = os.getcwd()
+    path = tempfile.mkdtemp(prefix="luva_bench_")
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+def reset_caches(app):
+    app._cotton_cache.clear()
+
+def bench_size(app, label, rows, repeat, save_max_rows, parse_max_lines):
+    results = {}
+    with workspace():
+        reset_caches(app)
+        df = synthetic_history(app, rows)
+        results["seed_db"], _ = timed(lambda: seed_database(app, df), 1)
+
+        def drop_sidecar():
+            reset_caches(app)
+            for path in os.listdir("."):
+                if path.endswith(".parquet"):
+                    os.remove(path)
+
+        results["load_cold_sqlite"], loaded = timed(app.load_cotton_data, repeat, setup=drop_sidecar)
+        assert len(loaded) == rows, (len(loaded), rows)
+        results["load_sidecar"], _ = timed(app.load_cotton_data, repeat, setup=lambda: reset_caches(app))
+        results["load_warm"], _ = timed(app.load_cotton_data, repeat)
+
+        supervisor, bale_type = app.get_supervisors()[0], app.get_bale_types()[0]
+        results["add_new_record_concat"], _ = timed(
+            lambda: app.add_new_record(loaded, supervisor, bale_type, 250.0), repeat)
+
+        def append_and_reload():
+            app.append_cotton_records([app.build_new_record(supervisor, bale_type, 250.0)], "benchmark")
+            return app.load_cotton_data()
+        results["append_and_reload"], _ = timed(append_and_reload, repeat)
+        app.get_snapshot_compactor().flush()  # التصدير الخلفي لا يُحسب ولا يزاحم القياسات التالية
+
+        if rows <= save_max_rows:
+            current = app.load_cotton_data()
+            results["save_full"], _ = timed(lambda: app.save_cotton_data(current, "benchmark"), 1)
+            app.get_snapshot_compactor().flush()
+
+        last_day = pd.to_datetime(df['التاريخ'].max()).date()
+        first_day = pd.to_datetime(df['التاريخ'].min()).date()
+        results["stats_all"], _ = timed(lambda: app.generate_statistics(first_day, last_day), repeat)
+        results["stats_week"], _ = timed(
+            lambda: app.generate_statistics(last_day - timedelta(days=6), last_day), repeat)
+        frame = app.load_cotton_data()
+        results["report_shift_type_month"], _ = timed(
+            lambda: app.build_production_report(frame, last_day - timedelta(days=30), last_day,
+                                                ["الوردية", "نوع البالة"]), repeat)
+
+        year = {"start": last_day - timedelta(days=364), "end": last_day}
+        results["export_year_csv"], _ = timed(lambda: app.export_cotton_range(year, "csv", "export.csv"), 1)
+        if app.PARQUET_AVAILABLE:
+            results["export_year_parquet"], _ = timed(
+                lambda: app.export_cotton_range(year, "parquet", "export.parquet"), 1)
+        if rows <= save_max_rows:
+            results["export_year_xlsx"], _ = timed(lambda: app.export_cotton_range(year, "xlsx", "export.xlsx"), 1)
+
+        lines = min(rows, parse_max_lines)
+        text = synthetic_text(app, lines)
+        results["parse_text_to_table"], _ = timed(lambda: app.parse_edited_text_to_table(text), repeat)
+        results["parse_streaming"], _ = timed(lambda: app.ParsedRows().add_text(text), repeat)
+    for name, row in results.items():
+        row["rows"] = lines if name.startswith("parse") else rows
+        row["per_row_us"] = row["best"] / row["rows"] * 1e6
+        print(f"{label:5s} {name:28s} {row['best'] * 1000:10.1f} ms  (median {row['median'] * 1000:.1f})")
+    return results
+
+def bench_ocr(repeat):
+    """المعالجة المسبقة دائماً، والتعرف الكامل فقط إذا كان Tesseract مثبتاً"""
+    import ocr_pipeline
+    from samples import iter_samples
+    try:
+        ocr_pipeline.pytesseract.get_tesseract_version()
+        tesseract = True
+    except Exception:
+        tesseract = False
+    results = {}
+    with workspace():  # كاش OCR على القرص داخل المجلد المؤقت
+        for name, data, _ in iter_samples():
+            results[f"preprocess_{name}"], _ = timed(lambda: ocr_pipeline.preprocess_image_for_ocr(data), repeat)
+            if tesseract:
+                results[f"ocr_text_{name}"], _ = timed(lambda: ocr_pipeline.run_ocr(data), 1)
+                results[f"ocr_text_cached_{name}"], _ = timed(
+                    lambda: ocr_pipeline.extract_raw_text_from_image(data), 2)
+                results[f"ocr_cells_{name}"], _ = timed(lambda: ocr_pipeline.extract_table_cells(data), 1)
+    for name, row in results.items():
+        print(f"ocr   {name:28s} {row['best'] * 1000:10.1f} ms")
+    return results, tesseract
+
+def flatten(results):
+    return {f"{group}.{name}": row["best"] for group, rows in results.items() for name, row in rows.items()}
+
+def check(flat, thresholds, baseline, tolerance):
+    """مقارنة بحدود ثابتة (ثوانٍ) وبنتيجة سابقة (نسبة تباطؤ)"""
+    failures = []
+    for key, seconds in flat.items():
+        limit = thresholds.get(key)
+        if limit is not None and seconds > limit:
+            failures.append({"benchmark": key, "seconds": seconds, "threshold": limit})
+        if baseline and key in baseline and baseline[key] > 0.001 and seconds > baseline[key] * (1 + tolerance):
+            failures.append({"benchmark": key, "seconds": seconds, "baseline": baseline[key],
+                             "slowdown": round(seconds / baseline[key], 2)})
+    return failures
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,100k,1m")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save-max-rows", type=int, default=100_000,
+                        help="الحفظ الكامل يكتب Excel كاملاً؛ يُقاس فقط حتى هذا الحجم")
+    parser.add_argument("--parse-max-lines", type=int, default=100_000)
+    parser.add_argument("--no-ocr", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="ملف نتائج سابق للمقارنة")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--check", action="store_true", help="رمز خروج 1 عند تجاوز أي حد")
+    args = parser.parse_args()
+
+    app = import_app()
+    warm_up(app)
+    results = {}
+    for label in args.sizes.split(","):
+        results[label] = bench_size(app, label, SIZES[label], args.repeat, args.save_max_rows, args.parse_max_lines)
+    tesseract = None
+    if not args.no_ocr and app.OCR_AVAILABLE:
+        results["ocr"], tesseract = bench_ocr(args.repeat)
+
+    with open(THRESHOLDS_FILE, encoding="utf-8") as f:
+        thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = flatten(json.load(f)["results"])
+    failures = check(flatten(results), thresholds, baseline, args.tolerance)
+
+    report = {
+        "meta": {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "tesseract": tesseract,
+            "repeat": args.repeat,
+        },
+        "results": results,
+        "thresholds": thresholds,
+        "failures": failures,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for failure in failures:
+        print("REGRESSION", json.dumps(failure, ensure_ascii=False))
+    print(f"{len(failures)} regression(s); results in {args.output}")
+    if args.check and failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
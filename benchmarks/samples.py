@@ -0,0 +1,56 @@
+"""عينات صور صناعية لسجلات المكبس مع النص الصحيح لكل منها (لقياس الزمن والدقة بدون صور حقيقية)."""
+import io
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# (الاسم، عرض الصورة الناتجة بالبكسل، زاوية الميل، حجم خط الورقة)
+SAMPLE_SHEETS = [
+    ("scan_a4_300dpi", 2480, 0.0, 34),
+    ("phone_12mp", 4000, 2.5, 30),
+    ("phone_12mp_small_text", 4000, -1.5, 22),
+    ("low_res", 1200, 1.0, 34),
+]
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def sample_lines(seed=0, count=25):
+    """أسطر السجل: رقم، وزن، وقت (أرقام فقط حتى تكون الحقيقة المرجعية موثوقة بدون تشكيل عربي)"""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(1, count + 1):
+        weight = rng.uniform(150, 900)
+        lines.append(f"{i:02d}   {weight:6.1f}   {rng.randrange(24):02d}:{rng.randrange(60):02d}")
+    return lines
+
+def render_sheet(width, angle=0.0, font_size=34, seed=0, quality=88):
+    """ورقة بيضاء عليها الأسطر فوق خلفية رمادية، مائلة قليلاً ومضغوطة JPEG كصورة هاتف.
+    تعيد (بايتات JPEG، النص الصحيح)"""
+    lines = sample_lines(seed)
+    font = _font(font_size)
+    sheet_w, line_h = font_size * 16, int(font_size * 1.6)
+    sheet = Image.new("L", (sheet_w, line_h * (len(lines) + 2)), 235)
+    draw = ImageDraw.Draw(sheet)
+    for i, line in enumerate(lines, start=1):
+        draw.text((font_size, i * line_h), line, fill=25, font=font)
+    sheet = sheet.rotate(angle, expand=True, fillcolor=90, resample=Image.BICUBIC)
+    height = int(width * 0.75)
+    canvas = Image.new("L", (width, height), 90)
+    scale = min(width * 0.85 / sheet.width, height * 0.9 / sheet.height)
+    sheet = sheet.resize((int(sheet.width * scale), int(sheet.height * scale)), Image.BICUBIC)
+    canvas.paste(sheet, ((width - sheet.width) // 2, (height - sheet.height) // 2))
+    noise = np.random.default_rng(seed).normal(0, 6, (height, width))
+    pixels = np.clip(np.asarray(canvas, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).convert("RGB").save(buf, format="JPEG", quality=quality)
+    return buf.getvalue(), "\n".join(lines)
+
+def iter_samples(seed=0):
+    for name, width, angle, font_size in SAMPLE_SHEETS:
+        data, truth = render_sheet(width, angle, font_size, seed)
+        yield name, data, truth
@@ -0,0 +1,122 @@
+"""زمن أول عرض للتطبيق وذاكرته لكل دور (مدير، إدخال بيانات، مشاهد) في عملية Python جديدة.
+
+كل دور يُشغَّل في عملية مستقلة عبر streamlit.testing (AppTest) داخل مجلد مؤقت فيه نسخة من
+users.json و luva.xlsx، مع جلسة دخول مسجلة مسبقاً حتى يُقاس العرض بعد الدخول مباشرة.
+يُسجل: زمن الاستيراد الأساسي (streamlit/pandas/numpy)، زمن أول تشغيل للسكربت، أقصى ذاكرة،
+والمكتبات الثقيلة التي حُمّلت فعلاً.
+
+    python benchmarks/startup_benchmark.py [--repeat 3] [--output startup_benchmark.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+HEAVY_MODULES = ["cv2", "pytesseract", "tesserocr", "PIL", "ocr_pipeline", "github", "requests", "pyarrow"]
+ROLES = {"admin": "admin", "data_entry": "Fathy", "viewer": "user1"}
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+def child(username, role):
+    """يعمل داخل العملية الفرعية (المجلد الحالي هو مجلد العمل المؤقت)"""
+    import warnings
+    import logging
+    warnings.filterwarnings("ignore")
+    start = time.perf_counter()
+    import numpy, pandas, streamlit  # noqa: F401
+    from streamlit.testing.v1 import AppTest
+    base_seconds = time.perf_counter() - start
+    logging.getLogger("streamlit").setLevel(logging.CRITICAL)
+
+    token = f"startup-{username}"
+    with sqlite3.connect("luva.db") as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS user_sessions "
+                     "(token TEXT PRIMARY KEY, username TEXT NOT NULL, login_time REAL NOT NULL)")
+        conn.execute("INSERT OR REPLACE INTO user_sessions (token, username, login_time) VALUES (?, ?, ?)",
+                     (token, username, time.time()))
+
+    before = set(sys.modules)
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    at.session_state["logged_in"] = True
+    at.session_state["username"] = username
+    at.session_state["user_role"] = role
+    at.session_state["session_token"] = token
+    start = time.perf_counter()
+    at.run()
+    first_run = time.perf_counter() - start
+    start = time.perf_counter()
+    at.run()
+    second_run = time.perf_counter() - start
+    loaded = sorted(m for m in HEAVY_MODULES if m in sys.modules and m not in before)
+    return {
+        "base_import_s": base_seconds,
+        "first_run_s": first_run,
+        "second_run_s": second_run,
+        "peak_rss_mb": peak_rss_mb(),
+        "heavy_modules": loaded,
+        "tabs": [t.label for t in at.tabs],
+        "exceptions": [str(e.value)[:200] for e in at.exception],
+    }
+
+def run_role(username, role):
+    workdir = tempfile.mkdtemp(prefix="luva_startup_")
+    try:
+        for name in ("users.json", "luva.xlsx"):
+            if os.path.exists(os.path.join(ROOT, name)):
+                shutil.copy(os.path.join(ROOT, name), workdir)
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", username, role],
+                             cwd=workdir, capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="startup_benchmark.json")
+    parser.add_argument("--child", nargs=2, metavar=("USERNAME", "ROLE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(*args.child), ensure_ascii=False))
+        return
+
+    results = {}
+    for role, username in ROLES.items():
+        runs = [run_role(username, role) for _ in range(args.repeat)]
+        last = runs[-1]
+        results[role] = {
+            "username": username,
+            "first_run_s": statistics.median(r["first_run_s"] for r in runs),
+            "second_run_s": statistics.median(r["second_run_s"] for r in runs),
+            "base_import_s": statistics.median(r["base_import_s"] for r in runs),
+            "peak_rss_mb": max(r["peak_rss_mb"] or 0 for r in runs),
+            "heavy_modules": last["heavy_modules"],
+            "tabs": last["tabs"],
+            "exceptions": last["exceptions"],
+        }
+        row = results[role]
+        print(f"{role:10s} first {row['first_run_s'] * 1000:8.1f} ms  rerun {row['second_run_s'] * 1000:7.1f} ms  "
+              f"peak {row['peak_rss_mb']:6.1f} MB  heavy {','.join(row['heavy_modules']) or '-'}")
+        for exc in row["exceptions"]:
+            print(f"  exception: {exc}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
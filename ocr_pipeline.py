@@ -0,0 +1,626 @@
+import os
+import io
+import re
+import json
+import hashlib
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+import pytesseract
+import cv2
+import numpy as np
+from PIL import Image
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+# ---------- إعدادات OCR ----------
+OCR_LANG = 'ara+eng'
+OCR_CONFIG = '--psm 6 -c preserve_interword_spaces=1'
+# كل ما يؤثر على ناتج المعالجة المسبقة؛ يدخل في مفتاح الكاش.
+# target_text_height: ارتفاع الحروف (بالبكسل) الذي تُحجَّم إليه الصورة، وهو ما يناسب Tesseract
+PREPROCESS_PARAMS = {
+    "target_text_height": 32,
+    "min_scale": 0.2,
+    "max_scale": 2.0,
+    "median_ksize": 3,
+    "block_size": 31,
+    "c": 10,
+    "deskew": True,
+    "crop_sheet": True
+}
+# أقصى بعد لصورة التقدير (تُفك مصغرة مباشرة من JPEG/PNG)
+PROBE_MAX_SIDE = 1200
+# إعدادات خلايا الجدول حسب نوع العمود (أرقام فقط للوزن والوقت)
+CELL_OCR = {
+    "type": {"lang": "ara", "config": "--psm 7"},
+    "weight": {"lang": "eng", "config": "--psm 7 -c tessedit_char_whitelist=0123456789."},
+    "time": {"lang": "eng", "config": "--psm 7 -c tessedit_char_whitelist=0123456789:"},
+}
+HEADER_KEYWORDS = {
+    "type": ("نوع", "الصنف", "البالة"),
+    "weight": ("وزن", "الوزن", "كجم", "kg"),
+    "time": ("وقت", "الوقت", "الساعة"),
+}
+# "auto": tesserocr إن توفر وإلا pytesseract؛ أو فرض أحدهما
+OCR_ENGINE = "auto"
+# عدد نسخ TessBaseAPI لكل لغة في العملية (None: حتى 4 حسب الأنوية)
+OCR_ENGINE_HANDLES = None
+OCR_CACHE_DIR = ".ocr_cache"
+OCR_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# مسح المجلد كاملاً كل هذا العدد من الإضافات على الأكثر، لاحتساب ما كتبته العمليات الأخرى
+OCR_CACHE_RESCAN_PUTS = 256
+
+# ---------- محرك Tesseract ----------
+# tesserocr يبقي نسخاً جاهزة من TessBaseAPI (اللغة محمّلة مرة واحدة) ويستقبل مصفوفة NumPy
+# مباشرة، بدل أن يكتب pytesseract صورة مؤقتة ويشغّل عملية tesseract جديدة في كل استدعاء.
+# كل لغة لها طابور محدود من النسخ؛ الخيط يأخذ نسخة ويعيدها، ولا تُستخدم نسخة من خيطين معاً.
+class PytesseractEngine:
+    """المسار الاحتياطي: عملية tesseract لكل استدعاء"""
+    name = "pytesseract"
+
+    def image_to_words(self, image, lang, config):
+        data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+        return [
+            {
+                "text": data["text"][i],
+                "left": data["left"][i], "top": data["top"][i],
+                "width": data["width"][i], "height": data["height"][i],
+                "conf": float(data["conf"][i]),
+                "line": (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            }
+            for i in range(len(data["text"]))
+            if data["text"][i].strip()
+        ]
+
+    def image_to_string(self, image, lang, config):
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    def describe(self):
+        return {"version": str(pytesseract.get_tesseract_version()), "languages": pytesseract.get_languages()}
+
+def _parse_tesseract_config(config):
+    """'--psm 7 -c name=value' -> (7، {name: value})"""
+    tokens = config.split()
+    psm, variables = None, {}
+    for i, token in enumerate(tokens):
+        if token == "--psm" and i + 1 < len(tokens):
+            psm = int(tokens[i + 1])
+        elif token == "-c" and i + 1 < len(tokens) and "=" in tokens[i + 1]:
+            name, value = tokens[i + 1].split("=", 1)
+            variables[name] = value
+    return psm, variables
+
+class TesserocrEngine:
+    """نسخ TessBaseAPI دائمة لكل لغة في طابور محدود بـ handles_per_lang نسخة"""
+    name = "tesserocr"
+
+    def __init__(self, handles_per_lang=None, acquire_timeout=120):
+        self.handles_per_lang = handles_per_lang or OCR_ENGINE_HANDLES or min(4, available_cpu_count())
+        self.acquire_timeout = acquire_timeout
+        self._pools = {}
+        self._created = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _handle(self, lang):
+        with self._lock:
+            pool = self._pools.setdefault(lang, queue.LifoQueue())
+            create = pool.empty() and self._created.get(lang, 0) < self.handles_per_lang
+            if create:
+                self._created[lang] = self._created.get(lang, 0) + 1
+        if create:
+            try:
+                api = tesserocr.PyTessBaseAPI(lang=lang)
+            except Exception:
+                with self._lock:
+                    self._created[lang] -= 1
+                raise
+        else:
+            api = pool.get(timeout=self.acquire_timeout)
+        try:
+            yield api
+        finally:
+            api.Clear()
+            pool.put(api)
+
+    @contextmanager
+    def _configured(self, lang, config):
+        psm, variables = _parse_tesseract_config(config)
+        with self._handle(lang) as api:
+            previous = {name: api.GetVariableAsString(name) for name in variables}
+            try:
+                if psm is not None:
+                    api.SetPageSegMode(psm)
+                for name, value in variables.items():
+                    api.SetVariable(name, value)
+                yield api
+            finally:
+                for name, value in previous.items():
+                    api.SetVariable(name, value or "")
+
+    @staticmethod
+    def _set_image(api, image):
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+
+    def image_to_words(self, image, lang, config):
+        with self._configured(lang, config) as api:
+            self._set_image(api, image)
+            api.Recognize()
+            words = []
+            block = par = line = 0
+            iterator = api.GetIterator()
+            if iterator is None:
+                return words
+            for r in tesserocr.iterate_level(iterator, tesserocr.RIL.WORD):
+                if r.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                    block, par, line = block + 1, 0, 0
+                if r.IsAtBeginningOf(tesserocr.RIL.PARA):
+                    par, line = par + 1, 0
+                if r.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                    line += 1
+                text = r.GetUTF8Text(tesserocr.RIL.WORD)
+                box = r.BoundingBox(tesserocr.RIL.WORD)
+                if not text or not text.strip() or box is None:
+                    continue
+                x1, y1, x2, y2 = box
+                words.append({
+                    "text": text,
+                    "left": x1, "top": y1, "width": x2 - x1, "height": y2 - y1,
+                    "conf": float(r.Confidence(tesserocr.RIL.WORD)),
+                    "line": (block, par, line)
+                })
+            return words
+
+    def image_to_string(self, image, lang, config):
+        with self._configured(lang, config) as api:
+            self._set_image(api, image)
+            return api.GetUTF8Text()
+
+    def describe(self):
+        return {"version": tesserocr.tesseract_version().splitlines()[0],
+                "languages": tesserocr.get_languages()[1]}
+
+_engine = None
+_engine_lock = threading.Lock()
+ENGINE_FALLBACK_REASON = None
+
+def get_ocr_engine():
+    """المحرك المستخدم في هذه العملية (يُنشأ مرة واحدة). مع OCR_ENGINE="auto" يُجرب tesserocr
+    بلغة OCR_LANG ويعود إلى pytesseract إذا لم يكن مثبتاً أو فشلت التهيئة"""
+    global _engine, ENGINE_FALLBACK_REASON
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is not None:
+            return _engine
+        if OCR_ENGINE in ("auto", "tesserocr") and TESSEROCR_AVAILABLE:
+            engine = TesserocrEngine()
+            try:
+                with engine._handle(OCR_LANG):
+                    pass
+                _engine = engine
+            except Exception as e:
+                if OCR_ENGINE == "tesserocr":
+                    raise
+                ENGINE_FALLBACK_REASON = f"{type(e).__name__}: {e}"
+        elif OCR_ENGINE in ("auto", "tesserocr"):
+            ENGINE_FALLBACK_REASON = "tesserocr غير مثبت"
+        if _engine is None:
+            _engine = PytesseractEngine()
+        return _engine
+
+def probe_capabilities(lang=OCR_LANG):
+    """ما يتوفر فعلاً في هذه البيئة: المحرك ونسخته واللغات المثبتة، ونتيجة تعرف على صورة اختبار
+    صغيرة. مكلف نسبياً (تحميل بيانات اللغة)، لذلك يُستدعى مرة واحدة لكل عملية ويُحفظ ناتجه"""
+    from PIL import ImageDraw, ImageFont
+    result = {"engine": None, "version": None, "languages": [], "missing_languages": [],
+              "fallback_reason": None, "self_test": False, "self_test_text": "", "error": None}
+    try:
+        engine = get_ocr_engine()
+        result["engine"] = engine.name
+        result["fallback_reason"] = ENGINE_FALLBACK_REASON
+        result.update(engine.describe())
+        result["missing_languages"] = [l for l in lang.split("+") if l not in result["languages"]]
+        img = Image.new('L', (300, 100), color=255)
+        try:
+            font = ImageFont.truetype("arial.ttf", 30)
+        except OSError:
+            font = ImageFont.load_default()
+        ImageDraw.Draw(img).text((10, 10), "اختبار 123", fill=0, font=font)
+        text = engine.image_to_string(np.array(img), lang, "--psm 6")
+        result["self_test_text"] = text.strip()
+        result["self_test"] = "اختبار" in text or "123" in text
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+# ---------- دوال OCR ----------
+def preprocess_image_for_ocr(image_bytes, params=PREPROCESS_PARAMS):
+    """صورة ثنائية جاهزة لـ Tesseract (نص أسود على أبيض).
+
+    تُقاس أولاً على نسخة مصغرة: ارتفاع الحروف، حدود الورقة، وزاوية الميل. ثم تُفك الصورة
+    بأصغر دقة تكفي (IMREAD_REDUCED_*)، وتُقص، وتُحجَّم مرة واحدة إلى ارتفاع الحروف المستهدف
+    (تصغيراً في الغالب) ثم يُعدل الميل. التنعيم والعتبة يعملان في مخزنين بحجم الصورة النهائية.
+    """
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    probe, probe_factor = _decode_probe(image_bytes, nparr)
+    if probe is None:
+        return None
+    text_height = _estimate_text_height(probe) * probe_factor
+    scale = params["target_text_height"] / text_height if text_height else 1.0
+    scale = min(max(scale, params["min_scale"]), params["max_scale"])
+    sheet = _find_sheet(probe) if params["crop_sheet"] else None
+    angle = _estimate_skew(probe) if params["deskew"] else 0.0
+
+    reduction = _decode_reduction(scale)
+    gray = probe if reduction == probe_factor else _decode_gray(nparr, reduction)
+    if gray is None:
+        return None
+    scale *= reduction
+    if sheet is not None:
+        x, y, w, h = (int(v * probe_factor / reduction) for v in sheet)
+        gray = gray[y:y + h, x:x + w]
+
+    h, w = gray.shape
+    size = (max(int(w * scale), 1), max(int(h * scale), 1))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    work = cv2.resize(gray, size, interpolation=interpolation)
+    del gray
+    if abs(angle) >= 0.3:
+        work = _rotate(work, angle)
+    blurred = cv2.medianBlur(work, params["median_ksize"])
+    cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                          params["block_size"], params["c"], dst=work)
+    return work
+
+_REDUCED_FLAGS = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                  4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+def _decode_gray(nparr, reduction):
+    return cv2.imdecode(nparr, _REDUCED_FLAGS[reduction])
+
+def _decode_reduction(scale):
+    """أكبر معامل تصغير عند الفك (1/2/4/8) لا يقل معه الحجم عن المطلوب"""
+    for factor in (8, 4, 2):
+        if scale * factor <= 1.0:
+            return factor
+    return 1
+
+def _decode_probe(image_bytes, nparr):
+    """فك نسخة مصغرة للتقدير بمعامل يُختار من أبعاد الصورة في ترويستها؛ تعيد (الصورة، المعامل)"""
+    try:
+        long_side = max(Image.open(io.BytesIO(image_bytes)).size)
+    except Exception:
+        return None, 1
+    factor = 1
+    while factor < 8 and long_side / (factor * 2) >= PROBE_MAX_SIDE:
+        factor *= 2
+    return _decode_gray(nparr, factor), factor
+
+def _estimate_text_height(gray):
+    """الوسيط لارتفاع المكونات المتصلة التي تشبه الحروف (بالبكسل في الصورة المعطاة)"""
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return None
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    limit = gray.shape[0] * 0.1
+    glyphs = (heights >= 2) & (heights <= limit) & (widths <= heights * 5) & (areas >= 4)
+    if glyphs.sum() < 5:
+        return None
+    return float(np.median(heights[glyphs]))
+
+def _find_sheet(gray):
+    """مستطيل الورقة الفاتحة على خلفية أغمق، أو None إذا كانت تغطي الصورة تقريباً"""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    img_area = gray.shape[0] * gray.shape[1]
+    if w * h < 0.15 * img_area or w * h > 0.95 * img_area:
+        return None
+    return x, y, w, h
+
+def _estimate_skew(gray):
+    """زاوية ميل أسطر النص بالدرجات (من المستطيل الأصغر المحيط بنقاط النص)"""
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    # دمج الحروف في أسطر قبل القياس حتى لا تؤثر الضوضاء المتفرقة
+    lines = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 1)))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(lines, connectivity=8)
+    angles, weights = [], []
+    for i in range(1, count):
+        w, h = stats[i, cv2.CC_STAT_WIDTH], stats[i, cv2.CC_STAT_HEIGHT]
+        if w < 40 or w < 3 * h:
+            continue
+        ys, xs = np.nonzero(labels[stats[i, cv2.CC_STAT_TOP]:stats[i, cv2.CC_STAT_TOP] + h,
+                                   stats[i, cv2.CC_STAT_LEFT]:stats[i, cv2.CC_STAT_LEFT] + w] == i)
+        slope = np.polyfit(xs, ys, 1)[0]
+        angles.append(np.degrees(np.arctan(slope)))
+        weights.append(w)
+    if not angles:
+        return 0.0
+    angle = float(np.average(angles, weights=weights))
+    return angle if abs(angle) <= 15 else 0.0
+
+def _rotate(gray, angle):
+    h, w = gray.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (w, h), flags=cv2.INTER_LINEAR, borderValue=255)
+
+def extract_raw_text_from_image(image_bytes):
+    return extract_ocr_result(image_bytes)["text"]
+
+def extract_ocr_result(image_bytes):
+    """النص الخام مع مربعات الكلمات {"text", "words"}، من الكاش إن وُجد"""
+    key = ocr_cache_key(image_bytes)
+    result = ocr_cache_get(key)
+    if result is None:
+        result = run_ocr(image_bytes)
+        ocr_cache_put(key, result)
+    return result
+
+def run_ocr(image_bytes):
+    processed = preprocess_image_for_ocr(image_bytes)
+    if processed is None:
+        return {"text": "", "words": []}
+    words = get_ocr_engine().image_to_words(processed, OCR_LANG, OCR_CONFIG)
+    return {"text": words_to_text(words), "words": words}
+
+def words_to_text(words):
+    """إعادة بناء النص سطراً سطراً من الكلمات (بترتيب Tesseract)"""
+    lines = []
+    current = None
+    for w in words:
+        line = tuple(w["line"])
+        if line != current:
+            lines.append([])
+            current = line
+        lines[-1].append(w["text"])
+    return "\n".join(" ".join(parts) for parts in lines)
+
+# ---------- كاش نتائج OCR ----------
+# ملف JSON لكل نتيجة، اسمه بصمة (بايتات الصورة + إعدادات المعالجة + إعدادات Tesseract)،
+# لذلك يبقى بعد إعادة التشغيل ويُشارك بين العمال. الحذف بالأقدم استخداماً (mtime) عند تجاوز الحجم.
+# كل عملية تتابع الحجم الكلي تقديرياً بعد أول مسح، فلا يُمسح المجلد (os.walk + stat لكل ملف)
+# إلا عند تجاوز الحد أو كل OCR_CACHE_RESCAN_PUTS إضافة.
+_cache_size = {"bytes": None, "puts": 0}
+_cache_size_lock = threading.Lock()
+
+def ocr_cache_key(image_bytes, mode="text"):
+    digest = hashlib.sha256(image_bytes)
+    settings = {"preprocess": PREPROCESS_PARAMS, "lang": OCR_LANG, "config": OCR_CONFIG, "mode": mode,
+                "engine": get_ocr_engine().name}
+    if mode == "table":
+        settings["cells"] = CELL_OCR
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def _ocr_cache_path(key):
+    return os.path.join(OCR_CACHE_DIR, key[:2], key + ".json")
+
+def ocr_cache_get(key):
+    path = _ocr_cache_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        os.utime(path)
+        return result
+    except (OSError, ValueError):
+        return None
+
+def ocr_cache_put(key, result):
+    path = _ocr_cache_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        _track_ocr_cache_put(size)
+    except OSError:
+        pass
+
+def _track_ocr_cache_put(delta):
+    """إضافة فرق الحجم للتقدير، والمسح الكامل مع الحذف فقط عند الحاجة"""
+    with _cache_size_lock:
+        _cache_size["puts"] += 1
+        if _cache_size["bytes"] is not None and _cache_size["puts"] < OCR_CACHE_RESCAN_PUTS:
+            _cache_size["bytes"] += delta
+            if _cache_size["bytes"] <= OCR_CACHE_MAX_BYTES:
+                return
+    evict_ocr_cache()
+
+def evict_ocr_cache(max_bytes=None):
+    """حذف الأقدم استخداماً حتى يصبح حجم الكاش ضمن الحد"""
+    max_bytes = OCR_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for root, _, files in os.walk(OCR_CACHE_DIR):
+        for name in files:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+    removed = 0
+    if total > max_bytes:
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            if total <= max_bytes:
+                break
+    with _cache_size_lock:
+        _cache_size["bytes"] = total
+        _cache_size["puts"] = 0
+    return removed
+
+# ---------- تقسيم الجدول إلى خلايا ----------
+# كشف خطوط الجدول الأفقية والرأسية بعمليات مورفولوجية، ثم قراءة كل خلية في أعمدة
+# النوع/الوزن/الوقت منفردة بإعدادات العمود، بدل قراءة الصفحة كاملة ثم فصل الأعمدة يدوياً.
+def _line_spans(profile, threshold, min_gap=3):
+    """تجميع المواقع المتتالية التي يتجاوز فيها الإسقاط الحد إلى خطوط (بداية، نهاية)"""
+    idx = np.flatnonzero(profile >= threshold)
+    if idx.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > min_gap)
+    starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+    ends = np.concatenate((idx[breaks], [idx[-1]]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def detect_table_grid(binary, min_cell=12):
+    """حدود الصفوف والأعمدة من صورة ثنائية (نص أسود على خلفية بيضاء).
+    تعيد (الصفوف، الأعمدة) كقوائم (بداية، نهاية) أو None إذا لم يُكتشف جدول"""
+    inv = cv2.bitwise_not(binary)
+    h, w = inv.shape
+    horizontal = cv2.morphologyEx(inv, cv2.MORPH_OPEN,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (max(w // 20, 10), 1)))
+    h_lines = _line_spans(horizontal.sum(axis=1) / 255, 0.3 * w)
+    if len(h_lines) < 2:
+        return None
+    table_h = h_lines[-1][1] - h_lines[0][0]
+    vertical = cv2.morphologyEx(inv, cv2.MORPH_OPEN,
+                                cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(table_h // 10, 10))))
+    v_lines = _line_spans(vertical.sum(axis=0) / 255, 0.5 * table_h)
+    if len(v_lines) < 2:
+        return None
+    rows = [(a[1] + 1, b[0]) for a, b in zip(h_lines, h_lines[1:]) if b[0] - a[1] > min_cell]
+    cols = [(a[1] + 1, b[0]) for a, b in zip(v_lines, v_lines[1:]) if b[0] - a[1] > min_cell]
+    if not rows or not cols:
+        return None
+    return rows, cols
+
+def _crop_cell(binary, row, col, margin=3, pad=10):
+    cell = binary[row[0] + margin:row[1] - margin, col[0] + margin:col[1] - margin]
+    return cv2.copyMakeBorder(cell, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=255)
+
+def _ocr_cell(cell, lang, config):
+    if cell.size == 0 or cv2.countNonZero(cv2.bitwise_not(cell)) == 0:
+        return ""
+    return get_ocr_engine().image_to_string(cell, lang, config).strip()
+
+def _classify_column(texts):
+    """تحديد دور العمود من عنوانه أو من محتوى عينة من خلاياه"""
+    joined = " ".join(texts)
+    for role, keywords in HEADER_KEYWORDS.items():
+        if any(k in joined for k in keywords):
+            return role
+    if re.search(r'\b\d{1,2}:\d{2}\b', joined):
+        return "time"
+    if re.search(r'\d', joined) and not re.search(r'[\u0600-\u06FF]', joined):
+        return "weight"
+    if re.search(r'[\u0600-\u06FFa-zA-Z]', joined):
+        return "type"
+    return None
+
+def extract_table_cells(image_bytes, max_threads=None):
+    """قراءة جدول السجلات خلية بخلية. تعيد قائمة صفوف {"type", "weight", "time"} (نصوص خام)
+    أو None إذا لم يُكتشف جدول (عندها يُستخدم extract_raw_text_from_image)"""
+    key = ocr_cache_key(image_bytes, mode="table")
+    cached = ocr_cache_get(key)
+    if cached is not None:
+        return cached["rows"]
+    binary = preprocess_image_for_ocr(image_bytes)
+    if binary is None:
+        return None
+    grid = detect_table_grid(binary)
+    if grid is None:
+        return None
+    rows, cols = grid
+    threads = max_threads or min(8, available_cpu_count() * 2)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        # عينة أول صفين بالإعدادات العامة لتحديد دور كل عمود وهل الصف الأول عناوين
+        sample = [[pool.submit(_ocr_cell, _crop_cell(binary, r, c), OCR_LANG, "--psm 7") for c in cols]
+                  for r in rows[:2]]
+        sample = [[f.result() for f in row] for row in sample]
+        roles = {}
+        for j in range(len(cols)):
+            role = _classify_column([row[j] for row in sample])
+            if role and role not in roles.values():
+                roles[j] = role
+        if "weight" not in roles.values():
+            return None
+        header_text = " ".join(sample[0])
+        first = 1 if any(k in header_text for ks in HEADER_KEYWORDS.values() for k in ks) else 0
+        futures = {
+            (i, role): pool.submit(_ocr_cell, _crop_cell(binary, rows[i], cols[j]), **CELL_OCR[role])
+            for i in range(first, len(rows))
+            for j, role in roles.items()
+        }
+        cells = {k: f.result() for k, f in futures.items()}
+    result = []
+    for i in range(first, len(rows)):
+        row = {role: cells.get((i, role), "") for role in CELL_OCR}
+        if any(row.values()):
+            result.append(row)
+    ocr_cache_put(key, {"rows": result})
+    return result
+
+def extract_table_cells_in_worker(image_bytes):
+    """extract_table_cells داخل عامل مجمع العمليات: المجمع يشغّل عاملاً لكل نواة،
+    فخيوط إضافية داخل كل عامل تتنافس على نفس الأنوية بدل أن تسرّع"""
+    return extract_table_cells(image_bytes, max_threads=1)
+
+# ---------- المعالجة المتوازية لعدة صور ----------
+# العمال عمليات مستقلة (Tesseract و OpenCV يعملان خارج الـ GIL لكن المعالجة المسبقة لا)،
+# لذلك يجب أن تكون الدوال المرسلة إليهم في وحدة قابلة للاستيراد وليست في سكربت Streamlit.
+def available_cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def create_ocr_pool(max_workers=None):
+    """مجمع عمليات لـ OCR. يُستخدم forkserver حيث يتوفر حتى لا تُنسخ خيوط خادم Streamlit
+    ولا يُعاد تنفيذ سكربت الواجهة داخل العمال"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers or available_cpu_count(), mp_context=context)
+
+def extract_texts_parallel(pool, images, on_done=None, func=extract_raw_text_from_image):
+    """تشغيل func (استخراج النص افتراضياً، أو extract_table_cells) على عدة صور على المجمع.
+    images: قائمة (الاسم، البايتات)؛ الاسم للعرض فقط وقد يتكرر. on_done(الاسم، عدد المنتهي، الإجمالي) بعد كل صورة.
+    تعيد قائمة النتائج بنفس ترتيب الإدخال؛ الصورة التي تفشل تعيد None.
+    إذا تعطل المجمع نفسه (BrokenProcessPool) يُرفع الخطأ ليعيد المستدعي إنشاءه"""
+    futures = {pool.submit(func, data): index for index, (_, data) in enumerate(images)}
+    results = [None] * len(images)
+    for done, future in enumerate(as_completed(futures), start=1):
+        index = futures[future]
+        try:
+            results[index] = future.result()
+        except BrokenProcessPool:
+            raise
+        except Exception:
+            results[index] = None
+        if on_done:
+            on_done(images[index][0], done, len(futures))
+    return results
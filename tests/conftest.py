@@ -0,0 +1,31 @@
+import logging
+import os
+import sys
+import warnings
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """app.py في مجلد مؤقت (المسارات في APP_CONFIG نسبية) مع كاش عملية نظيف"""
+    warnings.filterwarnings("ignore")
+    logging.getLogger("streamlit").setLevel(logging.CRITICAL)
+    import streamlit as st
+    import app as module
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    yield module
+    # العامل الخلفي يستخدم مسارات نسبية: ننتظره قبل مغادرة المجلد
+    module.get_snapshot_compactor().flush(timeout=60)
+    st.cache_resource.clear()
+
+@pytest.fixture
+def record(app):
+    def make(weight=250.0, date="2026-07-01", time="09:30:00", bale_type="قماش", supervisor="انسT.A"):
+        return {'التاريخ': date, 'الوقت': time, 'الوردية': app.get_shift_for_hour(int(time[:2])),
+                'المشرف': supervisor, 'نوع البالة': bale_type, 'وزن البالة': weight, 'ملاحظات': ""}
+    return make
@@ -0,0 +1,64 @@
+"""بديل محلي لواجهة contents في مستودع GitHub (get_contents/create_file/update_file)"""
+import hashlib
+import threading
+from types import SimpleNamespace
+
+class FakeGithubError(Exception):
+    def __init__(self, status, message=""):
+        super().__init__(f"{status} {message}")
+        self.status = status
+
+class FakeRepo:
+    def __init__(self):
+        self.files = {}
+        self.commits = []
+        self.fail = {}  # path -> عدد مرات الفشل المتبقية
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _sha(content):
+        return hashlib.sha1(content).hexdigest()
+
+    def put_remote(self, path, content):
+        """تعديل من نسخة أخرى من التطبيق"""
+        with self.lock:
+            self.files[path] = (content, self._sha(content))
+
+    def get_contents(self, path, ref=None):
+        with self.lock:
+            if path.endswith("/") or path in {p.rsplit("/", 1)[0] for p in self.files}:
+                prefix = path.rstrip("/") + "/"
+                return [SimpleNamespace(name=p[len(prefix):], path=p, sha=sha)
+                        for p, (_, sha) in sorted(self.files.items()) if p.startswith(prefix)]
+            if path not in self.files:
+                raise FakeGithubError(404, "Not Found")
+            content, sha = self.files[path]
+            return SimpleNamespace(path=path, sha=sha, decoded_content=content)
+
+    def get_git_blob(self, sha):
+        import base64
+        with self.lock:
+            for content, file_sha in self.files.values():
+                if file_sha == sha:
+                    return SimpleNamespace(content=base64.b64encode(content).decode())
+        raise FakeGithubError(404, "Not Found")
+
+    def _write(self, path, message, content, sha, branch):
+        if isinstance(content, str):
+            content = content.encode()
+        with self.lock:
+            if self.fail.get(path):
+                self.fail[path] -= 1
+                raise FakeGithubError(502, "Bad Gateway")
+            current = self.files.get(path)
+            if (current and current[1]) != sha:
+                raise FakeGithubError(409, "sha mismatch")
+            self.files[path] = (content, self._sha(content))
+            self.commits.append((path, message))
+            return {"content": SimpleNamespace(sha=self.files[path][1])}
+
+    def create_file(self, path, message, content, branch=None):
+        return self._write(path, message, content, None, branch)
+
+    def update_file(self, path, message, content, sha, branch=None):
+        return self._write(path, message, content, sha, branch)
@@ -0,0 +1,73 @@
+import os
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def records(app, record):
+    rows = []
+    for i in range(53):
+        rows.append(record(weight=None if i == 7 else float(150 + i * 3),
+                           date=f"2026-{6 + i % 3:02d}-{1 + i % 28:02d}", time=f"{8 + i % 12:02d}:15:00",
+                           bale_type=("قماش", "شعر", "ملح")[i % 3], supervisor="انسT.A"))
+    assert app.append_cotton_records(rows, "test")
+    return rows
+
+FILTERS = {"start": date(2026, 6, 1), "end": date(2026, 8, 31)}
+
+def read_export(fmt, path):
+    if fmt == "csv":
+        return pd.read_csv(path)
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    return pd.read_excel(path, sheet_name=None)
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "xlsx"])
+def test_row_count_across_chunks(app, records, tmp_path, fmt):
+    if fmt == "parquet" and not app.PARQUET_AVAILABLE:
+        pytest.skip("pyarrow غير مثبت")
+    path = str(tmp_path / f"out.{fmt}")
+    rows, summary = app.export_cotton_range(FILTERS, fmt, path, with_summary=True, chunk_rows=10)
+    assert rows == len(records)
+    exported = read_export(fmt, path)
+    if fmt == "xlsx":
+        assert list(exported) == ["السجلات", "ملخص شهري"]
+        assert len(exported["ملخص شهري"]) == len(summary)
+        exported = exported["السجلات"]
+    assert len(exported) == rows
+    assert list(exported.columns) == app.COTTON_COLUMNS
+
+def test_filters_limit_rows(app, records, tmp_path):
+    rows, _ = app.export_cotton_range(dict(FILTERS, bale_type=["شعر"], end=date(2026, 6, 30)),
+                                      "csv", str(tmp_path / "out.csv"), with_summary=False)
+    assert rows == sum(1 for r in records if r['نوع البالة'] == "شعر" and r['التاريخ'] < "2026-07")
+
+def test_summary_matches_statistics(app, records, tmp_path):
+    _, summary = app.export_cotton_range(FILTERS, "csv", str(tmp_path / "out.csv"), chunk_rows=4)
+    assert list(summary.columns) == app.EXPORT_SUMMARY_COLUMNS
+    by_type = summary.groupby('نوع البالة').agg({'عدد البالات': 'sum', 'إجمالي الوزن': 'sum',
+                                                 'أقل وزن': 'min', 'أكبر وزن': 'max'})
+    stats = app.generate_statistics(FILTERS["start"], FILTERS["end"]).set_index('نوع البالة')
+    pd.testing.assert_frame_equal(by_type.sort_index(), stats[by_type.columns].sort_index(),
+                                  check_dtype=False, check_names=False)
+
+def test_reader_keeps_file_for_another_download(app, tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_bytes(b"data")
+    read = app.export_file_reader(str(path))
+    assert read() == read() == b"data"
+    app.discard_export_file({"path": str(path)})
+    assert not path.exists()
+
+def test_sweep_removes_only_old_export_files(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app.tempfile, "tempdir", str(tmp_path))
+    old, new, other = (tmp_path / "luva_export_old.csv", tmp_path / "luva_export_new.csv", tmp_path / "other.csv")
+    for path in (old, new, other):
+        path.write_bytes(b"data")
+    stale = time.time() - 7 * 3600
+    os.utime(old, (stale, stale))
+    os.utime(other, (stale, stale))
+    assert app.sweep_export_files(max_age_hours=6) == 1
+    assert not old.exists() and new.exists() and other.exists()
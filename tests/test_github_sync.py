@@ -0,0 +1,66 @@
+import time
+
+from fake_github import FakeRepo
+
+def make_sync(app, repo, **kwargs):
+    options = dict(debounce_seconds=0.2, max_delay_seconds=2, retry_seconds=0.1, max_retry_seconds=0.4)
+    options.update(kwargs)
+    return app.GitHubSync(lambda: repo, "main", **options)
+
+def test_debounce_coalesces_saves_into_one_commit(app):
+    repo = FakeRepo()
+    sync = make_sync(app, repo)
+    sync.enqueue("data/2026-07.csv", b"v1", "save 1")
+    sync.enqueue("data/2026-07.csv", b"v2", "save 2")
+    sync.enqueue("data/2026-06.csv", b"june", "save 3")
+    time.sleep(0.05)
+    assert repo.commits == []  # still inside the debounce window
+    assert sync.flush(timeout=10)
+    assert repo.files["data/2026-07.csv"][0] == b"v2"
+    assert repo.files["data/2026-06.csv"][0] == b"june"
+    assert [path for path, _ in repo.commits].count("data/2026-07.csv") == 1
+    assert "(+1" in dict(repo.commits)["data/2026-07.csv"]
+
+def test_debounce_pushes_without_flush(app):
+    repo = FakeRepo()
+    sync = make_sync(app, repo)
+    sync.enqueue("a.csv", b"a", "m")
+    deadline = time.monotonic() + 5
+    while not repo.commits and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert repo.commits == [("a.csv", "m")]
+
+def test_failed_paths_are_requeued_and_retried(app):
+    repo = FakeRepo()
+    repo.fail["b.csv"] = 2
+    sync = make_sync(app, repo)
+    for name in ("a", "b", "c"):
+        sync.enqueue(f"{name}.csv", name.encode(), f"save {name}")
+    assert sync.flush(timeout=10)
+    assert {p: c for p, (c, _) in repo.files.items()} == {"a.csv": b"a", "b.csv": b"b", "c.csv": b"c"}
+    assert sync.last_error is None
+    assert sync.pending_count() == 0
+
+def test_newer_content_wins_over_requeued_batch(app):
+    repo = FakeRepo()
+    repo.fail["a.csv"] = 1
+    sync = make_sync(app, repo, retry_seconds=0.3)
+    sync.enqueue("a.csv", b"old", "first")
+    deadline = time.monotonic() + 5
+    while sync.last_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sync.last_error is not None
+    sync.enqueue("a.csv", b"new", "second")
+    assert sync.flush(timeout=10)
+    assert repo.files["a.csv"][0] == b"new"
+    assert len(repo.commits) == 1
+
+def test_backoff_grows_and_is_capped(app):
+    repo = FakeRepo()
+    repo.fail["a.csv"] = 100
+    sync = make_sync(app, repo, debounce_seconds=0, retry_seconds=0.05, max_retry_seconds=0.2)
+    sync.enqueue("a.csv", b"x", "m")
+    time.sleep(1.0)
+    assert 3 <= sync._failures < 20
+    assert sync._retry_at - time.monotonic() <= 0.2
+    assert sync.pending_count() == 1
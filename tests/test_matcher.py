@@ -0,0 +1,36 @@
+import pytest
+
+@pytest.fixture
+def matcher(app):
+    return app.BaleTypeMatcher(app.get_bale_types())
+
+def test_normalization(app):
+    assert app.normalize_arabic("أإآ ى ة") == app.normalize_arabic("ااا ي ه")
+    assert app.normalize_arabic("قُمَاش") == app.normalize_arabic("قمـاش") == "قماش"
+
+@pytest.mark.parametrize("text, expected", [
+    ("قماش", "قماش"),
+    ("القماش 250", "قماش"),
+    ("بلاستیك", "بلاستيك"),
+    ("تمشيط غير مغلف 300", "تمشيط غير مغلف"),
+    ("تمشيط مغلف", "تمشيط مغلف"),
+    ("برم انفاق", "برم انفاق"),
+    ("بلاستك", "بلاستيك"),
+    ("خام", "قطن خام"),
+])
+def test_matches(matcher, text, expected):
+    assert matcher.match(text) == expected
+
+@pytest.mark.parametrize("text", ["غير", "مغلف", "تمشيط", "غير مغلف", "حجر", "وزن 250"])
+def test_ambiguous_or_unknown_words_do_not_match(matcher, text):
+    assert matcher.match(text) is None
+
+def test_edit_distance_is_bounded(app):
+    assert app._bounded_edit_distance("بلاستيك", "بلاستك", 3) == 1
+    assert app._bounded_edit_distance("قماش", "تراب", 1) == 2
+    assert app._bounded_edit_distance("قماش", "قماش قطن خام", 2) == 3
+
+def test_cutoff_limits_fuzzy_matches(app):
+    strict = app.BaleTypeMatcher(app.get_bale_types(), cutoff=0.95)
+    assert strict.match("بلاستك") is None
+    assert strict.match("بلاستيك") == "بلاستيك"
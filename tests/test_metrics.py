@@ -0,0 +1,29 @@
+import json
+import os
+
+def test_phases_listed_in_start_order(app):
+    with app.rerun_trace():
+        with app.metric_phase("page"):
+            with app.metric_phase("page.load"):
+                pass
+            with app.metric_phase("page.render"):
+                with app.metric_phase("page.render.table"):
+                    pass
+        with app.metric_phase("sidebar"):
+            pass
+    phases = app._metrics_registry()["reruns"][-1]["phases"]
+    assert [(name, depth) for name, depth, _ in phases] == [
+        ("page", 0), ("page.load", 1), ("page.render", 1), ("page.render.table", 2), ("sidebar", 0)]
+    assert phases[0][2] >= phases[1][2] + phases[2][2] - 1e-6
+
+def test_metrics_jsonl_is_rotated(app, monkeypatch):
+    monkeypatch.setitem(app.APP_CONFIG, "METRICS_JSONL_MAX_BYTES", 1)
+    path = app.APP_CONFIG["METRICS_JSONL_FILE"]
+    app.export_metrics()
+    app.export_metrics()
+    app.export_metrics()
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    with open(path + ".1", encoding="utf-8") as f:
+        assert "timers" in json.loads(f.readline())
+    assert not os.path.exists(path + ".2")
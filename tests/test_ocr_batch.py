@@ -0,0 +1,78 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import ocr_pipeline
+
+class FakePool:
+    """مجمع متزامن: كل صورة "نصها" هو البايتات نفسها، ولا جداول؛ broken=True يحاكي عاملاً مات"""
+
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.calls = []
+
+    def submit(self, func, data):
+        self.calls.append((func.__name__, data))
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("worker died"))
+        elif func is ocr_pipeline.extract_table_cells_in_worker:
+            future.set_result([])
+        else:
+            future.set_result(data.decode())
+        return future
+
+class Upload:
+    def __init__(self, name, text):
+        self.name = name
+        self._data = text.encode()
+
+    def getvalue(self):
+        return self._data
+
+def test_parallel_results_follow_input_order_with_duplicate_names():
+    images = [("IMG_0001.jpg", b"first"), ("IMG_0001.jpg", b"second"), ("other.jpg", b"third")]
+    seen = []
+    results = ocr_pipeline.extract_texts_parallel(FakePool(), images, lambda name, done, total: seen.append(name),
+                                                  func=ocr_pipeline.extract_raw_text_from_image)
+    assert results == ["first", "second", "third"]
+    assert sorted(seen) == sorted(name for name, _ in images)
+
+def test_parallel_raises_when_pool_is_broken():
+    with pytest.raises(BrokenProcessPool):
+        ocr_pipeline.extract_texts_parallel(FakePool(broken=True), [("a.jpg", b"x")])
+
+@pytest.mark.parametrize("use_cells", [False, True])
+def test_duplicate_filenames_keep_every_image(app, monkeypatch, use_cells):
+    pool = FakePool()
+    monkeypatch.setattr(app, "get_ocr_pool", lambda: pool)
+    uploads = [Upload("IMG_0001.jpg", "قماش 250 08:30"), Upload("IMG_0001.jpg", "قماش 310 09:45")]
+    combined, rows = app.extract_texts_from_images(uploads, use_cells=use_cells)
+    assert combined.count("# IMG_0001.jpg") == 2
+    assert "250" in combined and "310" in combined
+    assert sorted(rows.frame()['وزن البالة']) == [250.0, 310.0]
+
+def test_broken_pool_is_rebuilt(app, monkeypatch):
+    pools = [FakePool(broken=True), FakePool()]
+    created = []
+
+    def create_ocr_pool():
+        created.append(pools[len(created)])
+        return created[-1]
+
+    monkeypatch.setattr(ocr_pipeline, "create_ocr_pool", create_ocr_pool)
+    combined, rows = app.extract_texts_from_images([Upload("a.jpg", "قماش 250 08:30")])
+    assert len(created) == 2
+    assert "250" in combined
+    assert app.get_ocr_pool() is pools[1]
+
+def test_table_cells_use_one_thread_per_worker(app, monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(app, "get_ocr_pool", lambda: pool)
+    app.extract_texts_from_images([Upload("a.jpg", "قماش 250 08:30")], use_cells=True)
+    assert pool.calls[0] == ("extract_table_cells_in_worker", "قماش 250 08:30".encode())
+    calls = []
+    monkeypatch.setattr(ocr_pipeline, "extract_table_cells", lambda data, max_threads=None: calls.append(max_threads))
+    ocr_pipeline.extract_table_cells_in_worker(b"x")
+    assert calls == [1]
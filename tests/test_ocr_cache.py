@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+import ocr_pipeline
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_pipeline, "OCR_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(ocr_pipeline, "_cache_size", {"bytes": None, "puts": 0})
+    walks = []
+    real_walk = os.walk
+    monkeypatch.setattr(ocr_pipeline.os, "walk", lambda top: walks.append(top) or real_walk(top))
+    return walks
+
+def cache_bytes():
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(ocr_pipeline.OCR_CACHE_DIR) for name in files)
+
+def put(index):
+    ocr_pipeline.ocr_cache_put(f"{index:064x}", {"text": "x" * 100, "words": []})
+
+def test_puts_under_the_limit_scan_once(cache, monkeypatch):
+    monkeypatch.setattr(ocr_pipeline, "OCR_CACHE_MAX_BYTES", 10 ** 6)
+    for i in range(50):
+        put(i)
+    assert len(cache) == 1
+    assert ocr_pipeline._cache_size["bytes"] == cache_bytes()
+
+def test_overwrite_does_not_grow_the_estimate(cache, monkeypatch):
+    monkeypatch.setattr(ocr_pipeline, "OCR_CACHE_MAX_BYTES", 10 ** 6)
+    for _ in range(5):
+        put(1)
+    assert ocr_pipeline._cache_size["bytes"] == cache_bytes()
+
+def test_eviction_keeps_cache_within_limit(cache, monkeypatch):
+    put(0)
+    entry = cache_bytes()
+    monkeypatch.setattr(ocr_pipeline, "OCR_CACHE_MAX_BYTES", entry * 10)
+    for i in range(1, 40):
+        put(i)
+    assert cache_bytes() <= entry * 10
+    assert ocr_pipeline.ocr_cache_get(f"{39:064x}") is not None
+    assert len(cache) < 40
+
+def test_periodic_rescan_sees_other_writers(cache, monkeypatch):
+    monkeypatch.setattr(ocr_pipeline, "OCR_CACHE_MAX_BYTES", 10 ** 6)
+    monkeypatch.setattr(ocr_pipeline, "OCR_CACHE_RESCAN_PUTS", 5)
+    put(0)
+    # ملف كتبته عملية أخرى لا يعرفه التقدير المحلي حتى المسح التالي
+    other = os.path.join(ocr_pipeline.OCR_CACHE_DIR, "ff", "f" * 64 + ".json")
+    os.makedirs(os.path.dirname(other), exist_ok=True)
+    with open(other, "w") as f:
+        f.write("{}" * 1000)
+    for i in range(1, 6):
+        put(i)
+    assert len(cache) == 2
+    assert ocr_pipeline._cache_size["bytes"] == cache_bytes()
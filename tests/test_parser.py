@@ -0,0 +1,47 @@
+import numpy as np
+
+TEXT = """# IMG_0001.jpg
+1 قماش 250.5 08:30
+2 ملح 310 kg 14:05:09
+
+بلاستيك 420 25:61
+بدون وزن هنا
+كرد 180
+"""
+
+def test_lines_are_parsed_and_rejected(app):
+    rows = app.ParsedRows().add_text(TEXT)
+    frame = rows.frame()
+    assert frame['نوع البالة'].tolist() == ["قماش", "ملح", "كرد"]
+    assert frame['وزن البالة'].tolist() == [250.5, 310.0, 180.0]
+    assert [t.strftime("%H:%M:%S") for t in frame['الوقت'][:2]] == ["08:30:00", "14:05:09"]
+    assert [(line, reason) for line, reason, _ in rows.rejected] == [
+        (5, "وقت غير صحيح"), (6, "لا يوجد وزن بين 0.5 و 5000")]
+
+def test_chunks_keep_line_numbers(app):
+    categories = []
+    chunks = list(app.iter_parsed_chunks(TEXT.encode("utf-8"), categories, chunk_size=2))
+    assert [len(c["line"]) for c in chunks] == [2, 1]
+    assert np.concatenate([c["line"] for c in chunks]).tolist() == [2, 3, 7]
+    assert sum(len(c["rejected"]) for c in chunks) == 2
+    assert chunks[-1]["last_line"] == 7
+
+def test_text_added_later_continues_numbering(app):
+    rows = app.ParsedRows().add_text("قماش 250 08:30\n").add_text("ملح 25:99 300\n")
+    assert rows.lines_read == 2
+    assert rows.rejected == [(2, "وقت غير صحيح", "ملح 25:99 300")]
+
+def test_pages_are_saved_in_one_transaction(app):
+    rows = app.ParsedRows().add_text("".join(f"قماش {200 + i} 08:{i:02d}\n" for i in range(7)))
+    saved, rejected = app.ingest_cotton_batch(app.iter_extracted_pages(rows, {}, 3))
+    assert saved == 7 and rejected.empty
+    assert len(app.load_cotton_data()) == 7
+
+def test_rejected_page_saves_nothing(app):
+    rows = app.ParsedRows().add_text("".join(f"قماش {200 + i} 08:{i:02d}\n" for i in range(7)))
+    edits = {1: app.extracted_page_frame(rows, 1, 3).assign(**{'وزن البالة': [250.0, 0.0, 260.0]})}
+    saved, rejected = app.ingest_cotton_batch(app.iter_extracted_pages(rows, edits, 3))
+    assert saved == 0
+    assert rejected.index.tolist() == [4]
+    assert rejected['السبب'].tolist() == ["وزن غير صحيح"]
+    assert app.load_cotton_data().empty
@@ -0,0 +1,61 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def records(app, record):
+    rows = [record(weight=None if i % 11 == 0 else float(180 + i * 7 % 90), date=f"2026-07-0{1 + i % 4}",
+                   bale_type=("قماش", "ملح", "برم")[i % 3], supervisor=("انسT.A", "عبدالحميدT.B")[i % 2])
+            for i in range(40)]
+    assert app.append_cotton_records(rows, "test")
+    return rows
+
+def rollup(conn):
+    return pd.read_sql_query("SELECT * FROM cotton_rollup ORDER BY date, shift, supervisor, bale_type", conn)
+
+def assert_rollup_matches_records(app):
+    with app.cotton_db() as conn:
+        incremental = rollup(conn)
+        app.rebuild_rollup(conn)
+        pd.testing.assert_frame_equal(incremental, rollup(conn))
+
+def test_appends_update_rollup(app, records, record):
+    app.append_cotton_records([record(weight=999.0, date="2026-07-02"), record(weight=1.0, date="2026-07-09")])
+    assert_rollup_matches_records(app)
+
+def test_edit_refreshes_old_and_new_groups(app, records):
+    with app.cotton_db() as conn:
+        rows = conn.execute(f"SELECT id, {', '.join(app.DB_COLUMNS.values())} FROM cotton_records "
+                            "WHERE weight IS NOT NULL ORDER BY weight DESC LIMIT 2").fetchall()
+        # الأثقل ينتقل إلى نوع وتاريخ آخرين، والثاني يصبح أخف سجل في مجموعته
+        moved = ("2026-07-09",) + rows[0][2:5] + ("كرد", 300.0, "")
+        lighter = rows[1][1:6] + (1.0, "")
+        app._update_rows(conn, [rows[0][0], rows[1][0]], [moved, lighter])
+    assert_rollup_matches_records(app)
+
+def test_delete_refreshes_group(app, records):
+    with app.cotton_db() as conn:
+        record_id, *row = conn.execute(f"SELECT id, {', '.join(app.DB_COLUMNS.values())} FROM cotton_records "
+                                       "WHERE weight IS NOT NULL LIMIT 1").fetchone()
+        group = (row[0], row[2], row[3], row[4])
+        ids = [i for (i,) in conn.execute(
+            "SELECT id FROM cotton_records WHERE date = ? AND shift = ? AND supervisor = ? AND bale_type = ?", group)]
+        conn.execute("DELETE FROM cotton_records WHERE id = ?", (record_id,))
+        app._refresh_rollup_groups(conn, {group})
+    assert_rollup_matches_records(app)
+    with app.cotton_db() as conn:
+        conn.execute(f"DELETE FROM cotton_records WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        app._refresh_rollup_groups(conn, {group})
+        assert conn.execute("SELECT COUNT(*) FROM cotton_rollup WHERE date = ? AND shift = ? AND supervisor = ? "
+                            "AND bale_type = ?", group).fetchone()[0] == 0
+
+def test_statistics_match_records(app, records):
+    stats = app.generate_statistics(date(2026, 7, 2), date(2026, 7, 3)).set_index('نوع البالة')
+    df = pd.DataFrame(records)
+    df = df[df['التاريخ'].between("2026-07-02", "2026-07-03") & df['وزن البالة'].notna()]
+    expected = df.groupby('نوع البالة')['وزن البالة'].agg(['count', 'sum', 'mean', 'min', 'max']).round(2)
+    expected.columns = ['عدد البالات', 'إجمالي الوزن', 'متوسط الوزن', 'أقل وزن', 'أكبر وزن']
+    pd.testing.assert_frame_equal(stats[expected.columns], expected, check_dtype=False, check_names=False)
+    assert stats.index.is_monotonic_increasing
+    assert app.generate_statistics(date(2026, 8, 1), date(2026, 8, 31)).empty
@@ -0,0 +1,40 @@
+import io
+from datetime import date
+
+import pandas as pd
+
+def test_full_save_keeps_times_and_order(app, record):
+    times = ["13:27:04", "09:30:00", "10:00:00"]
+    assert app.append_cotton_records([record(time=t) for t in times], "test")
+    assert app.save_cotton_data(app.load_cotton_data(), "test")
+
+    with app.cotton_db() as conn:
+        stored = [t for (t,) in conn.execute("SELECT time FROM cotton_records ORDER BY date, time")]
+        shard = pd.read_csv(io.BytesIO(app.build_shard_csv(conn, "2026-07")), encoding="utf-8-sig")
+    assert stored == sorted(times)
+    assert sorted(shard['الوقت']) == sorted(times)
+
+    page, _ = app.query_cotton_page({"start": date(2026, 7, 1), "end": date(2026, 7, 1)}, "الأقدم أولاً")
+    editor = app.history_editor_frame(page)
+    assert editor['الوقت'].notna().all()
+    reloaded = app.load_cotton_data()
+    assert app.format_cotton_times(reloaded['الوقت']).tolist() == sorted(times)
+
+def stored_keys(app):
+    with app.cotton_db() as conn:
+        return conn.execute("SELECT uid, updated_at, weight FROM cotton_records ORDER BY date, time").fetchall()
+
+def test_full_save_keeps_record_keys(app, record):
+    assert app.append_cotton_records([record(weight=w, time=f"{8 + i:02d}:00:00")
+                                      for i, w in enumerate([250.3, 260.0, 270.0])], "test")
+    before = stored_keys(app)
+    assert app.save_cotton_data(app.load_cotton_data(), "test")
+    assert stored_keys(app) == before
+
+    df = app.load_cotton_data()
+    df.loc[df.index[1], 'وزن البالة'] = 999.0
+    assert app.save_cotton_data(df, "test")
+    after = stored_keys(app)
+    assert [k[0] for k in after] == [k[0] for k in before]
+    assert after[0] == before[0] and after[2] == before[2]
+    assert after[1][2] == 999.0 and after[1][1] > before[1][1]
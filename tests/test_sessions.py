@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+def test_second_admin_login_keeps_the_first(app):
+    first, error = app.start_session("admin", enforce_limit=False)
+    assert error is None
+    second, error = app.start_session("admin", enforce_limit=False)
+    assert error is None and second != first
+    assert app.remaining_time(first) is not None
+    assert app.remaining_time(second) is not None
+    assert app.count_active_sessions() == 1
+
+def test_logout_ends_only_that_browser(app):
+    first, _ = app.start_session("admin", enforce_limit=False)
+    second, _ = app.start_session("admin", enforce_limit=False)
+    app.end_session(first)
+    assert app.remaining_time(first) is None
+    assert app.remaining_time(second) is not None
+
+def test_other_users_still_limited_to_one_session(app):
+    token, error = app.start_session("Fathy")
+    assert token and error is None
+    again, error = app.start_session("Fathy")
+    assert again is None and error
+
+def test_active_user_limit(app, monkeypatch):
+    monkeypatch.setattr(app, "MAX_ACTIVE_USERS", 2)
+    assert app.start_session("Fathy")[0]
+    assert app.start_session("Ans")[0]
+    assert app.start_session("Ahmed") == (None, "الحد الأقصى للمستخدمين المتصلين")
+
+def test_expired_session(app):
+    token, _ = app.start_session("Fathy")
+    with sqlite3.connect(app.APP_CONFIG["DB_FILE"]) as conn:
+        conn.execute("UPDATE user_sessions SET login_time = ?",
+                     (time.time() - app.SESSION_DURATION.total_seconds() - 1,))
+    assert app.remaining_time(token) is None
+    assert app.start_session("Fathy")[0]
+
+def test_old_table_is_migrated(app):
+    with sqlite3.connect(app.APP_CONFIG["DB_FILE"]) as conn:
+        conn.execute("CREATE TABLE user_sessions (username TEXT PRIMARY KEY, login_time REAL NOT NULL)")
+        conn.execute("INSERT INTO user_sessions VALUES ('Fathy', ?)", (time.time(),))
+    assert app.count_active_sessions() == 1
+    assert app.start_session("Fathy")[1] == "هذا المستخدم مسجل دخول بالفعل"
+    assert app.start_session("admin", enforce_limit=False)[0]
@@ -0,0 +1,131 @@
+import io
+
+import pandas as pd
+import pytest
+
+from fake_github import FakeRepo
+
+MONTH = "2026-07"
+PATH = f"data/{MONTH}.csv"
+
+@pytest.fixture
+def github(app, monkeypatch):
+    repo = FakeRepo()
+    sync = app.GitHubSync(lambda: repo, "main", debounce_seconds=0, max_delay_seconds=0,
+                          retry_seconds=0.05, on_pushed=app._record_pushed_shard, merge=app.merge_remote_shard)
+    monkeypatch.setattr(app, "get_github_sync", lambda: sync)
+    return repo, sync
+
+def remote_shard(app, rows):
+    """جزء شهري كما ترفعه نسخة أخرى من التطبيق"""
+    df = pd.DataFrame(rows).reindex(columns=app.COTTON_COLUMNS + app.SHARD_KEY_COLUMNS)
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+def shard_uids(repo):
+    df = pd.read_csv(io.BytesIO(repo.files[PATH][0]), encoding="utf-8-sig", dtype=str)
+    return sorted(df["uid"])
+
+def local_uids(app):
+    with app.cotton_db() as conn:
+        return sorted(r[0] for r in conn.execute("SELECT uid FROM cotton_records"))
+
+def other_instance_row(record, uid, weight=400.0, stamp=1.0):
+    return dict(record(weight=weight, time="11:00:00"), uid=uid, updated_at=stamp)
+
+def test_push_conflict_merges_instead_of_overwriting(app, record, github):
+    repo, sync = github
+    app.append_cotton_records([record(weight=100.0)], "a1")
+    assert sync.flush(timeout=10)
+    first = shard_uids(repo)
+
+    # نسخة أخرى تضيف سجلاً في نفس الشهر بعد رفعنا (SHA المحفوظ لدينا صار قديماً)
+    theirs = other_instance_row(record, "b" * 32)
+    repo.put_remote(PATH, remote_shard(app, [dict(record(weight=100.0), uid=first[0], updated_at=1.0), theirs]))
+
+    app.append_cotton_records([record(weight=200.0)], "a2")
+    assert sync.flush(timeout=10)
+    assert sync.last_error is None
+    pushed = shard_uids(repo)
+    assert len(pushed) == 3 and "b" * 32 in pushed
+    assert local_uids(app) == pushed
+
+def test_first_push_merges_existing_remote_month(app, record, github):
+    repo, sync = github
+    repo.put_remote(PATH, remote_shard(app, [other_instance_row(record, "c" * 32)]))
+    app.append_cotton_records([record()], "a1")
+    assert sync.flush(timeout=10)
+    assert len(shard_uids(repo)) == 2
+    assert "c" * 32 in local_uids(app)
+
+def test_pull_keeps_unpushed_local_rows_and_pushes_them(app, record, github, monkeypatch):
+    repo, sync = github
+    # سجل محلي فشل رفعه (لا مزامن وقت الحفظ)
+    monkeypatch.setattr(app, "get_github_sync", lambda: None)
+    app.append_cotton_records([record(weight=150.0)], "offline")
+    monkeypatch.setattr(app, "get_github_sync", lambda: sync)
+    repo.put_remote(PATH, remote_shard(app, [other_instance_row(record, "d" * 32)]))
+
+    assert app.pull_cotton_shards() == 1
+    assert len(local_uids(app)) == 2
+    assert sync.flush(timeout=10)
+    assert shard_uids(repo) == local_uids(app)
+
+def test_newest_edit_wins_and_rollup_follows(app, record, github):
+    repo, sync = github
+    app.append_cotton_records([record(weight=100.0)], "a1")
+    assert sync.flush(timeout=10)
+    uid = local_uids(app)[0]
+    edited = dict(record(weight=999.0), uid=uid, updated_at=4102444800.0)  # 2100-01-01
+    repo.put_remote(PATH, remote_shard(app, [edited]))
+
+    app.pull_cotton_shards()
+    with app.cotton_db() as conn:
+        assert conn.execute("SELECT weight FROM cotton_records").fetchall() == [(999.0,)]
+        assert conn.execute("SELECT count, total, max_weight FROM cotton_rollup").fetchall() == [(1, 999.0, 999.0)]
+
+def test_older_remote_edit_does_not_override_local(app, record, github):
+    repo, sync = github
+    app.append_cotton_records([record(weight=100.0)], "a1")
+    uid = local_uids(app)[0]
+    repo.put_remote(PATH, remote_shard(app, [dict(record(weight=5.0), uid=uid, updated_at=1.0)]))
+    app.pull_cotton_shards()
+    with app.cotton_db() as conn:
+        assert conn.execute("SELECT weight FROM cotton_records").fetchall() == [(100.0,)]
+    assert sync.flush(timeout=10)
+    assert pd.read_csv(io.BytesIO(repo.files[PATH][0]), encoding="utf-8-sig")["وزن البالة"].tolist() == [100.0]
+
+def test_legacy_shard_without_keys_matches_excel_rows(app, record, github):
+    repo, sync = github
+    rows = [record(weight=100.0), record(weight=100.0), record(weight=300.0)]
+    with app.cotton_db() as conn:
+        app._insert_records(conn, rows)
+    legacy = pd.DataFrame(rows)[app.COTTON_COLUMNS].to_csv(index=False).encode("utf-8-sig")
+    repo.put_remote(PATH, legacy)
+    app.pull_cotton_shards()
+    assert len(local_uids(app)) == 3
+
+def test_initial_shard_sync_failure_is_not_cached(app, monkeypatch):
+    calls = []
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("offline")
+        return 0
+    monkeypatch.setattr(app, "pull_cotton_shards", flaky)
+    with pytest.raises(ConnectionError):
+        app.initial_shard_sync()
+    assert app.initial_shard_sync() == 0
+    assert app.initial_shard_sync() == 0
+    assert len(calls) == 2
+
+def test_existing_database_gets_record_keys(app, record):
+    import sqlite3
+    conn = sqlite3.connect(app.APP_CONFIG["DB_FILE"])
+    conn.execute("CREATE TABLE cotton_records (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, time TEXT, "
+                 "shift TEXT, supervisor TEXT, bale_type TEXT, weight REAL, notes TEXT)")
+    conn.executemany("INSERT INTO cotton_records (date, time, shift, supervisor, bale_type, weight, notes) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", [("2026-07-01", "09:00:00", "الاولي", "x", "قماش", 10.0, "")] * 2)
+    conn.commit()
+    conn.close()
+    uids = local_uids(app)
+    assert len(set(uids)) == 2 and all(uids)
@@ -0,0 +1,66 @@
+import threading
+
+def test_append_does_not_export_on_request_thread(app, record, monkeypatch):
+    monkeypatch.setitem(app.APP_CONFIG, "SNAPSHOT_EVERY_RECORDS", 1)
+    threads = []
+    write = app.write_cotton_snapshot
+    monkeypatch.setattr(app, "write_cotton_snapshot",
+                        lambda: (threads.append(threading.current_thread().name), write())[1])
+
+    assert app.append_cotton_records([record()], "test")
+    assert threading.current_thread().name not in threads
+    assert app.get_snapshot_compactor().flush(timeout=60)
+    assert threads == ["snapshot-compactor"]
+
+    import pandas as pd
+    assert len(pd.read_excel(app.APP_CONFIG["LOCAL_FILE"])) == 1
+
+def test_compaction_waits_for_threshold(app, record, monkeypatch):
+    monkeypatch.setitem(app.APP_CONFIG, "SNAPSHOT_EVERY_RECORDS", 3)
+    monkeypatch.setitem(app.APP_CONFIG, "SNAPSHOT_INTERVAL_MINUTES", 60)
+    with app.cotton_db() as conn:
+        app._mark_snapshot(conn)
+    app.append_cotton_records([record(), record()], "test")
+    app.get_snapshot_compactor().flush(timeout=60)
+    assert app.get_snapshot_compactor().last_run is None
+
+    app.append_cotton_records([record()], "test")
+    app.get_snapshot_compactor().flush(timeout=60)
+    assert app.get_snapshot_compactor().last_run is not None
+
+def test_compactor_records_errors(app):
+    def fail(message, force):
+        raise OSError("disk full")
+    compactor = app.SnapshotCompactor(fail)
+    compactor.request("x")
+    assert compactor.flush(timeout=10)
+    assert "disk full" in compactor.last_error
+
+def test_forced_compaction_after_full_rewrite(app, record):
+    assert app.append_cotton_records([record(weight=w) for w in (100.0, 200.0, 300.0)], "test")
+    app.get_snapshot_compactor().flush(timeout=60)
+    app.write_cotton_snapshot()
+
+    import pandas as pd
+    # إفراغ السجل: لا سجلات بعد آخر تصدير، لكن force يجب أن يعيد الكتابة
+    assert app.save_cotton_data(pd.DataFrame(columns=app.COTTON_COLUMNS), "rewrite")
+    assert app.get_snapshot_compactor().flush(timeout=60)
+    assert pd.read_excel(app.APP_CONFIG["LOCAL_FILE"]).empty
+
+def test_rows_appended_during_export_stay_pending(app, record, monkeypatch):
+    assert app.append_cotton_records([record()], "test")
+    app.get_snapshot_compactor().flush(timeout=60)
+    read = app.read_cotton_records
+
+    def read_then_append(conn, after_id=0):
+        df = read(conn, after_id)
+        with app.cotton_db() as other:
+            app._insert_rows(other, [tuple(app._to_db_value(c, v) for c, v in record(weight=5.0).items())])
+        return df
+
+    monkeypatch.setattr(app, "read_cotton_records", read_then_append)
+    app.write_cotton_snapshot()
+    monkeypatch.setattr(app, "read_cotton_records", read)
+    with app.cotton_db() as conn:
+        last_id = int(app.get_meta(conn, "snapshot_rowid"))
+        assert conn.execute("SELECT COUNT(*) FROM cotton_records WHERE id > ?", (last_id,)).fetchone()[0] == 1
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+def test_save_invalidates_directory(app, monkeypatch):
+    monkeypatch.setitem(app.APP_CONFIG, "USERS_RELOAD_CHECK_SECONDS", 3600)
+    users = app.load_users()
+    assert app.get_user_entry("Fathy") is None
+    users["Fathy"] = {"password": "1", "role": "viewer", "permissions": {"all_sections": False},
+                      "sections_permissions": {}}
+    assert app.save_users(users)
+    assert app.get_user_entry("Fathy")["role"] == "viewer"
+
+def test_file_change_is_picked_up_after_check_interval(app, monkeypatch):
+    monkeypatch.setitem(app.APP_CONFIG, "USERS_RELOAD_CHECK_SECONDS", 0)
+    users = app.load_users()
+    users["user2"]["role"] = "admin"
+    with open(app.USERS_FILE, "w", encoding="utf-8") as f:
+        json.dump(users, f, ensure_ascii=False)
+    assert app.get_user_entry("user2")["is_admin"]
+
+def test_returned_users_are_isolated(app):
+    users = app.load_users()
+    users["admin"]["role"] = "viewer"
+    users["admin"]["permissions"]["all_sections"] = False
+    assert app.get_users_directory()[0]["admin"]["role"] == "admin"
+    assert app.load_users()["admin"]["permissions"]["all_sections"] is True
+
+    entry = app.get_user_entry("admin")
+    with pytest.raises(TypeError):
+        entry["role"] = "viewer"
+    with pytest.raises(TypeError):
+        entry["permissions"]["all_sections"] = False
+    with pytest.raises(TypeError):
+        app.get_users_directory()[1]["intruder"] = entry
+
+def test_save_replaces_file_atomically(app, monkeypatch):
+    users = app.load_users()
+    with open(app.USERS_FILE, "rb") as f:
+        before = f.read()
+    replaced = []
+    real_replace, real_dump = os.replace, json.dump
+    monkeypatch.setattr(app.os, "replace", lambda src, dst: (replaced.append((src, dst)), real_replace(src, dst)))
+
+    def broken_dump(obj, f, **kwargs):
+        f.write('{"admin": ')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(app.json, "dump", broken_dump)
+    assert not app.save_users(users)
+    assert not replaced
+    with open(app.USERS_FILE, "rb") as f:
+        assert f.read() == before
+
+    monkeypatch.setattr(app.json, "dump", real_dump)
+    assert app.save_users(users)
+    assert replaced == [(app.USERS_FILE + ".tmp", app.USERS_FILE)]
+    assert not os.path.exists(app.USERS_FILE + ".tmp")
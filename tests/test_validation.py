@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+def batch(app, **overrides):
+    row = {'التاريخ': "2026-07-01", 'الوقت': "14:05", 'الوردية': "", 'المشرف': "انسT.A",
+           'نوع البالة': "قماش", 'وزن البالة': "250.5", 'ملاحظات': None}
+    row.update(overrides)
+    return pd.DataFrame([row])
+
+def test_valid_row_is_normalized(app):
+    valid, rejected = app.normalize_cotton_batch(batch(app, **{'نوع البالة': "  قماش ", 'المشرف': " انسT.A"}))
+    assert rejected.empty
+    row = valid.iloc[0]
+    assert row['التاريخ'] == pd.Timestamp("2026-07-01")
+    assert row['الوقت'] == "14:05:00"
+    assert row['الوردية'] == app.get_shift_for_hour(14)
+    assert row['المشرف'] == "انسT.A"
+    assert row['نوع البالة'] == "قماش"
+    assert row['وزن البالة'] == 250.5
+    assert row['ملاحظات'] == ""
+
+@pytest.mark.parametrize("column, value, reason", [
+    ('وزن البالة', 0, "وزن غير صحيح"),
+    ('وزن البالة', "abc", "وزن غير صحيح"),
+    ('التاريخ', "not a date", "تاريخ غير صحيح"),
+    ('الوقت', "25:61", "وقت غير صحيح"),
+    ('نوع البالة', None, "نوع البالة مفقود"),
+    ('نوع البالة', "غير محدد", "نوع البالة غير معروف"),
+    ('نوع البالة', "حجر", "نوع البالة غير معروف"),
+    ('المشرف', None, "المشرف مفقود"),
+    ('المشرف', float("nan"), "المشرف مفقود"),
+    ('المشرف', "  ", "المشرف مفقود"),
+])
+def test_invalid_rows_are_rejected_with_reason(app, column, value, reason):
+    valid, rejected = app.normalize_cotton_batch(batch(app, **{column: value}))
+    assert valid.empty
+    assert rejected['السبب'].tolist() == [reason]
+
+def test_mixed_batch_keeps_valid_rows(app):
+    df = pd.concat([batch(app), batch(app, **{'نوع البالة': "غير محدد"}), batch(app, **{'وزن البالة': 310})],
+                   ignore_index=True)
+    valid, rejected = app.normalize_cotton_batch(df)
+    assert valid['وزن البالة'].tolist() == [250.5, 310.0]
+    assert rejected.index.tolist() == [1]
+
+def test_ingest_saves_nothing_when_a_row_is_rejected(app):
+    df = pd.concat([batch(app), batch(app, **{'المشرف': None})], ignore_index=True)
+    saved, rejected = app.ingest_cotton_batch(df)
+    assert saved == 0 and len(rejected) == 1
+    assert app.load_cotton_data().empty